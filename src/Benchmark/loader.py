@@ -0,0 +1,105 @@
+"""
+Benchmark bộ đọc dữ liệu: so sánh cách đọc cũ (từng dòng + vòng lặp đôi np.linalg.norm)
+với bộ đọc vector hóa trong Graph.creat_from_file.
+
+Chạy từ thư mục src:
+    python -m Benchmark.loader [--repeat 3] [folder ...]
+"""
+import argparse
+import os
+import time
+
+import numpy as np
+
+from Simulator.Graph import Graph
+
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_FOLDERS = [os.path.join(project_root, 'data', name) for name in ('pdp_100', 'pdp_200', 'pdp_400')]
+
+
+def legacy_creat_from_file(file_path):
+    """
+    Bộ đọc gốc (trước khi vector hóa), giữ lại để làm mốc so sánh.
+    Các nút được trả về dưới dạng tuple (id, x, y, demand, ready_time, due_time, service_time, pid, did)
+    và các yêu cầu dưới dạng tuple (id, pick_up_id, delivery_id).
+    """
+    node_list = []
+    with open(file_path, 'rt') as f:
+        count = 1
+        for line in f:
+            if count == 1:
+                vehicle_num, vehicle_capacity, vehicle_speed = line.split()
+                vehicle_num = int(vehicle_num)
+                vehicle_capacity = int(vehicle_capacity)
+            else:
+                node_list.append(line.split())
+            count += 1
+    num_nodes = len(node_list)
+    nodes = list((int(item[0]), float(item[1]), float(item[2]), float(item[3]), float(item[4]), float(item[5]), float(item[6]), int(item[7]), int(item[8])) for item in node_list)
+
+    dist = np.zeros((num_nodes, num_nodes))
+    num_request = 0
+    request_list = [(0,0,0)]
+    node_request_id = [0] * num_nodes
+    for i in range(num_nodes):
+        if nodes[i][3] > 0:
+            num_request += 1
+            node_request_id[i] = num_request
+            node_request_id[nodes[i][8]] = num_request
+            request_list.append((num_request,nodes[i][0],nodes[i][8]))
+        node_a = nodes[i]
+        dist[i][i] = 1e-8
+        for j in range(i+1, num_nodes):
+            node_b = nodes[j]
+            dist[i][j] = np.linalg.norm((node_a[1] - node_b[1], node_a[2] - node_b[2]))
+            if (dist[i][j] < 1e-8):
+                dist[i][j] = 1e-8
+            dist[j][i] = dist[i][j]
+
+    return num_nodes, nodes, dist, vehicle_num, vehicle_capacity, num_request, request_list, node_request_id
+
+
+def best_time(func, file_path, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(file_path)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def check_same(old, new):
+    """Kiểm tra hai kết quả đọc file giống hệt nhau."""
+    assert old[0] == new[0] and old[3:6] == new[3:6] and old[7] == new[7]
+    assert np.array_equal(old[2], new[2])
+    for a, b in zip(old[1], new[1]):
+        assert a == (b.id, b.x, b.y, b.demand, b.ready_time, b.due_time, b.service_time, b.pid, b.did)
+    for a, b in zip(old[6], new[6]):
+        assert a == (b.id, b.pick_up_id, b.delivery_id)
+
+
+def run(folders, repeat):
+    graph = Graph.__new__(Graph)
+    print(f"{'folder':<10}{'files':>6}{'legacy (s)':>14}{'vectorized (s)':>16}{'speedup':>10}")
+    for folder in folders:
+        files = sorted(name for name in os.listdir(folder) if name.endswith('.txt'))
+        legacy_total = 0.0
+        vectorized_total = 0.0
+        for name in files:
+            file_path = os.path.join(folder, name)
+            legacy_time, old = best_time(legacy_creat_from_file, file_path, repeat)
+            vectorized_time, new = best_time(graph.creat_from_file, file_path, repeat)
+            check_same(old, new)
+            legacy_total += legacy_time
+            vectorized_total += vectorized_time
+        print(f"{os.path.basename(folder):<10}{len(files):>6}{legacy_total:>14.3f}{vectorized_total:>16.3f}"
+              f"{legacy_total / vectorized_total:>9.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark bộ đọc dữ liệu Graph")
+    parser.add_argument('folders', nargs='*', default=DEFAULT_FOLDERS)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    run(args.folders, args.repeat)
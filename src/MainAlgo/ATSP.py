@@ -3,8 +3,16 @@ from Simulator.Solution import Solution
 import random
 from Simulator.CostCalculationEvent import CostCalculator, CostCalculationEvent
 from Simulator.Vehicle import Vehicle
+from Simulator.VehicleCostTable import VehicleCostTable
+from Simulator.SegmentSummary import SegmentSummary
+from Simulator.Tree import Tree
 
 class ATSP(object):
+    # Số con tối đa để tìm thứ tự tối ưu chính xác (exact_child_order), nhiều hơn thì dùng regret-2
+    EXACT_ORDER_LIMIT = 10
+    # Số thứ tự hoàn chỉnh tối thiểu để tính chi phí cùng lúc bằng graph.route_batch thay cho Tree.route_cost
+    BATCH_ORDER_MIN = 8
+
     def __init__(self, graph: Graph):
         self.graph = graph
         self.evaluation_count = 0
@@ -14,13 +22,220 @@ class ATSP(object):
         """Implementation của CostListener interface"""
         self.evaluation_count += 1
         
+    def _depart_time(self, travel_path, node_id):
+        """Thời điểm rời nút node_id trên lộ trình travel_path (0 nếu là depot đầu lộ trình)."""
+        graph = self.graph
+        travel_time = graph.travel_time_rows
+        ready_time = graph.ready_time_list
+        service_time = graph.service_time_list
+        current_time = 0
+        current_ind = travel_path[0]
+        if current_ind == node_id:
+            return current_time
+        for next_ind in travel_path[1:]:
+            arrival_time = current_time + travel_time[current_ind][next_ind]
+            current_time = max(arrival_time, ready_time[next_ind]) + service_time[next_ind]
+            if next_ind == node_id:
+                break
+            current_ind = next_ind
+        return current_time
+
+    def exact_child_order(self, tree, node, travel_path, max_orders=None):
+        """
+        Thứ tự con tốt nhất của node, tìm chính xác bằng quy hoạch động kiểu Held-Karp.
+
+        Mỗi cây con được thay bằng tóm tắt đoạn lộ trình của nó (nút đầu, nút cuối, thời gian,
+        hàm thời gian trễ theo thời điểm đến). Mọi cây con có tải ròng 0 nên đều được đi vào với
+        cùng một tải, chi phí năng lượng chỉ phụ thuộc cạnh nối giữa các đoạn. Trạng thái là (tập
+        con đã đi, con cuối cùng) với các nhãn Pareto (thời điểm rời, chi phí): phần lộ trình phía
+        sau chỉ phụ thuộc thời điểm rời và không giảm theo nó, nên nhãn bị trội có thể bỏ. Các nhãn
+        đi hết mọi con được tính chi phí đầy đủ của xe bằng Tree.route_cost, hoặc cùng lúc bằng
+        graph.route_batch khi có nhiều thứ tự.
+
+        Args:
+            travel_path: Lộ trình hiện tại của xe chứa node
+            max_orders: Số thứ tự hoàn chỉnh khác thứ tự hiện tại được tính chi phí tối đa (None: tất cả)
+
+        Returns:
+            tuple: (Thứ tự con tốt nhất (có thể chính là thứ tự hiện tại), số thứ tự khác thứ tự hiện tại
+                đã được tính chi phí)
+        """
+        graph = self.graph
+        dist = graph.dist_rows
+        travel_time = graph.travel_time_rows
+        p1, p2 = graph.p1, graph.p2
+        children = list(node.children)
+        num_children = len(children)
+        summaries = [tree.subtree_summary(child) for child in children]
+
+        # Điểm xuất phát (pickup của node) và tải khi đi vào các cây con không phụ thuộc thứ tự con
+        start_ind = graph.pick_up_id_list[node.label]
+        start_time = self._depart_time(travel_path, start_ind)
+        coef = graph.load_energy_coef[tree.child_entry_load(node)]
+        segment_energy = [p1 * (coef * summary.dist + graph.energy_coef1 * summary.load_dist) for summary in summaries]
+
+        # labels[mask][last]: các nhãn Pareto (thời điểm rời, chi phí, con cuối, nhãn trước)
+        labels = [[[] for _ in range(num_children)] for _ in range(1 << num_children)]
+        start_label = (start_time, 0, None, None)
+        for mask in range(1 << num_children):
+            for last in range(num_children) if mask else (None,):
+                if mask:
+                    state_labels = labels[mask][last]
+                    if not state_labels:
+                        continue
+                    prev_ind = summaries[last].last
+                else:
+                    state_labels = [start_label]
+                    prev_ind = start_ind
+                for label in state_labels:
+                    current_time, cost = label[0], label[1]
+                    for j in range(num_children):
+                        if mask >> j & 1:
+                            continue
+                        summary = summaries[j]
+                        arrival_time = current_time + travel_time[prev_ind][summary.first]
+                        new_cost = (cost + p1 * coef * dist[prev_ind][summary.first] + segment_energy[j]
+                                    + p2 * summary.lateness(arrival_time))
+                        new_time = summary.depart_time(arrival_time)
+                        target = labels[mask | 1 << j][j]
+                        if any(t <= new_time and c <= new_cost for t, c, _, _ in target):
+                            continue
+                        target[:] = [other for other in target if not (new_time <= other[0] and new_cost <= other[1])]
+                        target.append((new_time, new_cost, j, label))
+
+        orders = [list(range(num_children))]
+        for state_labels in labels[(1 << num_children) - 1]:
+            for label in state_labels:
+                order = []
+                while label[2] is not None:
+                    order.append(label[2])
+                    label = label[3]
+                order.reverse()
+                orders.append(order)
+        if max_orders is not None:
+            orders = orders[:1 + max_orders]
+
+        # Chi phí đầy đủ của xe cho thứ tự hiện tại (đứng đầu, giữ lại khi không có thứ tự nào tốt hơn
+        # hẳn) và các thứ tự hoàn chỉnh
+        if len(orders) >= ATSP.BATCH_ORDER_MIN:
+            # Dựng lộ trình của từng thứ tự từ các đoạn của cây con và tính cùng lúc bằng graph.route_batch
+            start = 0 if node.label == 0 else travel_path.index(start_ind)
+            segments = [Tree.subtree_travel_path(graph, child) for child in children]
+            end = start + 1 + sum(len(segment) for segment in segments)
+            prefix, suffix = travel_path[:start + 1], travel_path[end:]
+            candidate_paths = [prefix + [node_id for j in order for node_id in segments[j]] + suffix
+                               for order in orders]
+            costs = graph.route_batch.costs(candidate_paths).tolist()
+        else:
+            depot = tree.vehicle_depots[tree.vehicle_index(node)]
+            expand = tree.path_to_root(node)
+            costs = []
+            for order in orders:
+                node.children = [children[j] for j in order]
+                cost = tree.route_cost(depot, expand)
+                costs.append(float('inf') if cost is None else cost)
+            node.children = children
+        best = min(range(len(orders)), key=costs.__getitem__)
+        return [children[j] for j in orders[best]], len(orders) - 1
+
+    def regret_child_order(self, tree, node, travel_path):
+        """
+        Thứ tự con của node dựng bằng chèn regret-2: mỗi bước chèn con có hiệu chi phí giữa vị trí
+        tốt nhì và tốt nhất lớn nhất (bằng nhau thì chọn con có chi phí sau khi chèn nhỏ hơn).
+
+        Chi phí chèn được tính cục bộ: phần lộ trình trước pickup của node cố định (chỉ cần thời
+        điểm rời), với mỗi vị trí trong tour đang dựng lưu trạng thái (thời điểm rời, chi phí) sau
+        phần đầu tour và tóm tắt của phần cuối tour nối với phần lộ trình sau delivery của node.
+        Một lần chèn chỉ ghép tóm tắt của cây con được chèn vào giữa hai phần đó.
+
+        Args:
+            travel_path: Lộ trình hiện tại của xe chứa node
+
+        Returns:
+            list: Chỉ số các con theo thứ tự mới
+        """
+        graph = self.graph
+        dist = graph.dist_rows
+        travel_time = graph.travel_time_rows
+        p1, p2 = graph.p1, graph.p2
+        energy_coef1 = graph.energy_coef1
+        children = node.children
+        summaries = [tree.subtree_summary(child) for child in children]
+
+        start_ind = graph.pick_up_id_list[node.label]
+        start_time = self._depart_time(travel_path, start_ind)
+        coef = graph.load_energy_coef[tree.child_entry_load(node)]
+        # Phần lộ trình từ delivery của node đến hết (delivery của depot là nút cuối lộ trình)
+        delivery_ind = graph.delivery_id_list[node.label]
+        closing_index = len(travel_path) - 1 - travel_path[::-1].index(delivery_ind)
+        closing = SegmentSummary.of_path(graph, travel_path[closing_index:])
+
+        def visit(state, summary):
+            # Trạng thái (nút cuối, thời điểm rời, chi phí) sau khi đi tiếp đoạn summary
+            prev_ind, current_time, cost = state
+            arrival_time = current_time + travel_time[prev_ind][summary.first]
+            cost += (p1 * (coef * (dist[prev_ind][summary.first] + summary.dist) + energy_coef1 * summary.load_dist)
+                     + p2 * summary.lateness(arrival_time))
+            return summary.last, summary.depart_time(arrival_time), cost
+
+        tour_indices = []
+        unvisited = set(range(len(children)))
+        while unvisited:
+            # prefix_states[pos]: trạng thái sau tour_indices[:pos], suffixes[pos]: tour_indices[pos:] + closing
+            prefix_states = [(start_ind, start_time, 0)]
+            for idx in tour_indices:
+                prefix_states.append(visit(prefix_states[-1], summaries[idx]))
+            suffixes = [closing]
+            for idx in reversed(tour_indices):
+                suffixes.append(SegmentSummary.chain(graph, [summaries[idx], suffixes[-1]]))
+            suffixes.reverse()
+
+            best_regret = -float('inf')
+            best_node_idx = None
+            best_pos = -1
+            best_cost_after_insertion = float('inf')
+
+            # Đánh giá mỗi nút chưa được thăm
+            for node_idx in unvisited:
+                # Chi phí khi chèn node_idx vào mỗi vị trí trong tour, sắp xếp tăng dần
+                insertion_costs = sorted(
+                    ((pos, visit(visit(prefix_states[pos], summaries[node_idx]), suffixes[pos])[2])
+                     for pos in range(len(tour_indices) + 1)), key=lambda x: x[1])
+
+                # Tính regret-2
+                if len(insertion_costs) >= 2:
+                    regret = insertion_costs[1][1] - insertion_costs[0][1]
+                    if (regret > best_regret or
+                            (regret == best_regret and insertion_costs[0][1] < best_cost_after_insertion)):
+                        best_regret = regret
+                        best_node_idx = node_idx
+                        best_pos = insertion_costs[0][0]
+                        best_cost_after_insertion = insertion_costs[0][1]
+                elif best_node_idx is None or insertion_costs[0][1] < best_cost_after_insertion:
+                    best_regret = float('inf')
+                    best_node_idx = node_idx
+                    best_pos = insertion_costs[0][0]
+                    best_cost_after_insertion = insertion_costs[0][1]
+
+            # Thêm nút tốt nhất vào tour
+            tour_indices.insert(best_pos, best_node_idx)
+            unvisited.remove(best_node_idx)
+        return tour_indices
+
     def run(self, tree, evaluation_limit):
         """
         Tối ưu hóa thứ tự các nút con cho mỗi nút trong cây.
         Phiên bản tối ưu hóa, tránh sử dụng deepcopy.
+
+        Mỗi nút dùng một lần đánh giá cho chi phí hiện tại và một lần cho thứ tự mới nếu có. Với
+        exact_child_order, mỗi thứ tự hoàn chỉnh khác thứ tự hiện tại được tính chi phí cũng được
+        ghi nhận là một lần đánh giá (qua CostCalculator.report với chi phí hiện tại), và số thứ tự
+        được tính bị giới hạn bởi ngân sách còn lại. Khi ngân sách còn lại không lớn hơn số con,
+        quy hoạch động không được chạy mà dùng regret-2.
         
         Args:
             tree: Cây cần tối ưu hóa
+            evaluation_limit: Số lần đánh giá tối đa
             
         Returns:
             Tree: Cây đã được tối ưu hóa
@@ -36,6 +251,9 @@ class ATSP(object):
         improved = False
         self.evaluation_count = 0
         
+        # Chi phí từng xe; thứ tự con được đánh giá bằng cách ghép tóm tắt các cây con
+        cost_table = VehicleCostTable(tree)
+        
         for node in nodes_with_children:
             child_subtrees = node.children
             num_children = len(child_subtrees)
@@ -44,148 +262,47 @@ class ATSP(object):
                 continue
                 
             # Lưu lại chi phí hiện tại
-            original_solution = Solution.tree_to_tours(tree)
-            original_cost = CostCalculator.calculate(self.graph, original_solution.vehicle_list)
+            original_cost = cost_table.evaluate_current()
+            
+            # Đổi thứ tự con chỉ ảnh hưởng đến xe chứa node, các nút cần duyệt lại là node và tổ tiên
+            vehicle = (cost_table.vehicle_of(node),)
+            expand = tree.path_to_root(node)
             
             # Lưu lại thứ tự ban đầu của các con
             original_order = list(node.children)
             
-            if num_children <= 7:
-                # Sử dụng duyệt hoán vị cho trường hợp số lượng con <= 7
-                import itertools
-                
-                best_cost = original_cost
-                best_order = original_order
-                
-                # Tạo các hoán vị và xáo trộn để tăng tính ngẫu nhiên
-                permutations = list(itertools.permutations(range(num_children)))
-                random.shuffle(permutations)
+            # Giữ lại một lần đánh giá cho thứ tự được chọn
+            remaining = evaluation_limit - self.evaluation_count - 1
+            if num_children <= ATSP.EXACT_ORDER_LIMIT and remaining >= num_children:
+                # Thứ tự tối ưu chính xác bằng quy hoạch động trên các tập con
+                best_order, num_orders = self.exact_child_order(tree, node, cost_table.travel_paths[vehicle[0]],
+                                                                max_orders=remaining)
+                if num_orders > 0:
+                    CostCalculator.report(self.graph, cost_table.vehicle_list, original_cost, num_orders)
                 
-                for perm in permutations:
-                    # Tạo thứ tự mới
-                    new_order = [child_subtrees[i] for i in perm]
-                    
-                    # Lưu lại thứ tự hiện tại
-                    temp_order = node.children
-                    
-                    # Áp dụng thứ tự mới
-                    node.children = new_order
-                    
-                    # Kiểm tra chi phí
-                    solution = Solution.tree_to_tours(tree)
-                    if Solution.is_sol_feasible(self.graph, solution.vehicle_list):
-                        cost = CostCalculator.calculate(self.graph, solution.vehicle_list)
-                        
-                        if cost < best_cost:
-                            best_cost = cost
-                            best_order = list(new_order)  # Tạo bản sao để lưu lại
-                    
-                    # Khôi phục lại thứ tự ban đầu cho node.children
-                    node.children = temp_order
-                    if self.evaluation_count >= evaluation_limit:
-                        break
-                
-                # Nếu tìm thấy cải thiện, áp dụng thứ tự tốt nhất
-                if best_cost < original_cost:
+                # Nếu tìm thấy thứ tự khác tốt hơn, đánh giá và áp dụng
+                if best_order != original_order:
                     node.children = best_order
-                    print(f"ATSP cải thiện chi phí từ {original_cost:.2f} xuống {best_cost:.2f} cho nút có {num_children} con")
+                    cost = cost_table.evaluate_tree(vehicle, expand)
+                    if cost is not None and cost < original_cost:
+                        cost_table.commit(node)
+                        print(f"ATSP cải thiện chi phí từ {original_cost:.2f} xuống {cost:.2f} cho nút có {num_children} con")
+                    else:
+                        node.children = original_order
                     
             else:
-                tour_indices = []
-                unvisited = set(range(num_children))
+                # Thuật toán regret-2, đánh giá chèn cục bộ trên lộ trình của xe
+                tour_indices = self.regret_child_order(tree, node, cost_table.travel_paths[vehicle[0]])
                 
-                depot = node
-                while (depot.label != 0):
-                    depot = depot.parent
-                # Thuật toán regret-2
-                while unvisited:
-                    best_regret = -float('inf')
-                    best_node_idx = None
-                    best_pos = -1
-                    best_cost_after_insertion = float('inf')
-                    
-                    # Đánh giá mỗi nút chưa được thăm
-                    for node_idx in unvisited:
-                        # Tính chi phí khi chèn node_idx vào mỗi vị trí trong tour
-                        insertion_costs = []
-                        
-                        for pos in range(len(tour_indices) + 1):
-                            # Tạo tour mới với node_idx được chèn vào vị trí pos
-                            new_tour_indices = tour_indices.copy()
-                            new_tour_indices.insert(pos, node_idx)
-                            
-                            # Tạo thứ tự mới dựa trên tour mới
-                            new_order = [child_subtrees[idx] for idx in new_tour_indices]
-                            
-                            # Lưu thứ tự hiện tại
-                            temp_order = node.children
-                            
-                            # Áp dụng thứ tự mới
-                            node.children = new_order
-                            
-                            # Kiểm tra chi phí
-                            travel_path = Solution.subtree_to_travel_path(self.graph, depot)
-                            cost = Vehicle.cal_total_all_cost(self.graph, travel_path)
-                            insertion_costs.append((pos, cost))
-                            
-                            # Khôi phục thứ tự ban đầu
-                            node.children = temp_order
-                        
-                        # Nếu không có vị trí khả thi, bỏ qua nút này
-                        if not insertion_costs:
-                            continue
-                        
-                        # Sắp xếp theo chi phí tăng dần
-                        insertion_costs.sort(key=lambda x: x[1])
-                        
-                        # Tính regret-2
-                        if len(insertion_costs) >= 2:
-                            regret = insertion_costs[1][1] - insertion_costs[0][1]
-                            
-                            if (regret > best_regret or 
-                                (regret == best_regret and insertion_costs[0][1] < best_cost_after_insertion)):
-                                best_regret = regret
-                                best_node_idx = node_idx
-                                best_pos = insertion_costs[0][0]
-                                best_cost_after_insertion = insertion_costs[0][1]
-                        elif len(insertion_costs) == 1:
-                            if best_node_idx is None or insertion_costs[0][1] < best_cost_after_insertion:
-                                best_regret = float('inf')
-                                best_node_idx = node_idx
-                                best_pos = insertion_costs[0][0]
-                                best_cost_after_insertion = insertion_costs[0][1]
-                    
-                    if best_node_idx is None:
-                        # Không tìm thấy nút nào có thể thêm vào
-                        break
-                    
-                    # Thêm nút tốt nhất vào tour
-                    tour_indices.insert(best_pos, best_node_idx)
-                    unvisited.remove(best_node_idx)
-                
-                # Kiểm tra xem tất cả các nút đã được thêm vào tour chưa
-                if len(tour_indices) == num_children:
-                    # Tạo thứ tự mới dựa trên tour_indices
-                    new_order = [child_subtrees[idx] for idx in tour_indices]
-                    
-                    # Kiểm tra chi phí của thứ tự mới
-                    node.children = new_order
-                    
-                    solution = Solution.tree_to_tours(tree)
-                    if Solution.is_sol_feasible(self.graph, solution.vehicle_list):
-                        cost = CostCalculator.calculate(self.graph, solution.vehicle_list)
-                        
-                        if cost < original_cost:
-                            # Đã tìm thấy cải thiện
-                            print(f"ATSP cải thiện chi phí từ {original_cost:.2f} xuống {cost:.2f} cho nút có {num_children} con")
-                        else:
-                            # Khôi phục thứ tự ban đầu nếu không cải thiện
-                            node.children = original_order
-                    else:
-                        # Khôi phục thứ tự ban đầu nếu không khả thi
-                        node.children = original_order
+                # Tạo thứ tự mới dựa trên tour_indices và kiểm tra chi phí
+                node.children = [child_subtrees[idx] for idx in tour_indices]
+                cost = cost_table.evaluate_tree(vehicle, expand)
+                if cost is not None and cost < original_cost:
+                    # Đã tìm thấy cải thiện
+                    cost_table.commit(node)
+                    print(f"ATSP cải thiện chi phí từ {original_cost:.2f} xuống {cost:.2f} cho nút có {num_children} con")
                 else:
-                    # Không tìm được tour hoàn chỉnh, giữ nguyên thứ tự ban đầu
+                    # Khôi phục thứ tự ban đầu nếu không cải thiện hoặc không khả thi
                     node.children = original_order
                     
             if self.evaluation_count >= evaluation_limit:
@@ -6,7 +6,10 @@ import copy
 from Simulator.Vehicle import Vehicle
 from Simulator.Tree import Tree
 from Simulator.TreeNode import TreeNode
+from Simulator.RouteState import RouteState
+from Simulator.SharedGraph import SharedGraph, SharedGraphHandle
 from sklearn.cluster import KMeans
+from multiprocessing import Pool
 
 class Initialize(object):
     def __init__(self, graph: Graph, pop_size: int):
@@ -26,49 +29,24 @@ class Initialize(object):
 
         # Create list of all requests and shuffle randomly
         all_requests = list(range(1, self.graph.num_request + 1))
-        all_requests.sort(key=lambda x: self.graph.nodes[self.graph.requests[x].pick_up_id].ready_time)
+        all_requests.sort(key=lambda x: self.graph.ready_time_list[self.graph.pick_up_id_list[x]])
+        route_states = [RouteState(self.graph, vehicle.travel_path) for vehicle in init_solution.vehicle_list]
 
         # Process each request in shuffled order
         for request_id in all_requests:
-            pickup_node = self.graph.requests[request_id].pick_up_id
-            delivery_node = self.graph.requests[request_id].delivery_id
+            pickup_node = self.graph.pick_up_id_list[request_id]
+            delivery_node = self.graph.delivery_id_list[request_id]
             
-            best_cost_increase = float('inf')
-            best_vehicle = None
-            best_pickup_pos = -1
-            best_delivery_pos = -1
-            
-            # Try to insert in each vehicle
-            for vehicle_idx, vehicle in enumerate(init_solution.vehicle_list):
-                current_route = vehicle.travel_path
-                
-                # Try all possible pickup positions (after depot, before delivery)
-                for pickup_pos in range(1, len(current_route)):
-                    # Try all possible delivery positions (after pickup position)
-                    for delivery_pos in range(pickup_pos + 1, len(current_route) + 1):
-                        # Create new route with inserted nodes
-                        new_route = current_route.copy()
-                        new_route.insert(pickup_pos, pickup_node)
-                        new_route.insert(delivery_pos, delivery_node)
-                        
-                        # Check feasibility
-                        if Solution.is_travel_path_feasible(self.graph, new_route):
-                            # Calculate cost increase
-                            old_cost = Vehicle.cal_total_all_cost(self.graph, current_route)
-                            new_cost = Vehicle.cal_total_all_cost(self.graph, new_route)
-                            cost_increase = new_cost - old_cost
-                            
-                            if cost_increase < best_cost_increase:
-                                best_cost_increase = cost_increase
-                                best_vehicle = vehicle_idx
-                                best_pickup_pos = pickup_pos
-                                best_delivery_pos = delivery_pos
+            # Tìm vị trí chèn rẻ nhất trên tất cả các xe bằng trạng thái lộ trình
+            best_vehicle, best_pickup_pos, best_delivery_pos, best_cost_increase = \
+                RouteState.cheapest_insertion(route_states, pickup_node, delivery_node)
             
             # Insert at best found position
             if best_vehicle is not None:
                 vehicle = init_solution.vehicle_list[best_vehicle]
                 vehicle.travel_path.insert(best_pickup_pos, pickup_node)
                 vehicle.travel_path.insert(best_delivery_pos, delivery_node)
+                route_states[best_vehicle] = RouteState(self.graph, vehicle.travel_path)
                 
         tree = Solution.tours_to_tree(init_solution)
         return tree
@@ -82,57 +60,43 @@ class Initialize(object):
         # Create list of all requests and shuffle randomly
         all_requests = list(range(1, self.graph.num_request + 1))
         random.shuffle(all_requests)
+        route_states = [RouteState(self.graph, vehicle.travel_path) for vehicle in init_solution.vehicle_list]
 
         # Process each request in shuffled order
         for request_id in all_requests:
-            pickup_node = self.graph.requests[request_id].pick_up_id
-            delivery_node = self.graph.requests[request_id].delivery_id
+            pickup_node = self.graph.pick_up_id_list[request_id]
+            delivery_node = self.graph.delivery_id_list[request_id]
             
-            best_cost_increase = float('inf')
-            best_vehicle = None
-            best_pickup_pos = -1
-            best_delivery_pos = -1
-            
-            # Try to insert in each vehicle
-            for vehicle_idx, vehicle in enumerate(init_solution.vehicle_list):
-                current_route = vehicle.travel_path
-                
-                # Try all possible pickup positions (after depot, before delivery)
-                for pickup_pos in range(1, len(current_route)):
-                    # Try all possible delivery positions (after pickup position)
-                    for delivery_pos in range(pickup_pos + 1, len(current_route) + 1):
-                        # Create new route with inserted nodes
-                        new_route = current_route.copy()
-                        new_route.insert(pickup_pos, pickup_node)
-                        new_route.insert(delivery_pos, delivery_node)
-                        
-                        # Check feasibility
-                        if Solution.is_travel_path_feasible(self.graph, new_route):
-                            # Calculate cost increase
-                            old_cost = Vehicle.cal_total_all_cost(self.graph, current_route)
-                            new_cost = Vehicle.cal_total_all_cost(self.graph, new_route)
-                            cost_increase = new_cost - old_cost
-                            
-                            if cost_increase < best_cost_increase:
-                                best_cost_increase = cost_increase
-                                best_vehicle = vehicle_idx
-                                best_pickup_pos = pickup_pos
-                                best_delivery_pos = delivery_pos
+            # Tìm vị trí chèn rẻ nhất trên tất cả các xe bằng trạng thái lộ trình
+            best_vehicle, best_pickup_pos, best_delivery_pos, best_cost_increase = \
+                RouteState.cheapest_insertion(route_states, pickup_node, delivery_node)
             
             # Insert at best found position
             if best_vehicle is not None:
                 vehicle = init_solution.vehicle_list[best_vehicle]
                 vehicle.travel_path.insert(best_pickup_pos, pickup_node)
                 vehicle.travel_path.insert(best_delivery_pos, delivery_node)
+                route_states[best_vehicle] = RouteState(self.graph, vehicle.travel_path)
                 
         tree = Solution.tours_to_tree(init_solution)
         return tree
     
-    def initialize_population(self, scenario):
-        """Khởi tạo quần thể theo kịch bản"""
+    def initialize_population(self, scenario, processes=None, seed=None):
+        """
+        Khởi tạo quần thể theo kịch bản
+
+        Args:
+            scenario: Tỷ lệ số cây tạo bởi method1 và method2
+            processes: Số tiến trình song song. None hoặc 1 để chạy tuần tự như cũ
+            seed: Seed gốc để sinh seed riêng cho từng cây khi chạy song song.
+                None thì lấy từ bộ sinh số ngẫu nhiên hiện tại (random.seed vẫn tái lập được)
+        """
         count_method1 = int(self.pop_size * scenario['method1'])
         count_method2 = int(self.pop_size * scenario['method2']) 
         
+        if processes is not None and processes > 1:
+            return self._initialize_population_parallel(count_method1, count_method2, processes, seed)
+        
         # Khởi tạo bằng phương pháp 1
         for i in range(count_method1):
             tree = self.init_solution1()
@@ -148,3 +112,58 @@ class Initialize(object):
                 print(f"Đã thêm giải pháp từ method2 #{len(self.forest)}")
                 
         return self.forest
+
+    def _initialize_population_parallel(self, count_method1, count_method2, processes, seed):
+        """
+        Tạo các cây trên một process pool. Graph được đưa vào bộ nhớ dùng chung một lần,
+        mỗi cây được tạo với seed riêng nên kết quả chỉ phụ thuộc vào seed, không phụ thuộc
+        vào số tiến trình hay thứ tự hoàn thành. Các worker trả về lộ trình dạng nén và cây
+        được dựng lại ở tiến trình chính.
+        """
+        seed_generator = random.Random(seed) if seed is not None else random
+        methods = [1] * count_method1 + [2] * count_method2
+        seeds = [seed_generator.randrange(2 ** 32) for _ in methods]
+
+        with SharedGraph(self.graph) as handle:
+            with Pool(processes=min(processes, max(len(methods), 1))) as pool:
+                packed_trees = pool.starmap(Initialize._build_packed_tree,
+                                            [(handle, method, tree_seed) for method, tree_seed in zip(methods, seeds)])
+
+        for method, packed in zip(methods, packed_trees):
+            tree = Initialize.unpack_tree(self.graph, packed)
+            self.forest.append(tree)
+            print(f"Đã thêm giải pháp từ method{method} #{len(self.forest)}")
+
+        return self.forest
+
+    @staticmethod
+    def _build_packed_tree(handle: SharedGraphHandle, method, seed):
+        """Chạy trong worker: tạo một cây với seed cho trước và trả về dạng nén."""
+        graph = SharedGraph.attach(handle)
+        random.seed(seed)
+        np.random.seed(seed)
+        initializer = Initialize(graph, 1)
+        tree = initializer.init_solution1() if method == 1 else initializer.init_solution2()
+        return Initialize.pack_tree(tree)
+
+    @staticmethod
+    def pack_tree(tree: Tree) -> bytes:
+        """
+        Nén cây thành các lộ trình nối tiếp nhau (int32). Mỗi lộ trình bắt đầu và kết thúc
+        bằng depot 0, các nút bên trong luôn khác 0 nên có thể tách lại mà không cần độ dài.
+        """
+        tours = Solution.tree_to_tours(tree)
+        return np.array([node for vehicle in tours.vehicle_list for node in vehicle.travel_path],
+                        dtype=np.int32).tobytes()
+
+    @staticmethod
+    def unpack_tree(graph: Graph, packed: bytes) -> Tree:
+        """Dựng lại Tree từ dạng nén của pack_tree."""
+        nodes = np.frombuffer(packed, dtype=np.int32).tolist()
+        solution = Solution(graph)
+        start = 0
+        for vehicle in solution.vehicle_list:
+            end = nodes.index(0, start + 1)
+            vehicle.travel_path = nodes[start:end + 1]
+            start = end + 1
+        return Solution.tours_to_tree(solution)
@@ -1,19 +1,76 @@
+from typing import Optional
 from Simulator.Graph import Graph
 from Simulator.Solution import Solution
 import random
 from Simulator.CostCalculationEvent import CostCalculator, CostCalculationEvent
+from Simulator.VehicleCostTable import VehicleCostTable
 
 class LocalSearch(object):
-    def __init__(self, graph: Graph):
+    def __init__(self, graph: Graph, candidate_size: Optional[int] = 10):
+        """
+        Args:
+            candidate_size: Số yêu cầu gần nhất trong danh sách ứng viên của mỗi yêu cầu, dùng cho
+                lân cận hạt (granular neighborhood) của các phép relocate. None để luôn xét toàn bộ lân cận
+        """
         self.graph = graph
         self.evaluation_count = 0
         self.evaluation_limit = 0
+        self.cost_table = None
+        # Hàng đợi các yêu cầu còn active của từng phép toán (don't-look bits), tạo lại trong mỗi lần run
+        self.active_requests = None
+        self.candidate_size = candidate_size
+        self.request_neighbors = None
+        self.request_neighbor_sets = None
+        if candidate_size is not None:
+            self.request_neighbors = graph.request_neighbors(candidate_size)
+            self.request_neighbor_sets = [set(neighbors) for neighbors in self.request_neighbors]
+        self.lateness_bounds = graph.lateness_bounds
         CostCalculator.add_listener(self)
 
     def on_cost_calculated(self, event: CostCalculationEvent):
         """Implementation của CostListener interface"""
         self.evaluation_count += 1
         
+    def _cannot_improve(self, affected_vehicles, lateness_bound):
+        """
+        Các xe bị ảnh hưởng phải chịu ít nhất p2 * lateness_bound tiền phạt sau phép biến đổi (các
+        xe khác giữ nguyên chi phí), nên phép biến đổi không thể cải thiện khi giá trị này không nhỏ
+        hơn tổng chi phí hiện tại của chúng.
+        """
+        if lateness_bound <= 0:
+            return False
+        costs = self.cost_table.costs
+        return self.graph.p2 * lateness_bound >= sum(costs[idx] for idx in set(affected_vehicles))
+
+    def _active_nodes(self, tree, op_name):
+        """Các nút yêu cầu còn trong hàng đợi active của phép toán op_name, theo thứ tự hàng đợi."""
+        if self.active_requests is None:
+            return [node for label, node in tree.tree_nodes.items() if isinstance(label, int) and label > 0]
+        return [tree.tree_nodes[label] for label in self.active_requests[op_name]]
+
+    def _deactivate(self, op_name, node):
+        """Đặt don't-look bit: op_name bỏ qua node cho đến khi một phép biến đổi chạm đến lộ trình của nó."""
+        if self.active_requests is not None:
+            self.active_requests[op_name].pop(node.label, None)
+
+    def _commit_move(self, tree, affected_vehicles, *changed_nodes):
+        """
+        Chấp nhận phép biến đổi đang thử và đưa lại vào hàng đợi active của mọi phép toán các yêu cầu
+        nằm trên lộ trình của các xe bị ảnh hưởng.
+        """
+        tree.release()
+        self.cost_table.commit(*changed_nodes)
+        if self.active_requests is None:
+            return
+        node_request_id = self.graph.node_request_id
+        for idx in set(affected_vehicles):
+            for node_id in self.cost_table.travel_paths[idx]:
+                label = node_request_id[node_id]
+                if label > 0:
+                    for active in self.active_requests.values():
+                        if label not in active:
+                            active[label] = None
+
     def run(self, tree, evaluation_limit):
         """
         Phiên bản tối ưu nhất của local search sử dụng Variable Neighborhood Descent (VND).
@@ -35,6 +92,8 @@ class LocalSearch(object):
             
         current_cost = CostCalculator.calculate(self.graph, original_solution.vehicle_list)
         initial_cost = current_cost
+        # Bảng chi phí từng xe để các phép toán chỉ đánh giá lại các xe bị ảnh hưởng
+        self.cost_table = VehicleCostTable(tree, original_solution.vehicle_list)
         
         # Danh sách các phép toán theo thứ tự tăng dần về chi phí tính toán
         operators = [
@@ -44,6 +103,51 @@ class LocalSearch(object):
             ("subtree_swap", self.try_subtree_swap_optimized),
             ("rotate_to_descendant",self.try_rotate_to_descendant_optimized)
         ]
+        current_cost = self._descend(tree, current_cost, operators, evaluation_limit)
+        
+        # In kết quả cuối cùng
+        improvement = initial_cost - current_cost
+        improvement_percentage = (improvement / initial_cost) * 100 if initial_cost > 0 else 0
+        print(f"Chi phí ban đầu: {initial_cost}, Chi phí cuối: {current_cost}")
+        print(f"Cải thiện: {improvement} ({improvement_percentage:.2f}%)")
+        
+        return tree
+
+    def run_route(self, tree, evaluation_limit):
+        """
+        Tìm kiếm cục bộ trên cây chỉ gồm một xe (bài toán con của một depot, xem RouteParallel):
+        chỉ dùng các phép relocate, mọi phép biến đổi đều nằm trong lộ trình của xe đó.
+
+        Args:
+            tree: Cây có đúng một depot
+            evaluation_limit: Số lần đánh giá tối đa
+
+        Returns:
+            Tree: Cây đã được tối ưu hóa
+        """
+        travel_path = tree.travel_path(0)
+        if not Solution.is_travel_path_feasible(self.graph, travel_path):
+            return tree
+        
+        self.cost_table = VehicleCostTable(tree)
+        operators = [
+            ("node_relocate", self.try_node_relocate_optimized),
+            ("subtree_relocate", self.try_subtree_relocate_optimized)
+        ]
+        self._descend(tree, self.cost_table.total_cost(), operators, evaluation_limit)
+        return tree
+
+    def _descend(self, tree, current_cost, operators, evaluation_limit):
+        """
+        Variable Neighborhood Descent với các phép toán operators trên self.cost_table.
+
+        Returns:
+            float: Chi phí sau khi tối ưu
+        """
+        # Ban đầu mọi yêu cầu đều active với mọi phép toán; sau mỗi lần cải thiện chỉ các yêu cầu trên
+        # các lộ trình bị thay đổi được đưa lại vào hàng đợi
+        request_labels = [label for label in tree.tree_nodes if isinstance(label, int) and label > 0]
+        self.active_requests = {op_name: dict.fromkeys(request_labels) for op_name, _ in operators}
         
         # Biến lưu trữ số lần mỗi phép toán không cải thiện liên tiếp
         self.evaluation_count = 0
@@ -64,6 +168,8 @@ class LocalSearch(object):
             
             #print(f"  Thử phép toán {op_name}...")
             
+            # Nếu phép toán lỗi giữa chừng, cây được đưa về trạng thái trước phép toán
+            savepoint = tree.savepoint()
             try:
                 # Thực hiện phép toán và lấy kết quả
                 operator_improved, new_cost = op_func(tree, current_cost)
@@ -71,7 +177,6 @@ class LocalSearch(object):
                 if operator_improved:
                     #print(f"  ✓ {op_name} cải thiện từ {current_cost} xuống {new_cost}")
                     current_cost = new_cost
-                    improved = True
                     
                     # Reset counter cho phép toán này
                     non_improving_counts[op_name] = 0
@@ -90,18 +195,14 @@ class LocalSearch(object):
                     break
             
             except Exception as e:
+                tree.rollback(savepoint)
                 print(f"  Lỗi khi chạy {op_name}: {str(e)}")
                 non_improving_counts[op_name] += 1
                 operator_index += 1
             
         
-        # In kết quả cuối cùng
-        improvement = initial_cost - current_cost
-        improvement_percentage = (improvement / initial_cost) * 100 if initial_cost > 0 else 0
-        print(f"Chi phí ban đầu: {initial_cost}, Chi phí cuối: {current_cost}")
-        print(f"Cải thiện: {improvement} ({improvement_percentage:.2f}%)")
-        
-        return tree
+        self.active_requests = None
+        return current_cost
 
     def try_node_swap_optimized(self, tree, current_cost):
         """
@@ -114,15 +215,17 @@ class LocalSearch(object):
         Returns:
             tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
         """
-        # Tạo danh sách các nút yêu cầu
+        # Tạo danh sách các nút yêu cầu; chỉ các nút còn active được chọn làm node1
         request_nodes = [node for label, node in tree.tree_nodes.items() 
                         if isinstance(label, int) and label > 0]
+        active_nodes = self._active_nodes(tree, "node_swap")
         
         # Xáo trộn danh sách để tăng tính ngẫu nhiên
-        random.shuffle(request_nodes)
+        random.shuffle(active_nodes)
         
         # Thử hoán đổi từng cặp nút
-        for node1 in request_nodes:
+        for node1 in active_nodes:
+            self._deactivate("node_swap", node1)
             # Lọc nhanh các node còn lại phù hợp để hoán đổi
             remaining_nodes = [node for node in request_nodes if node != node1 
                             and node.parent is not None and node1.parent is not None]
@@ -131,75 +234,44 @@ class LocalSearch(object):
             
             for node2 in remaining_nodes:
                 # Kiểm tra nhanh các điều kiện không khả thi
-                # Kiểm tra quan hệ cha-con
-                if node1.parent == node2 or node2.parent == node1:
+                # Kiểm tra quan hệ tổ tiên (gồm cả quan hệ cha-con) bằng chỉ mục Euler
+                if tree.is_ancestor(node1, node2) or tree.is_ancestor(node2, node1):
                     continue
-                    
-                # Kiểm tra quan hệ tổ tiên
-                ancestor_relation = False
-                current = node2.parent
-                while current and not ancestor_relation:
-                    if current == node1:
-                        ancestor_relation = True
-                        break
-                    current = current.parent
-                    
-                current = node1.parent
-                while current and not ancestor_relation:
-                    if current == node2:
-                        ancestor_relation = True
-                        break
-                    current = current.parent
-                    
-                if ancestor_relation:
+                
+                # Kiểm tra tải trọng bằng các giá trị tải lưu trên cây: node1 nhận các con của node2
+                # tại vị trí của node2 và ngược lại
+                if not (tree.fits_capacity(node2.parent, tree.peak_load_with_children(node1, node2.children)) and
+                        tree.fits_capacity(node1.parent, tree.peak_load_with_children(node2, node1.children))):
                     continue
                 
-                # Lưu trạng thái ban đầu
-                parent1, parent2 = node1.parent, node2.parent
-                idx1 = parent1.children.index(node1)
-                idx2 = parent2.children.index(node2)
-                children1, children2 = list(node1.children), list(node2.children)
+                # Chỉ các xe chứa node1 và node2 bị ảnh hưởng
+                affected_vehicles = (self.cost_table.vehicle_of(node1), self.cost_table.vehicle_of(node2))
                 
-                # Thực hiện hoán đổi trực tiếp
-                parent1.children[idx1] = node2
-                parent2.children[idx2] = node1
-                node1.parent, node2.parent = parent2, parent1
+                # Bỏ qua nếu time window của các cặp cha-con mới đã buộc phải trễ quá nhiều
+                parent1, parent2 = node1.parent, node2.parent
+                nested = self.lateness_bounds.nested
+                lateness_bound = max(nested(parent2.label, node1.label), nested(parent1.label, node2.label))
+                for child in node2.children:
+                    lateness_bound = max(lateness_bound, nested(node1.label, child.label))
+                for child in node1.children:
+                    lateness_bound = max(lateness_bound, nested(node2.label, child.label))
+                if self._cannot_improve(affected_vehicles, lateness_bound):
+                    continue
                 
-                # Xử lý con
-                node1.children.clear()
-                node2.children.clear()
+                savepoint = tree.savepoint()
                 
-                for child in children2:
-                    child.parent = node1
-                    node1.children.append(child)
-                    
-                for child in children1:
-                    child.parent = node2
-                    node2.children.append(child)
+                # Hoán đổi vị trí và danh sách con của hai nút
+                tree.swap_subtrees(node1, node2)
+                tree.swap_children(node1, node2)
                 
-                # Kiểm tra tính hợp lệ và cải thiện
-                new_solution = Solution.tree_to_tours(tree)
-                if Solution.is_sol_feasible(self.graph, new_solution.vehicle_list):
-                    new_cost = CostCalculator.calculate(self.graph, new_solution.vehicle_list)
-                    
-                    if new_cost < current_cost:
-                        return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
+                # Kiểm tra cải thiện (tải trọng đã được kiểm tra trước)
+                new_cost = self.cost_table.evaluate(affected_vehicles, check_feasible=False)
+                if new_cost < current_cost:
+                    self._commit_move(tree, affected_vehicles, node1, node2, parent1, parent2)
+                    return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
                 
                 # Hoàn tác nếu không cải thiện
-                parent1.children[idx1] = node1
-                parent2.children[idx2] = node2
-                node1.parent, node2.parent = parent1, parent2
-                
-                node1.children.clear()
-                node2.children.clear()
-                
-                for child in children1:
-                    child.parent = node1
-                    node1.children.append(child)
-                    
-                for child in children2:
-                    child.parent = node2
-                    node2.children.append(child)
+                tree.rollback(savepoint)
                     
                 if self.evaluation_count >= self.evaluation_limit:
                     break
@@ -220,14 +292,16 @@ class LocalSearch(object):
         Returns:
             tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
         """
-        # Tạo danh sách các nút yêu cầu (không phải depot hoặc root)
+        # Tạo danh sách các nút yêu cầu (không phải depot hoặc root); chỉ các nút còn active được chọn làm node1
         request_nodes = [node for label, node in tree.tree_nodes.items() 
                         if isinstance(label, int) and label > 0]
+        active_nodes = self._active_nodes(tree, "subtree_swap")
         
         # Xáo trộn danh sách các nút để tìm kiếm ngẫu nhiên
-        random.shuffle(request_nodes)
+        random.shuffle(active_nodes)
         
-        for node1 in request_nodes:
+        for node1 in active_nodes:
+            self._deactivate("subtree_swap", node1)
             # Lọc nhanh các node còn lại phù hợp để hoán đổi
             remaining_nodes = [node for node in request_nodes if node != node1 
                             and node.parent is not None and node1.parent is not None]
@@ -236,50 +310,38 @@ class LocalSearch(object):
             
             for node2 in remaining_nodes:
                 # Kiểm tra nhanh các điều kiện không khả thi
-                # Kiểm tra quan hệ cha-con
-                if node1.parent == node2 or node2.parent == node1:
-                    continue
-                    
                 # Kiểm tra quan hệ tổ tiên - node2 không phải là con cháu của node1 và ngược lại
-                is_descendant = False
-                current = node2
-                while current and current.parent and not is_descendant:
-                    if current.parent == node1:
-                        is_descendant = True
-                        break
-                    current = current.parent
-                    
-                current = node1
-                while current and current.parent and not is_descendant:
-                    if current.parent == node2:
-                        is_descendant = True
-                        break
-                    current = current.parent
-                    
-                if is_descendant:
+                if tree.is_ancestor(node1, node2) or tree.is_ancestor(node2, node1):
                     continue
                 
-                # Lưu trạng thái ban đầu
+                # Kiểm tra tải trọng: mỗi cây con được gắn vào vị trí của cây con kia
+                if not (tree.fits_capacity(node2.parent, tree.subtree_peak_load(node1)) and
+                        tree.fits_capacity(node1.parent, tree.subtree_peak_load(node2))):
+                    continue
+                
+                # Chỉ các xe chứa node1 và node2 bị ảnh hưởng
+                affected_vehicles = (self.cost_table.vehicle_of(node1), self.cost_table.vehicle_of(node2))
+                
+                # Bỏ qua nếu time window của các cặp cha-con mới đã buộc phải trễ quá nhiều
                 parent1, parent2 = node1.parent, node2.parent
-                idx1 = parent1.children.index(node1)
-                idx2 = parent2.children.index(node2)
+                nested = self.lateness_bounds.nested
+                if self._cannot_improve(affected_vehicles, max(nested(parent2.label, node1.label),
+                                                               nested(parent1.label, node2.label))):
+                    continue
+                
+                savepoint = tree.savepoint()
                 
                 # Thực hiện hoán đổi trực tiếp
-                parent1.children[idx1] = node2
-                parent2.children[idx2] = node1
-                node1.parent, node2.parent = parent2, parent1
+                tree.swap_subtrees(node1, node2)
                 
                 # Kiểm tra tính hợp lệ và cải thiện
-                new_solution = Solution.tree_to_tours(tree)
-                if Solution.is_sol_feasible(self.graph, new_solution.vehicle_list):
-                    new_cost = CostCalculator.calculate(self.graph, new_solution.vehicle_list)
-                    if new_cost < current_cost:
-                        return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
+                new_cost = self.cost_table.evaluate_tree(affected_vehicles, tree.path_to_root(parent1, parent2))
+                if new_cost is not None and new_cost < current_cost:
+                    self._commit_move(tree, affected_vehicles, parent1, parent2)
+                    return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
                 
                 # Hoàn tác nếu không cải thiện
-                parent1.children[idx1] = node1
-                parent2.children[idx2] = node2
-                node1.parent, node2.parent = parent1, parent2
+                tree.rollback(savepoint)
                 
                 if self.evaluation_count >= self.evaluation_limit:
                     break
@@ -289,7 +351,30 @@ class LocalSearch(object):
         
         return False, current_cost
 
-    def try_subtree_relocate_optimized(self, tree, current_cost):
+    def _candidate_targets(self, tree, node):
+        """
+        Các vị trí chèn ứng viên của node theo danh sách yêu cầu gần nhất: ngay trước hoặc ngay sau
+        nút của một yêu cầu gần (cùng cha), hoặc làm con đầu/con cuối của nút đó.
+
+        Returns:
+            dict: parent -> danh sách vị trí trong parent.children, không gồm các nút trong cây con của node
+        """
+        targets = {}
+        tree_nodes = tree.tree_nodes
+        for label in self.request_neighbors[node.label]:
+            # Cây của bài toán con một xe (run_route) không chứa mọi yêu cầu
+            neighbor = tree_nodes.get(label)
+            if neighbor is None:
+                continue
+            neighbor_parent = neighbor.parent
+            index = neighbor_parent.children.index(neighbor)
+            for parent, position in ((neighbor_parent, index), (neighbor_parent, index + 1),
+                                     (neighbor, 0), (neighbor, len(neighbor.children))):
+                if not tree.is_ancestor(node, parent):
+                    targets.setdefault(parent, set()).add(position)
+        return {parent: sorted(positions) for parent, positions in targets.items()}
+
+    def try_subtree_relocate_optimized(self, tree, current_cost, granular=None):
         """
         Phiên bản tối ưu của try_subtree_relocate, có thể di chuyển các cây con
         đến vị trí con của các nút depot.
@@ -297,42 +382,45 @@ class LocalSearch(object):
         Args:
             tree: Cây biểu diễn giải pháp cần tối ưu
             current_cost: Chi phí hiện tại để so sánh
+            granular: True chỉ thử các vị trí từ danh sách ứng viên, False thử toàn bộ lân cận,
+                None (mặc định) thử danh sách ứng viên trước và chỉ quét toàn bộ khi không cải thiện
             
         Returns:
             tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
         """
-        # Tạo danh sách các nút có thể di chuyển (nút yêu cầu)
-        movable_nodes = [node for label, node in tree.tree_nodes.items() 
-                        if isinstance(label, int) and label > 0 and node.parent is not None]
+        if granular is None and self.request_neighbors is not None:
+            improved, new_cost = self.try_subtree_relocate_optimized(tree, current_cost, granular=True)
+            if improved or self.evaluation_count >= self.evaluation_limit:
+                return improved, new_cost
+        
+        # Tạo danh sách các nút có thể di chuyển (nút yêu cầu còn active)
+        movable_nodes = [node for node in self._active_nodes(tree, "subtree_relocate") if node.parent is not None]
         
         # Xáo trộn danh sách để tìm kiếm ngẫu nhiên
         random.shuffle(movable_nodes)
         
         for node in movable_nodes:
-            # Lưu trạng thái ban đầu
+            # Lượt quét lân cận hạt không đặt don't-look bit vì lượt quét toàn bộ có thể theo sau
+            if not granular:
+                self._deactivate("subtree_relocate", node)
             old_parent = node.parent
-            old_index = old_parent.children.index(node)
-            
-            # Tạo danh sách các nút cha tiềm năng
-            potential_parents = []
+            old_vehicle = self.cost_table.vehicle_of(node)
             
-            for label, parent in tree.tree_nodes.items():
-                # Bỏ qua các trường hợp không hợp lệ
-                if parent is None or parent == node or label == -1:
-                    continue
+            # Tạo danh sách các nút cha tiềm năng (lân cận hạt: các nút cha từ danh sách ứng viên)
+            if granular:
+                targets = self._candidate_targets(tree, node)
+                potential_parents = list(targets)
+            else:
+                targets = None
+                potential_parents = []
+                for label, parent in tree.tree_nodes.items():
+                    # Bỏ qua các trường hợp không hợp lệ
+                    if parent is None or parent == node or label == -1:
+                        continue
                 
-                # Kiểm tra để tránh tạo chu trình - parent không phải là con cháu của node
-                is_descendant = False
-                current = parent
-                while current and not is_descendant:
-                    if current == node:
-                        is_descendant = True
-                        break
-                    current = current.parent
-                
-                # Chỉ thêm vào danh sách nếu parent không phải là con cháu của node
-                if not is_descendant:
-                    potential_parents.append(parent)
+                    # Chỉ thêm vào danh sách nếu parent không phải là con cháu của node (tránh tạo chu trình)
+                    if not tree.is_ancestor(node, parent):
+                        potential_parents.append(parent)
             
             # Xáo trộn danh sách các nút cha tiềm năng
             random.shuffle(potential_parents)
@@ -341,30 +429,47 @@ class LocalSearch(object):
                 # Bỏ qua nếu parent là old_parent (không cần di chuyển)
                 if parent == old_parent:
                     continue
+                
+                # Chỉ xe cũ và xe chứa parent bị ảnh hưởng
+                affected_vehicles = (old_vehicle, self.cost_table.vehicle_of(parent))
                     
                 # Thử các vị trí chèn vào
-                positions = list(range(len(parent.children) + 1))
+                positions = list(range(len(parent.children) + 1)) if targets is None else targets[parent]
                 random.shuffle(positions)
                 
+                # Tải khi đi vào cây con không phụ thuộc vị trí, nên kiểm tra một lần cho parent
+                if not tree.fits_capacity(parent, tree.subtree_peak_load(node)):
+                    continue
+                
+                # Cận dưới thời gian trễ khi node nằm dưới parent, cùng với các anh/em liền kề ở từng vị trí
+                nested_bound = self.lateness_bounds.nested(parent.label, node.label)
+                if self._cannot_improve(affected_vehicles, nested_bound):
+                    continue
+                ordered = self.lateness_bounds.ordered
+                
                 for position in positions:
-                    # Loại bỏ node khỏi parent cũ
-                    old_parent.children.remove(node)
+                    lateness_bound = nested_bound
+                    if position > 0:
+                        lateness_bound = max(lateness_bound, ordered(parent.children[position - 1].label, node.label))
+                    if position < len(parent.children):
+                        lateness_bound = max(lateness_bound, ordered(node.label, parent.children[position].label))
+                    if self._cannot_improve(affected_vehicles, lateness_bound):
+                        continue
+                    
+                    savepoint = tree.savepoint()
                     
-                    # Chèn node vào parent mới
-                    parent.children.insert(position, node)
-                    node.parent = parent
+                    # Chuyển node từ parent cũ sang parent mới
+                    tree.detach(node)
+                    tree.attach(parent, node, position)
                     
                     # Kiểm tra tính hợp lệ và cải thiện
-                    new_solution = Solution.tree_to_tours(tree)
-                    if Solution.is_sol_feasible(self.graph, new_solution.vehicle_list):
-                        new_cost = CostCalculator.calculate(self.graph, new_solution.vehicle_list)
-                        if new_cost < current_cost:
-                            return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
+                    new_cost = self.cost_table.evaluate_tree(affected_vehicles, tree.path_to_root(old_parent, parent))
+                    if new_cost is not None and new_cost < current_cost:
+                        self._commit_move(tree, affected_vehicles, old_parent, parent)
+                        return True, new_cost  # Dừng ngay khi tìm thấy cải thiện
                     
                     # Hoàn tác nếu không cải thiện
-                    parent.children.remove(node)
-                    old_parent.children.insert(old_index, node)
-                    node.parent = old_parent
+                    tree.rollback(savepoint)
                     
                     if self.evaluation_count >= self.evaluation_limit:
                         break
@@ -377,7 +482,7 @@ class LocalSearch(object):
         
         return False, current_cost
 
-    def try_node_relocate_optimized(self, tree, current_cost):
+    def try_node_relocate_optimized(self, tree, current_cost, granular=None):
         """
         Phiên bản tối ưu và đơn giản của try_node_relocate, 
         tránh sử dụng deepcopy và chỉ lưu trữ thông tin cần thiết.
@@ -385,138 +490,110 @@ class LocalSearch(object):
         Args:
             tree: Cây biểu diễn giải pháp cần tối ưu
             current_cost: Chi phí hiện tại để so sánh
+            granular: True chỉ thử các vị trí và các anh/em được nhận làm con từ danh sách ứng viên,
+                False thử toàn bộ lân cận, None (mặc định) thử danh sách ứng viên trước và chỉ quét
+                toàn bộ khi không cải thiện
             
         Returns:
             tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
         """
-        # Lấy danh sách tất cả các nút yêu cầu
-        movable_nodes = [node for label, node in tree.tree_nodes.items() 
-                        if isinstance(label, int) and label > 0 and node.parent is not None]
+        if granular is None and self.request_neighbors is not None:
+            improved, new_cost = self.try_node_relocate_optimized(tree, current_cost, granular=True)
+            if improved or self.evaluation_count >= self.evaluation_limit:
+                return improved, new_cost
+        
+        # Lấy danh sách các nút yêu cầu còn active
+        movable_nodes = [node for node in self._active_nodes(tree, "node_relocate") if node.parent is not None]
         
         # Xáo trộn danh sách để tìm kiếm ngẫu nhiên
         random.shuffle(movable_nodes)
         
         # Duyệt qua từng nút có thể di chuyển
         for node in movable_nodes:
+            # Lượt quét lân cận hạt không đặt don't-look bit vì lượt quét toàn bộ có thể theo sau
+            if not granular:
+                self._deactivate("node_relocate", node)
             # Lưu thông tin node hiện tại
             old_parent = node.parent
             old_position = old_parent.children.index(node)
-            old_children = list(node.children)
+            old_vehicle = self.cost_table.vehicle_of(node)
             
-            # Tạo danh sách các nút cha tiềm năng
-            potential_parents = []
-            
-            for label, potential_parent in tree.tree_nodes.items():
-                # Bỏ qua các trường hợp không hợp lệ
-                if potential_parent is None or potential_parent == node or label == -1:
-                    continue
+            # Tạo danh sách các nút cha tiềm năng (lân cận hạt: các nút cha từ danh sách ứng viên)
+            if granular:
+                targets = self._candidate_targets(tree, node)
+                potential_parents = list(targets)
+            else:
+                targets = None
+                potential_parents = []
+                for label, potential_parent in tree.tree_nodes.items():
+                    # Bỏ qua các trường hợp không hợp lệ
+                    if potential_parent is None or potential_parent == node or label == -1:
+                        continue
                 
-                # Kiểm tra để tránh tạo chu trình - potential_parent không phải là con cháu của node
-                is_descendant = False
-                current = potential_parent
-                while current and not is_descendant:
-                    if current == node:
-                        is_descendant = True
-                        break
-                    current = current.parent
-                
-                # Chỉ thêm vào danh sách nếu potential_parent không phải là con cháu của node
-                if not is_descendant:
-                    potential_parents.append(potential_parent)
+                    # Chỉ thêm vào danh sách nếu potential_parent không phải là con cháu của node (tránh tạo chu trình)
+                    if not tree.is_ancestor(node, potential_parent):
+                        potential_parents.append(potential_parent)
             
             # Xáo trộn danh sách để tăng tính ngẫu nhiên
             random.shuffle(potential_parents)
             
             for parent in potential_parents:
+                # Chỉ xe cũ và xe chứa parent bị ảnh hưởng
+                affected_vehicles = (old_vehicle, self.cost_table.vehicle_of(parent))
+                # parent không thuộc cây con của node nên tải khi đi vào con của parent không đổi
+                parent_entry_load = tree.child_entry_load(parent)
+                
                 # Thử tất cả các vị trí có thể trong parent
-                positions = list(range(len(parent.children) + 1))
+                positions = list(range(len(parent.children) + 1)) if targets is None else targets[parent]
                 random.shuffle(positions)
                 
                 for position in positions:
                     # Giới hạn số lượng anh/em bên phải xem xét để tối ưu thời gian
                     max_right_siblings = min(3, len(parent.children) - position if position < len(parent.children) else 0)
+                    if targets is not None:
+                        # Chỉ nhận làm con các anh/em liên tiếp nằm trong danh sách ứng viên
+                        neighbor_set = self.request_neighbor_sets[node.label]
+                        adoptable = 0
+                        while adoptable < max_right_siblings and parent.children[position + adoptable].label in neighbor_set:
+                            adoptable += 1
+                        max_right_siblings = adoptable
                     
                     # Thử từng cách di chuyển anh/em bên phải
                     for right_siblings_to_move in range(max_right_siblings + 1):
-                        # Bước 1: Xóa node khỏi cha cũ và gắn các con vào vị trí của node
-                        old_parent.children.remove(node)
-                        old_position_current = old_position
+                        savepoint = tree.savepoint()
                         
-                        for child in list(node.children):
-                            node.children.remove(child)
-                            old_parent.children.insert(old_position_current, child)
-                            child.parent = old_parent
-                            old_position_current += 1
+                        # Bước 1: Xóa node khỏi cha cũ và gắn các con vào vị trí của node
+                        tree.detach(node)
+                        tree.move_children(node, old_parent, old_position)
                         
                         # Bước 2: Chèn node vào vị trí mới trong parent
-                        if position <= len(parent.children):
-                            parent.children.insert(position, node)
-                        else:
-                            parent.children.append(node)
-                        node.parent = parent
-                        
-                        # Bước 3: Di chuyển anh/em bên phải (nếu có)
-                        siblings_moved = []
-                        siblings_original_positions = []
+                        tree.attach(parent, node, position)
                         
+                        # Bước 3: Di chuyển anh/em bên phải (nếu có) thành con của node
                         if right_siblings_to_move > 0 and position < len(parent.children) - 1:
                             # Chỉ xem xét đến position + right_siblings_to_move
                             end_pos = min(position + 1 + right_siblings_to_move, len(parent.children))
-                            siblings_to_move = []
-                            for i, sib in enumerate(parent.children[position+1:end_pos]):
-                                siblings_to_move.append(sib)
-                                siblings_original_positions.append(position + 1 + i)  # Vị trí thực tế trong parent.children
-                            
-                            # Lưu vị trí ban đầu và di chuyển từng anh/em
-                            for sib in siblings_to_move:
-                                parent.children.remove(sib)
-                                node.children.append(sib)
-                                sib.parent = node
-                                siblings_moved.append(sib)
+                            tree.move_children(parent, node, start=position + 1, count=end_pos - position - 1)
                         
-                        # Bước 4: Đánh giá giải pháp mới
-                        new_solution = Solution.tree_to_tours(tree)
-                        if Solution.is_sol_feasible(self.graph, new_solution.vehicle_list):
-                            new_cost = CostCalculator.calculate(self.graph, new_solution.vehicle_list)
-                            
-                            if new_cost < current_cost:
-                                #print(f"Di chuyển nút {node.label} đến làm con của nút {parent.label} ở vị trí {position} "
-                                      #f"với {len(siblings_moved)} anh em bên phải đã cải thiện chi phí từ {current_cost:.2f} xuống {new_cost:.2f}")
-                                return True, new_cost
+                        # Bước 4: Kiểm tra tải trọng của node cùng các anh/em được nhận làm con
+                        # (cây con chứa old_parent đã mất node nên được tính lại) và cận dưới thời gian
+                        # trễ của node dưới parent mới và các con mới của node, rồi đánh giá
+                        new_cost = None
+                        node_peak_load = tree.peak_load_with_children(node, node.children, tree.path_to_root(old_parent))
+                        lateness_bound = self.lateness_bounds.nested(parent.label, node.label)
+                        for child in node.children:
+                            lateness_bound = max(lateness_bound, self.lateness_bounds.nested(node.label, child.label))
+                        if (parent_entry_load + node_peak_load <= self.graph.vehicle_capacity and
+                                not self._cannot_improve(affected_vehicles, lateness_bound)):
+                            new_cost = self.cost_table.evaluate(affected_vehicles, check_feasible=False)
+                        if new_cost is not None and new_cost < current_cost:
+                            #print(f"Di chuyển nút {node.label} đến làm con của nút {parent.label} ở vị trí {position} "
+                                  #f"với {len(siblings_moved)} anh em bên phải đã cải thiện chi phí từ {current_cost:.2f} xuống {new_cost:.2f}")
+                            self._commit_move(tree, affected_vehicles, node, old_parent, parent)
+                            return True, new_cost
                         
                         # Bước 5: Hoàn tác nếu không cải thiện
-                        # 5.1 Hoàn tác việc di chuyển anh/em bên phải
-                        for i, sib in enumerate(siblings_moved):
-                            node.children.remove(sib)
-                            # Chèn lại vào vị trí ban đầu trong parent
-                            if i < len(siblings_original_positions):
-                                pos = siblings_original_positions[i]
-                                if pos < len(parent.children):
-                                    parent.children.insert(pos, sib)
-                                else:
-                                    parent.children.append(sib)
-                            else:
-                                # Nếu không có vị trí cụ thể, thêm vào cuối
-                                parent.children.append(sib)
-                            sib.parent = parent
-                        
-                        # 5.2 Xóa node khỏi parent mới
-                        if node in parent.children:
-                            parent.children.remove(node)
-
-                        # 5.3 Đưa các con từ old_parent trở lại node
-                        for child in old_children:
-                            if child in old_parent.children:
-                                old_parent.children.remove(child)
-                            node.children.append(child)
-                            child.parent = node
-                        
-                        # 5.4 Khôi phục node vào vị trí ban đầu trong old_parent
-                        if old_position < len(old_parent.children):
-                            old_parent.children.insert(old_position, node)
-                        else:
-                            old_parent.children.append(node)
-                        node.parent = old_parent
+                        tree.rollback(savepoint)
                         
                         if self.evaluation_count >= self.evaluation_limit:
                             break
@@ -542,23 +619,14 @@ class LocalSearch(object):
         Returns:
             tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
         """
-        # Lấy danh sách các nút yêu cầu
-        request_nodes = [node for label, node in tree.tree_nodes.items()
-                        if isinstance(label, int) and label > 0 and node.parent is not None]
+        # Lấy danh sách các nút yêu cầu còn active
+        request_nodes = [node for node in self._active_nodes(tree, "rotate_to_descendant") if node.parent is not None]
         random.shuffle(request_nodes)
 
         for node in request_nodes:
-            # Thu thập tất cả các nút cháu chắt
-            descendants = []
-            def collect_descendants(current):
-                if isinstance(current.label, int) and current.label > 0:
-                    descendants.append(current)
-                for child in current.children:
-                    collect_descendants(child)
-            collect_descendants(node)
-
-            # Loại bỏ chính nút hiện tại khỏi danh sách cháu chắt
-            descendants = [d for d in descendants if d != node]
+            self._deactivate("rotate_to_descendant", node)
+            # Các nút cháu chắt là đoạn liên tiếp sau node trong chỉ mục Euler
+            descendants = tree.descendants(node)
             if not descendants:
                 continue
 
@@ -566,10 +634,10 @@ class LocalSearch(object):
             random.shuffle(descendants)
             descendant = descendants[0]
 
-            # Lưu trạng thái ban đầu
+            # Phép xoay chỉ thay đổi lộ trình của xe chứa node
+            affected_vehicles = (self.cost_table.vehicle_of(node),)
+
             node_parent = node.parent
-            node_parent_idx = node_parent.children.index(node) if node_parent else -1
-            node_children = list(node.children)
 
             # Tìm đường đi từ nút gốc đến nút cháu chắt
             path = []
@@ -582,67 +650,51 @@ class LocalSearch(object):
             path.append(node)
             path.reverse()  # Đảo ngược để đi từ nút gốc đến nút cháu chắt
 
-            # Lưu trạng thái các nút trên đường đi
-            path_states = []
-            for p in path:
-                path_states.append({
-                    'node': p,
-                    'parent': p.parent,
-                    'children': list(p.children),
-                    'parent_idx': p.parent.children.index(p) if p.parent else -1
-                })
+            # Kiểm tra tải trọng trước khi xoay: sau khi xoay mỗi nút trên đường đi là con của nút
+            # kế tiếp và giữ các con không nằm trên đường đi
+            rotated_peak_load = 0
+            for i, p in enumerate(path):
+                off_path_children = [child for child in p.children if i + 1 >= len(path) or child is not path[i + 1]]
+                peak = tree.peak_load_with_children(p, off_path_children)
+                if i > 0:
+                    peak = max(peak, tree.node_demand(p) + rotated_peak_load)
+                rotated_peak_load = peak
+            if not tree.fits_capacity(node.parent, rotated_peak_load):
+                continue
+
+            # Cận dưới thời gian trễ của các cặp cha-con mới trên đường đi
+            nested = self.lateness_bounds.nested
+            lateness_bound = nested(node_parent.label, path[-1].label)
+            for i in range(len(path) - 1):
+                lateness_bound = max(lateness_bound, nested(path[i + 1].label, path[i].label))
+            if self._cannot_improve(affected_vehicles, lateness_bound):
+                continue
+
+            savepoint = tree.savepoint()
             # Thực hiện xoay: nút cháu chắt trở thành cha của nút gốc
-            # Bước 1: Ngắt kết nối tất cả các nút trên đường đi
-            node.parent.children.remove(node)
-            for i in range(len(path)):
-                p = path[i]
-                p.children.clear()
+            # Bước 1: Tách node khỏi cha và tách từng nút trên đường đi khỏi nút trước nó
+            node_parent_idx = tree.detach(node)
+            for i in range(len(path) - 1):
+                tree.detach(path[i + 1])
 
-            # Bước 2: Xây dựng lại cấu trúc
+            # Bước 2: Mỗi nút trên đường đi thành con đầu tiên của nút kế tiếp, các con không nằm
+            # trên đường đi được giữ nguyên thứ tự phía sau
             for i in range(len(path) - 1):
-                parent_node = path[i + 1]
-                child_node = path[i]
-                parent_node.children.append(child_node)
-                child_node.parent = parent_node
-
-            # Bước 3: Gắn nút gốc (path[-1]) vào nút cha ban đầu của nó
-            if node_parent:
-                node_parent.children.insert(node_parent_idx, path[-1])
-                path[-1].parent = node_parent
-
-            # Bước 4: Khôi phục các cây con không nằm trên đường đi
-            for state in path_states:
-                node = state['node']
-                for child in state['children']:
-                    if child not in path:
-                        node.children.append(child)
-                        child.parent = node
-
-            # Kiểm tra tính khả thi và chi phí
-            new_solution = Solution.tree_to_tours(tree)
-            if Solution.is_sol_feasible(self.graph, new_solution.vehicle_list):
-                new_cost = CostCalculator.calculate(self.graph, new_solution.vehicle_list)
-                if new_cost < current_cost:
-                    #print(f"Xoay từ nút {node.label} đến nút cháu chắt {descendant.label} cải thiện chi phí từ {current_cost:.2f} xuống {new_cost:.2f}")
-                    return True, new_cost
+                tree.attach(path[i + 1], path[i], 0)
+
+            # Bước 3: Gắn nút cháu chắt (path[-1]) vào vị trí cũ của node
+            tree.attach(node_parent, path[-1], node_parent_idx)
+
+            # Kiểm tra chi phí (tải trọng đã được kiểm tra trước)
+            new_cost = self.cost_table.evaluate(affected_vehicles, check_feasible=False)
+            if new_cost < current_cost:
+                #print(f"Xoay từ nút {node.label} đến nút cháu chắt {descendant.label} cải thiện chi phí từ {current_cost:.2f} xuống {new_cost:.2f}")
+                self._commit_move(tree, affected_vehicles, node_parent, *path)
+                return True, new_cost
 
             # Hoàn tác nếu không cải thiện
-            for state in path_states:
-                node = state['node']
-                if node in node.parent.children:
-                    node.parent.children.remove(node)
-                if state['parent']:
-                    if node not in state['parent'].children:
-                        state['parent'].children.insert(state['parent_idx'], node)
-                    node.parent = state['parent']
-                else:
-                    node.parent = None
-                node.children.clear()
-                for child in state['children']:
-                    if child not in path:
-                        node.children.append(child)
-                        child.parent = node
-                        
+            tree.rollback(savepoint)
+
             if self.evaluation_count >= self.evaluation_limit:
                 break
 
@@ -3,17 +3,27 @@ from Simulator.Solution import Solution
 from Simulator.Vehicle import Vehicle
 from MainAlgo.Initialize import Initialize
 from MainAlgo.LocalSearch import LocalSearch
+from MainAlgo.ParallelLocalSearch import ParallelLocalSearch
 from MainAlgo.Pertubation import Pertubation
 from MainAlgo.ATSP import ATSP
+from MainAlgo.RouteParallel import RouteParallel
 from Simulator.CostCalculationEvent import CostCalculator, CostListener, CostCalculationEvent
 
 import time
 
 class NewAlgo(object):
-    def __init__(self, graph: Graph, pop_size: int):
+    def __init__(self, graph: Graph, pop_size: int, init_processes=None, init_seed=None, route_processes=None,
+                 search_processes=None):
         self.graph = graph
         self.forest = []
         self.pop_size = pop_size
+        # Số tiến trình và seed dùng cho khởi tạo quần thể song song (None: tuần tự)
+        self.init_processes = init_processes
+        self.init_seed = init_seed
+        # Số tiến trình để tối ưu lộ trình từng xe song song thay cho ATSP (None: ATSP tuần tự như cũ)
+        self.route_processes = route_processes
+        # Số tiến trình để quét các phép relocate theo best improvement song song (None: LocalSearch như cũ)
+        self.search_processes = search_processes
         
         self.evaluation_count = 0
         self.evaluation_limit = 50000
@@ -24,9 +34,13 @@ class NewAlgo(object):
         self.best_vehicle_list = None
         
         self.Init = Initialize(self.graph, self.pop_size)
-        self.LocalSearch = LocalSearch(self.graph)
+        if search_processes is not None:
+            self.LocalSearch = ParallelLocalSearch(self.graph, processes=search_processes)
+        else:
+            self.LocalSearch = LocalSearch(self.graph)
         self.Pertubation = Pertubation(self.graph)
         self.ATSP = ATSP(self.graph)
+        self.RouteParallel = RouteParallel(self.graph, route_processes) if route_processes is not None else None
         CostCalculator.add_listener(self)
         
     def on_cost_calculated(self, event: CostCalculationEvent):
@@ -71,9 +85,13 @@ class NewAlgo(object):
                 if self.evaluation_count >= self.evaluation_limit:
                     break
             
-            # Áp dụng ATSP cho mỗi cây trong rừng
+            # Áp dụng ATSP (hoặc tối ưu từng lộ trình song song) cho mỗi cây trong rừng
             for k in range(len(forest)):
-                forest[k] = self.ATSP.run(forest[k], 500)
+                if self.RouteParallel is not None:
+                    # Các lần đánh giá của bài toán con chỉ được ghi nhận sau khi ghép nên phải giới hạn trước
+                    forest[k] = self.RouteParallel.run(forest[k], min(500, self.evaluation_limit - self.evaluation_count))
+                else:
+                    forest[k] = self.ATSP.run(forest[k], min(500, self.evaluation_limit - self.evaluation_count))
                 if self.evaluation_count >= self.evaluation_limit:
                     break
             
@@ -109,9 +127,15 @@ class NewAlgo(object):
         
         try:
             print("Khởi tạo các giải pháp ban đầu...")
-            self.forest = self.Init.initialize_population({'method1': 0.1, 'method2': 0.9})
+            self.forest = self.Init.initialize_population({'method1': 0.1, 'method2': 0.9},
+                                                          processes=self.init_processes, seed=self.init_seed)
 
             print(f"Đã khởi tạo {len(self.forest)} giải pháp ban đầu")
+            # Graph dùng chung và các pool được dùng lại cho mọi lần tìm kiếm và tối ưu lộ trình trong VNS
+            if isinstance(self.LocalSearch, ParallelLocalSearch):
+                self.LocalSearch.open()
+            if self.RouteParallel is not None:
+                self.RouteParallel.open()
             
             # Kiểm tra tính khả thi của các giải pháp ban đầu
             feasible_count = 0
@@ -139,6 +163,7 @@ class NewAlgo(object):
                 print(f"Chi tiết chi phí:")
                 print(f"- Chi phí năng lượng: {energy_cost}")
                 print(f"- Chi phí phạt quá hạn: {penalty_cost}")
+                print(f"- Tỉ lệ trúng bộ nhớ đệm chi phí lộ trình: {self.graph.route_cost_cache.hit_rate():.2%}")
                 
                 # Lưu evaluation_logs vào file
                 with open('evaluation_log.txt', 'w') as f:
@@ -153,4 +178,8 @@ class NewAlgo(object):
                 return None, float('inf')
         
         finally:
+            if isinstance(self.LocalSearch, ParallelLocalSearch):
+                self.LocalSearch.close()
+            if self.RouteParallel is not None:
+                self.RouteParallel.close()
             CostCalculator.remove_listener(self)
@@ -0,0 +1,288 @@
+import os
+import random
+from multiprocessing import Pool
+from typing import List, Optional
+
+from Simulator.Graph import Graph
+from Simulator.SharedGraph import SharedGraph, SharedGraphHandle
+from Simulator.CostCalculationEvent import CostCalculator
+from Simulator.VehicleCostTable import VehicleCostTable
+from MainAlgo.Initialize import Initialize
+from MainAlgo.LocalSearch import LocalSearch
+
+
+class ParallelLocalSearch(LocalSearch):
+    """
+    LocalSearch với hai phép relocate (nút và cây con) chạy theo best improvement trên process pool.
+
+    Các nút cần xét được chia thành SCAN_CHUNKS phần. Mỗi phần được quét trên một bản chụp chỉ đọc
+    của cây (dạng nén của Initialize.pack_tree) cùng graph dùng chung, với một phần ngân sách đánh
+    giá còn lại, và chỉ trả về phép di chuyển tốt nhất cùng chi phí của nó. Tiến trình chính chọn
+    phép tốt nhất trong các phần, đánh giá lại và áp dụng nó trên cây. Số phần cố định nên kết quả
+    không phụ thuộc vào số tiến trình; processes None hoặc 1 quét tuần tự các phần như nhau.
+
+    Các lần đánh giá trong các phần không đến các listener toàn cục mà được ghi nhận sau đó qua
+    CostCalculator.report (với chi phí lời giải hiện tại), nên ngân sách evaluation_limit vẫn được
+    tính chung. Một phép di chuyển được mô tả bằng (loại, nhãn nút, khóa của cha mới trong
+    tree_nodes, vị trí, số anh/em bên phải được nhận làm con).
+    """
+    SCAN_CHUNKS = 8
+
+    def __init__(self, graph: Graph, candidate_size: Optional[int] = 10, processes: Optional[int] = None):
+        """
+        Args:
+            candidate_size: Như LocalSearch
+            processes: Số tiến trình quét song song (không vượt quá số CPU). None hoặc 1 để quét tuần tự
+        """
+        super().__init__(graph, candidate_size)
+        self.processes = processes
+        self._shared_graph = None
+        self._handle = None
+        self._pool = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def _worker_count(self) -> int:
+        # Nhiều tiến trình hơn số CPU chỉ thêm chi phí truyền dữ liệu, không quét nhanh hơn
+        if self.processes is None:
+            return 1
+        return min(self.processes, os.cpu_count() or 1)
+
+    def open(self):
+        """Đưa graph vào bộ nhớ dùng chung và tạo pool (nếu có hơn một tiến trình và chưa được tạo)."""
+        if self._pool is not None or self._worker_count() <= 1:
+            return
+        shared_graph = SharedGraph(self.graph)
+        handle = shared_graph.publish()
+        try:
+            self._pool = Pool(processes=self._worker_count())
+        except BaseException:
+            shared_graph.close()
+            raise
+        self._shared_graph, self._handle = shared_graph, handle
+
+    def close(self):
+        """Đóng pool và giải phóng graph dùng chung."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._shared_graph is not None:
+            self._shared_graph.close()
+            self._shared_graph, self._handle = None, None
+
+    def run(self, tree, evaluation_limit):
+        """
+        Như LocalSearch.run. Pool tạo bởi open được dùng lại cho mọi lần run cho đến khi close được
+        gọi; run khi chưa open thì tạo và đóng pool ngay trong lần chạy đó.
+        """
+        if self._pool is not None or self._worker_count() <= 1:
+            return super().run(tree, evaluation_limit)
+        with self:
+            return super().run(tree, evaluation_limit)
+
+    def try_subtree_relocate_optimized(self, tree, current_cost, granular=None):
+        """Relocate cây con theo best improvement, xem best_relocate."""
+        return self.best_relocate(tree, current_cost, "subtree_relocate", granular)
+
+    def try_node_relocate_optimized(self, tree, current_cost, granular=None):
+        """Relocate nút theo best improvement, xem best_relocate."""
+        return self.best_relocate(tree, current_cost, "node_relocate", granular)
+
+    def best_relocate(self, tree, current_cost, op_name, granular=None):
+        """
+        Quét toàn bộ các nút active của op_name, áp dụng phép di chuyển tốt nhất nếu nó cải thiện.
+
+        Args:
+            op_name: "node_relocate" hoặc "subtree_relocate"
+            granular: Như các phép relocate của LocalSearch
+
+        Returns:
+            tuple: (True/False đã cải thiện, chi phí mới nếu cải thiện)
+        """
+        if granular is None and self.request_neighbors is not None:
+            improved, new_cost = self.best_relocate(tree, current_cost, op_name, granular=True)
+            if improved or self.evaluation_count >= self.evaluation_limit:
+                return improved, new_cost
+
+        labels = [node.label for node in self._active_nodes(tree, op_name) if node.parent is not None]
+        random.shuffle(labels)
+        # Giữ lại một lần đánh giá cho phép di chuyển được chọn
+        remaining = self.evaluation_limit - self.evaluation_count - 1
+        if not labels or remaining <= 0:
+            return False, current_cost
+        if not granular:
+            for label in labels:
+                self._deactivate(op_name, tree.tree_nodes[label])
+
+        chunks = [labels[i::ParallelLocalSearch.SCAN_CHUNKS] for i in range(ParallelLocalSearch.SCAN_CHUNKS)]
+        chunks = [chunk for chunk in chunks if chunk]
+        # Chia đúng phần ngân sách còn lại, các phần không còn ngân sách thì không quét
+        budgets = [remaining // len(chunks) + (1 if i < remaining % len(chunks) else 0) for i in range(len(chunks))]
+        packed_tree = Initialize.pack_tree(tree)
+        args = [(packed_tree, op_name, chunk, bool(granular), current_cost, budget, self.candidate_size)
+                for chunk, budget in zip(chunks, budgets) if budget > 0]
+        if self._pool is not None:
+            results = self._pool.starmap(ParallelLocalSearch._scan_shared_chunk,
+                                         [(self._handle,) + arg for arg in args])
+        else:
+            results = [ParallelLocalSearch.scan_chunk(self.graph, *arg) for arg in args]
+
+        best_cost, best_move = current_cost, None
+        evaluation_count = 0
+        for chunk_cost, chunk_move, chunk_evaluations in results:
+            evaluation_count += chunk_evaluations
+            if chunk_move is not None and chunk_cost < best_cost:
+                best_cost, best_move = chunk_cost, chunk_move
+        if evaluation_count > 0:
+            CostCalculator.report(self.graph, self.cost_table.vehicle_list(), current_cost, evaluation_count)
+        if best_move is None:
+            return False, current_cost
+
+        # Đánh giá lại trên cây thật rồi chấp nhận
+        savepoint = tree.savepoint()
+        node, old_parent, parent, affected_vehicles = self._apply_relocate(tree, best_move)
+        new_cost = self._relocate_cost(tree, best_move, node, old_parent, parent, affected_vehicles)
+        if new_cost is not None and new_cost < current_cost:
+            self._commit_move(tree, affected_vehicles, node, old_parent, parent)
+            return True, new_cost
+        tree.rollback(savepoint)
+        return False, current_cost
+
+    def _node_key(self, tree, node):
+        """Khóa của node trong tree_nodes (nhãn với nút yêu cầu, depot_i với depot)."""
+        if node.label > 0:
+            return node.label
+        return f"depot_{tree.vehicle_index(node)}"
+
+    def _relocate_candidates(self, tree, op_name, node, granular):
+        """Các phép di chuyển của node theo thứ tự cố định (không xáo trộn), như lân cận của LocalSearch."""
+        old_parent = node.parent
+        if granular:
+            targets = self._candidate_targets(tree, node)
+        else:
+            targets = {}
+            for label, parent in tree.tree_nodes.items():
+                if label == -1 or parent is node or tree.is_ancestor(node, parent):
+                    continue
+                targets[parent] = range(len(parent.children) + 1)
+
+        for parent, positions in targets.items():
+            if op_name == "subtree_relocate" and parent is old_parent:
+                continue
+            parent_key = self._node_key(tree, parent)
+            for position in positions:
+                if op_name == "subtree_relocate":
+                    yield (op_name, node.label, parent_key, position, 0)
+                    continue
+                max_right_siblings = min(3, len(parent.children) - position if position < len(parent.children) else 0)
+                if granular:
+                    # Chỉ nhận làm con các anh/em liên tiếp nằm trong danh sách ứng viên
+                    neighbor_set = self.request_neighbor_sets[node.label]
+                    adoptable = 0
+                    while adoptable < max_right_siblings and parent.children[position + adoptable].label in neighbor_set:
+                        adoptable += 1
+                    max_right_siblings = adoptable
+                for right_siblings_to_move in range(max_right_siblings + 1):
+                    yield (op_name, node.label, parent_key, position, right_siblings_to_move)
+
+    def _apply_relocate(self, tree, move):
+        """
+        Thực hiện phép di chuyển move trên cây (ghi vào nhật ký, hoàn tác bằng rollback).
+
+        Returns:
+            tuple: (node, cha cũ, cha mới, các xe bị ảnh hưởng)
+        """
+        op_name, label, parent_key, position, right_siblings_to_move = move
+        node = tree.tree_nodes[label]
+        parent = tree.tree_nodes[parent_key]
+        old_parent = node.parent
+        affected_vehicles = (self.cost_table.vehicle_of(node), self.cost_table.vehicle_of(parent))
+        if op_name == "subtree_relocate":
+            tree.detach(node)
+            tree.attach(parent, node, position)
+        else:
+            # Các con của node thay vào vị trí cũ của node, node nhận các anh/em bên phải làm con
+            old_position = tree.detach(node)
+            tree.move_children(node, old_parent, old_position)
+            tree.attach(parent, node, position)
+            if right_siblings_to_move > 0 and position < len(parent.children) - 1:
+                end_pos = min(position + 1 + right_siblings_to_move, len(parent.children))
+                tree.move_children(parent, node, start=position + 1, count=end_pos - position - 1)
+        return node, old_parent, parent, affected_vehicles
+
+    def _relocate_cost(self, tree, move, node, old_parent, parent, affected_vehicles):
+        """
+        Chi phí lời giải sau phép di chuyển move đã được thực hiện, None nếu vi phạm tải trọng hoặc
+        cận dưới thời gian trễ cho thấy không thể cải thiện (khi đó không tính là một lần đánh giá).
+        """
+        lateness_bounds = self.lateness_bounds
+        lateness_bound = lateness_bounds.nested(parent.label, node.label)
+        if move[0] == "subtree_relocate":
+            if not tree.fits_capacity(parent, tree.subtree_peak_load(node)):
+                return None
+            position = parent.children.index(node)
+            if position > 0:
+                lateness_bound = max(lateness_bound, lateness_bounds.ordered(parent.children[position - 1].label, node.label))
+            if position < len(parent.children) - 1:
+                lateness_bound = max(lateness_bound, lateness_bounds.ordered(node.label, parent.children[position + 1].label))
+            if self._cannot_improve(affected_vehicles, lateness_bound):
+                return None
+            return self.cost_table.evaluate_tree(affected_vehicles, tree.path_to_root(old_parent, parent))
+
+        node_peak_load = tree.peak_load_with_children(node, node.children, tree.path_to_root(old_parent))
+        for child in node.children:
+            lateness_bound = max(lateness_bound, lateness_bounds.nested(node.label, child.label))
+        if (tree.child_entry_load(parent) + node_peak_load > self.graph.vehicle_capacity or
+                self._cannot_improve(affected_vehicles, lateness_bound)):
+            return None
+        return self.cost_table.evaluate(affected_vehicles, check_feasible=False)
+
+    def scan_relocate(self, tree, op_name, labels: List[int], granular, current_cost):
+        """
+        Quét mọi phép di chuyển của các nút labels trên tree, mỗi phép được hoàn tác ngay sau khi đánh giá.
+
+        Returns:
+            tuple: (chi phí tốt nhất, phép di chuyển tốt nhất hoặc None nếu không có phép nào tốt hơn current_cost)
+        """
+        best_cost, best_move = current_cost, None
+        for label in labels:
+            moves = list(self._relocate_candidates(tree, op_name, tree.tree_nodes[label], granular))
+            for move in moves:
+                savepoint = tree.savepoint()
+                node, old_parent, parent, affected_vehicles = self._apply_relocate(tree, move)
+                new_cost = self._relocate_cost(tree, move, node, old_parent, parent, affected_vehicles)
+                tree.rollback(savepoint)
+                if new_cost is not None and new_cost < best_cost:
+                    best_cost, best_move = new_cost, move
+                if self.evaluation_count >= self.evaluation_limit:
+                    return best_cost, best_move
+        return best_cost, best_move
+
+    @staticmethod
+    def scan_chunk(graph: Graph, packed_tree: bytes, op_name, labels, granular, current_cost,
+                   evaluation_limit, candidate_size):
+        """
+        Quét một phần các nút trên bản chụp packed_tree với ngân sách evaluation_limit.
+
+        Returns:
+            tuple: (chi phí tốt nhất, phép di chuyển tốt nhất hoặc None, số lần đánh giá đã dùng)
+        """
+        tree = Initialize.unpack_tree(graph, packed_tree)
+        with CostCalculator.isolated():
+            search = ParallelLocalSearch(graph, candidate_size)
+            search.cost_table = VehicleCostTable(tree)
+            search.evaluation_limit = evaluation_limit
+            best_cost, best_move = search.scan_relocate(tree, op_name, labels, granular, current_cost)
+        return best_cost, best_move, search.evaluation_count
+
+    @staticmethod
+    def _scan_shared_chunk(handle: SharedGraphHandle, *args):
+        """Chạy trong worker: gắn vào graph dùng chung và quét một phần các nút."""
+        return ParallelLocalSearch.scan_chunk(SharedGraph.attach(handle), *args)
@@ -5,6 +5,7 @@ import random
 import numpy as np
 import copy
 from Simulator.TreeNode import TreeNode
+from Simulator.RouteState import RouteState
 
 class Pertubation(object):
     def __init__(self, graph: Graph):
@@ -26,56 +27,31 @@ class Pertubation(object):
         ma = 0
         id = -1
         for vehicle_idx, vehicle in enumerate(current_solution.vehicle_list):
-            cost = Vehicle.cal_total_all_cost(self.graph, vehicle.travel_path)
+            cost = self.graph.route_cost_cache.cost(vehicle.travel_path)
             if id == -1 or cost > ma:
                 ma = cost
                 id = vehicle_idx
         
         removed_requests = []
         for node in current_solution.vehicle_list[id].travel_path:
-            if self.graph.nodes[node].demand > 0:
+            if self.graph.demand_list[node] > 0:
                 removed_requests.append(node)
         current_solution.vehicle_list[id].travel_path = [0, 0]
+        route_states = [RouteState(self.graph, vehicle.travel_path) for vehicle in current_solution.vehicle_list]
         
         for pickup_node in removed_requests:
-            delivery_node = self.graph.nodes[pickup_node].did
+            delivery_node = self.graph.did_list[pickup_node]
             
-            best_cost_increase = float('inf')
-            best_vehicle = None
-            best_pickup_pos = -1
-            best_delivery_pos = -1
-            
-            # Try to insert in each vehicle
-            for vehicle_idx, vehicle in enumerate(current_solution.vehicle_list):
-                current_route = vehicle.travel_path
-                
-                # Try all possible pickup positions (after depot, before delivery)
-                for pickup_pos in range(1, len(current_route)):
-                    # Try all possible delivery positions (after pickup position)
-                    for delivery_pos in range(pickup_pos + 1, len(current_route) + 1):
-                        # Create new route with inserted nodes
-                        new_route = current_route.copy()
-                        new_route.insert(pickup_pos, pickup_node)
-                        new_route.insert(delivery_pos, delivery_node)
-                        
-                        # Check feasibility
-                        if Solution.is_travel_path_feasible(self.graph, new_route):
-                            # Calculate cost increase
-                            old_cost = Vehicle.cal_total_all_cost(self.graph, current_route)
-                            new_cost = Vehicle.cal_total_all_cost(self.graph, new_route)
-                            cost_increase = new_cost - old_cost
-                            
-                            if cost_increase < best_cost_increase:
-                                best_cost_increase = cost_increase
-                                best_vehicle = vehicle_idx
-                                best_pickup_pos = pickup_pos
-                                best_delivery_pos = delivery_pos
+            # Tìm vị trí chèn rẻ nhất trên tất cả các xe bằng trạng thái lộ trình
+            best_vehicle, best_pickup_pos, best_delivery_pos, best_cost_increase = \
+                RouteState.cheapest_insertion(route_states, pickup_node, delivery_node)
             
             # Insert at best found position
             if best_vehicle is not None:
                 vehicle = current_solution.vehicle_list[best_vehicle]
                 vehicle.travel_path.insert(best_pickup_pos, pickup_node)
                 vehicle.travel_path.insert(best_delivery_pos, delivery_node)
+                route_states[best_vehicle] = RouteState(self.graph, vehicle.travel_path)
             
         print(Solution.is_sol_feasible(self.graph, current_solution.vehicle_list))
         tree_copy = Solution.tours_to_tree(current_solution)
@@ -0,0 +1,185 @@
+import random
+from multiprocessing import Pool
+from typing import List, Optional, Tuple
+
+from Simulator.Graph import Graph
+from Simulator.Solution import Solution
+from Simulator.Tree import Tree
+from Simulator.SharedGraph import SharedGraph, SharedGraphHandle
+from Simulator.CostCalculationEvent import CostCalculator, CostCalculationEvent
+from Simulator.VehicleCostTable import VehicleCostTable
+from MainAlgo.ATSP import ATSP
+from MainAlgo.LocalSearch import LocalSearch
+
+
+class RouteParallel(object):
+    """
+    Tối ưu cục bộ trong từng lộ trình (thứ tự con bằng ATSP, relocate trong cùng depot) với mỗi xe
+    là một bài toán con độc lập: các phép biến đổi này không đổi tập yêu cầu của xe nên chi phí các
+    xe khác giữ nguyên và các xe có thể được tối ưu đồng thời trên một process pool.
+
+    Mỗi bài toán con được dựng thành một cây chỉ có một depot từ lộ trình của xe, tối ưu với seed
+    riêng và ngân sách đánh giá riêng, rồi trả về lộ trình mới cùng số lần đánh giá đã dùng. Cây
+    gốc được sắp xếp lại tại chỗ (Tree.restructure) cho các xe có lộ trình tốt hơn. Các lần đánh giá
+    trong bài toán con không đến các listener toàn cục (chi phí của chúng chỉ là chi phí một xe), sau
+    khi ghép lại chúng được ghi nhận qua CostCalculator.report với chi phí của toàn bộ lời giải mới
+    nên tổng số lần đánh giá vẫn khớp với chế độ tuần tự.
+
+    Khi processes > 1, graph dùng chung và pool được tạo bởi open và dùng lại cho mọi lần run cho đến
+    khi close được gọi (run khi chưa open thì tạo và đóng chúng ngay trong lần chạy đó):
+        with RouteParallel(graph, processes=4) as route_parallel:
+            for tree in forest:
+                route_parallel.run(tree, 500)
+    """
+    def __init__(self, graph: Graph, processes: Optional[int] = None):
+        """
+        Args:
+            processes: Số tiến trình song song. None hoặc 1 để chạy các bài toán con tuần tự
+        """
+        self.graph = graph
+        self.processes = processes
+        self.evaluation_count = 0
+        self._shared_graph = None
+        self._handle = None
+        self._pool = None
+        CostCalculator.add_listener(self)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def open(self):
+        """Đưa graph vào bộ nhớ dùng chung và tạo pool (nếu processes > 1 và chưa được tạo)."""
+        if self._pool is not None or self.processes is None or self.processes <= 1:
+            return
+        shared_graph = SharedGraph(self.graph)
+        handle = shared_graph.publish()
+        try:
+            self._pool = Pool(processes=self.processes)
+        except BaseException:
+            shared_graph.close()
+            raise
+        self._shared_graph, self._handle = shared_graph, handle
+
+    def close(self):
+        """Đóng pool và giải phóng graph dùng chung."""
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._shared_graph is not None:
+            self._shared_graph.close()
+            self._shared_graph, self._handle = None, None
+
+    def on_cost_calculated(self, event: CostCalculationEvent):
+        """Implementation của CostListener interface"""
+        self.evaluation_count += 1
+
+    def _split_budget(self, travel_paths: List[List[int]], evaluation_limit) -> List[int]:
+        """Chia ngân sách đánh giá cho các xe theo số yêu cầu; xe có ít hơn 2 yêu cầu không được tối ưu."""
+        sizes = [(len(travel_path) - 2) // 2 for travel_path in travel_paths]
+        sizes = [size if size >= 2 else 0 for size in sizes]
+        total = sum(sizes)
+        if total == 0:
+            return [0] * len(sizes)
+        return [evaluation_limit * size // total for size in sizes]
+
+    def run(self, tree: Tree, evaluation_limit, seed=None) -> Tree:
+        """
+        Tối ưu lộ trình của từng xe trong tree, song song nếu processes > 1.
+
+        Args:
+            tree: Cây cần tối ưu (được sửa tại chỗ)
+            evaluation_limit: Tổng số lần đánh giá tối đa của mọi bài toán con (phần ngân sách toàn cục
+                còn lại nếu nhỏ hơn, vì mọi lần đánh giá chỉ được ghi nhận sau khi ghép)
+            seed: Seed gốc để sinh seed riêng cho từng xe. None thì lấy từ bộ sinh số ngẫu nhiên
+                hiện tại. Kết quả chỉ phụ thuộc vào seed, không phụ thuộc vào số tiến trình
+
+        Returns:
+            Tree: Cây đã được tối ưu hóa
+        """
+        if tree is None:
+            return None
+        self.evaluation_count = 0
+        if evaluation_limit <= 0:
+            return tree
+        graph = self.graph
+        cost_table = VehicleCostTable(tree)
+        travel_paths = cost_table.travel_paths
+        budgets = self._split_budget(travel_paths, evaluation_limit)
+        seed_generator = random.Random(seed) if seed is not None else random
+        seeds = [seed_generator.randrange(2 ** 32) for _ in travel_paths]
+
+        jobs = [(idx, travel_paths[idx], budgets[idx], seeds[idx])
+                for idx in range(len(travel_paths)) if budgets[idx] > 0]
+        if not jobs:
+            return tree
+
+        if self.processes is not None and self.processes > 1 and len(jobs) > 1:
+            temporary = self._pool is None
+            self.open()
+            try:
+                results = self._pool.starmap(RouteParallel._optimize_shared_route,
+                                             [(self._handle, travel_path, budget, route_seed)
+                                              for _, travel_path, budget, route_seed in jobs])
+            finally:
+                if temporary:
+                    self.close()
+        else:
+            results = [RouteParallel.optimize_route(graph, travel_path, budget, route_seed)
+                       for _, travel_path, budget, route_seed in jobs]
+
+        # Ghép các lộ trình tốt hơn vào cây và cập nhật chi phí từng xe
+        route_cost_cache = graph.route_cost_cache
+        evaluation_count = 0
+        for (idx, _, _, _), (travel_path, route_evaluations) in zip(jobs, results):
+            evaluation_count += route_evaluations
+            cost = route_cost_cache.cost(travel_path)
+            if cost < cost_table.costs[idx]:
+                tree.restructure(tree.vehicle_depots[idx], travel_path)
+                cost_table.travel_paths[idx] = tree.travel_path(idx)
+                cost_table.costs[idx] = cost
+
+        if evaluation_count > 0:
+            CostCalculator.report(graph, cost_table.vehicle_list(), cost_table.total_cost(), evaluation_count)
+        return tree
+
+    @staticmethod
+    def optimize_route(graph: Graph, travel_path: List[int], evaluation_limit, seed) -> Tuple[List[int], int]:
+        """
+        Tối ưu một lộ trình như một bài toán con độc lập: ATSP trên thứ tự con rồi relocate trong
+        cùng depot (LocalSearch.run_route), dùng chung ngân sách evaluation_limit. Trạng thái của
+        module random được khôi phục sau khi chạy.
+
+        Returns:
+            tuple: (Lộ trình tốt nhất tìm được, số lần đánh giá đã dùng)
+        """
+        solution = Solution(graph)
+        solution.vehicle_list = solution.vehicle_list[:1]
+        solution.vehicle_list[0].travel_path = list(travel_path)
+        tree = Solution.tours_to_tree(solution)
+
+        random_state = random.getstate()
+        random.seed(seed)
+        try:
+            with CostCalculator.isolated():
+                atsp = ATSP(graph)
+                atsp.run(tree, evaluation_limit)
+                evaluation_count = atsp.evaluation_count
+                if evaluation_count < evaluation_limit:
+                    local_search = LocalSearch(graph)
+                    local_search.run_route(tree, evaluation_limit - evaluation_count)
+                    evaluation_count += local_search.evaluation_count
+        finally:
+            random.setstate(random_state)
+        return tree.travel_path(0), evaluation_count
+
+    @staticmethod
+    def _optimize_shared_route(handle: SharedGraphHandle, travel_path, evaluation_limit, seed):
+        """Chạy trong worker: gắn vào graph dùng chung và tối ưu một lộ trình."""
+        graph = SharedGraph.attach(handle)
+        return RouteParallel.optimize_route(graph, travel_path, evaluation_limit, seed)
@@ -18,13 +18,15 @@ def split_list(lst, n):
     return [list(islice(lst_iter, size//n + (1 if i < size%n else 0))) 
             for i in range(n)]
 
-def solve(testcase, folder_path, output_dir):
+def solve(testcase, folder_path, output_dir, cache=False, cache_dir=None):
     """
     Giải quyết một trường hợp thử nghiệm và lưu evaluation_logs.
     
     Args:
         testcase: Tên file dữ liệu test
         output_dir: Thư mục lưu evaluation_logs
+        cache: Dùng bộ nhớ đệm nhị phân cho dữ liệu đồ thị đã phân tích
+        cache_dir: Thư mục lưu bộ nhớ đệm (mặc định cạnh file dữ liệu)
         
     Returns:
         dict: Chứa testcase và evaluation_logs
@@ -35,7 +37,7 @@ def solve(testcase, folder_path, output_dir):
     # Khởi tạo đồ thị với các tham số
     g = Graph(file_path, cd=0.7, xi=1, kappa=44, p=1.2, A=3.192, mk=3.2, g=9.81, 
               cr=0.01, b1=2, b2=2.5, p1=1, p2=1000, psi=737, pi=0.2, 
-              R=165, eta=0.36, rho=0.85, Q=1000, v = 50)
+              R=165, eta=0.36, rho=0.85, Q=1000, v = 50, cache=cache, cache_dir=cache_dir)
     
     # Chạy thuật toán
     lcs = NewAlgo(g, 10)
@@ -0,0 +1,259 @@
+from array import array
+from typing import List, Tuple
+from Simulator.Graph import Graph
+from Simulator.Tree import Tree
+from Simulator.TreeNode import TreeNode
+
+
+class CompactTree(object):
+    """
+    Biểu diễn cây lời giải bằng các mảng số nguyên thay cho các đối tượng TreeNode.
+
+    Chỉ số nút: 0 là gốc, 1..num_request là các nút yêu cầu (trùng với nhãn của TreeNode),
+    num_request + 1 + i là depot của xe i. Với mỗi nút lưu:
+    - parent: nút cha (-1 với gốc và các nút đang bị tách)
+    - first_child, last_child: con đầu và con cuối (-1 nếu không có con)
+    - next_sibling, prev_sibling: anh/em kế tiếp và liền trước (danh sách liên kết đôi, -1 ở hai đầu)
+    - num_children: số con
+
+    Vị trí của một nút được xác định bằng (cha, anh/em liền trước) thay vì chỉ số trong danh sách con,
+    nên tách (detach), chèn sau một anh/em (insert_after), di chuyển, hoàn tác và hoán đổi cây con đều
+    chỉ sửa một số cố định phần tử mảng (O(1)). Chỉ các thao tác theo chỉ số (child_at, insert_child,
+    child_position) phải đi dọc danh sách con.
+    """
+    NONE = -1
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.num_request = graph.num_request
+        self.vehicle_num = graph.vehicle_num
+        num_index = self.num_request + self.vehicle_num + 1
+        self.parent = array('i', [CompactTree.NONE]) * num_index
+        self.first_child = array('i', [CompactTree.NONE]) * num_index
+        self.last_child = array('i', [CompactTree.NONE]) * num_index
+        self.next_sibling = array('i', [CompactTree.NONE]) * num_index
+        self.prev_sibling = array('i', [CompactTree.NONE]) * num_index
+        self.num_children = array('i', [0]) * num_index
+
+    def depot(self, vehicle_index) -> int:
+        """Chỉ số nút depot của xe vehicle_index."""
+        return self.num_request + 1 + vehicle_index
+
+    def label(self, index) -> int:
+        """Nhãn của nút như trong Tree: -1 cho gốc, 0 cho depot, ID yêu cầu cho nút yêu cầu."""
+        if index == 0:
+            return -1
+        return index if index <= self.num_request else 0
+
+    def vehicle_index(self, index) -> int:
+        """Chỉ số xe có depot chứa nút index (nút là depot thì trả về chính xe đó)."""
+        parent = self.parent
+        while parent[index] != 0:
+            index = parent[index]
+        return index - self.num_request - 1
+
+    def children(self, index) -> List[int]:
+        """Danh sách con của nút theo thứ tự."""
+        result = []
+        child = self.first_child[index]
+        while child != CompactTree.NONE:
+            result.append(child)
+            child = self.next_sibling[child]
+        return result
+
+    def child_at(self, parent, position) -> int:
+        """Con thứ position của parent (-1 nếu position bằng số con), đi từ đầu gần hơn."""
+        num_children = self.num_children[parent]
+        if position >= num_children:
+            return CompactTree.NONE
+        if position <= num_children // 2:
+            child = self.first_child[parent]
+            for _ in range(position):
+                child = self.next_sibling[child]
+        else:
+            child = self.last_child[parent]
+            for _ in range(num_children - 1 - position):
+                child = self.prev_sibling[child]
+        return child
+
+    def child_position(self, child) -> int:
+        """Vị trí của child trong danh sách con của cha nó."""
+        position = 0
+        previous = self.prev_sibling[child]
+        while previous != CompactTree.NONE:
+            position += 1
+            previous = self.prev_sibling[previous]
+        return position
+
+    def insert_after(self, parent, child, previous=NONE) -> None:
+        """
+        Chèn nút child (đang không có cha) vào danh sách con của parent ngay sau con previous
+        (previous = -1: chèn vào đầu danh sách). O(1).
+        """
+        next_sibling = self.next_sibling
+        prev_sibling = self.prev_sibling
+        if previous == CompactTree.NONE:
+            following = self.first_child[parent]
+            self.first_child[parent] = child
+        else:
+            following = next_sibling[previous]
+            next_sibling[previous] = child
+        if following == CompactTree.NONE:
+            self.last_child[parent] = child
+        else:
+            prev_sibling[following] = child
+        prev_sibling[child] = previous
+        next_sibling[child] = following
+        self.parent[child] = parent
+        self.num_children[parent] += 1
+
+    def insert_child(self, parent, child, position=None) -> None:
+        """Chèn nút child (đang không có cha) vào danh sách con của parent tại position (mặc định cuối)."""
+        if position is None or position >= self.num_children[parent]:
+            previous = self.last_child[parent]
+        else:
+            previous = self.prev_sibling[self.child_at(parent, position)]
+        self.insert_after(parent, child, previous)
+
+    def detach(self, child) -> Tuple[int, int]:
+        """
+        Tách cây con gốc child khỏi cha của nó. O(1).
+
+        Returns:
+            tuple: (cha cũ, anh/em liền trước cũ) để có thể chèn lại đúng chỗ bằng insert_after
+        """
+        parent = self.parent[child]
+        previous = self.prev_sibling[child]
+        following = self.next_sibling[child]
+        if previous == CompactTree.NONE:
+            self.first_child[parent] = following
+        else:
+            self.next_sibling[previous] = following
+        if following == CompactTree.NONE:
+            self.last_child[parent] = previous
+        else:
+            self.prev_sibling[following] = previous
+        self.next_sibling[child] = CompactTree.NONE
+        self.prev_sibling[child] = CompactTree.NONE
+        self.parent[child] = CompactTree.NONE
+        self.num_children[parent] -= 1
+        return parent, previous
+
+    def move(self, node, parent, previous=NONE) -> Tuple[int, int, int]:
+        """
+        Di chuyển cây con gốc node thành con của parent, ngay sau con previous (-1: đầu danh sách). O(1).
+
+        Returns:
+            tuple: Thông tin hoàn tác cho undo
+        """
+        old_parent, old_previous = self.detach(node)
+        self.insert_after(parent, node, previous)
+        return node, old_parent, old_previous
+
+    def undo(self, token: Tuple[int, int, int]) -> None:
+        """Hoàn tác một lần move (các move sau nó phải được hoàn tác trước). O(1)."""
+        node, old_parent, old_previous = token
+        self.detach(node)
+        self.insert_after(old_parent, node, old_previous)
+
+    def swap(self, node1, node2) -> None:
+        """Hoán đổi vị trí của hai cây con không có quan hệ tổ tiên (gọi lại để hoàn tác). O(1)."""
+        if self.next_sibling[node2] == node1:
+            node1, node2 = node2, node1
+        if self.next_sibling[node1] == node2:
+            # Hai anh/em liền nhau: node2 lên trước node1
+            self.detach(node1)
+            self.insert_after(self.parent[node2], node1, node2)
+            return
+        parent1, previous1 = self.detach(node1)
+        parent2, previous2 = self.detach(node2)
+        self.insert_after(parent1, node2, previous1)
+        self.insert_after(parent2, node1, previous2)
+
+    def is_ancestor(self, ancestor, index) -> bool:
+        """ancestor là index hoặc tổ tiên của index."""
+        parent = self.parent
+        while index != CompactTree.NONE:
+            if index == ancestor:
+                return True
+            index = parent[index]
+        return False
+
+    def subtree(self, index) -> List[int]:
+        """Các nút trong cây con gốc index theo thứ tự duyệt trước (không đệ quy)."""
+        last_child = self.last_child
+        prev_sibling = self.prev_sibling
+        result = []
+        stack = [index]
+        while stack:
+            node = stack.pop()
+            result.append(node)
+            # Đưa các con vào ngăn xếp từ con cuối để con đầu được lấy ra trước
+            child = last_child[node]
+            while child != CompactTree.NONE:
+                stack.append(child)
+                child = prev_sibling[child]
+        return result
+
+    def travel_path(self, index) -> List[int]:
+        """Đoạn lộ trình pickup...delivery của cây con gốc index (với depot là lộ trình của xe)."""
+        pick_up_id = self.graph.pick_up_id_list
+        delivery_id = self.graph.delivery_id_list
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+        num_request = self.num_request
+
+        travel_path = []
+        # Mỗi phần tử: (nút, con tiếp theo cần thăm)
+        stack = [(index, first_child[index])]
+        label = index if index <= num_request else 0
+        travel_path.append(pick_up_id[label])
+        while stack:
+            node, child = stack[-1]
+            if child == CompactTree.NONE:
+                stack.pop()
+                travel_path.append(delivery_id[node if node <= num_request else 0])
+                continue
+            stack[-1] = (node, next_sibling[child])
+            travel_path.append(pick_up_id[child])
+            stack.append((child, first_child[child]))
+        return travel_path
+
+    def tours(self) -> List[List[int]]:
+        """Lộ trình của tất cả các xe, theo thứ tự xe."""
+        return [self.travel_path(self.depot(i)) for i in range(self.vehicle_num)]
+
+    @staticmethod
+    def from_tree(tree: Tree) -> 'CompactTree':
+        """Chuyển một Tree sang dạng mảng."""
+        compact = CompactTree(tree.graph)
+        last_child = compact.last_child
+        for vehicle_index, depot in enumerate(tree.vehicle_depots):
+            depot_index = compact.depot(vehicle_index)
+            compact.insert_after(0, depot_index, last_child[0])
+            stack = [(depot, depot_index)]
+            while stack:
+                node, index = stack.pop()
+                for child in node.children:
+                    compact.insert_after(index, child.label, last_child[index])
+                    stack.append((child, child.label))
+        return compact
+
+    def to_tree(self) -> Tree:
+        """Dựng lại Tree (TreeNode) từ dạng mảng, thêm nút vào tree_nodes theo thứ tự như Solution.tours_to_tree."""
+        tree = Tree(self.graph)
+        for vehicle_index in range(self.vehicle_num):
+            depot_index = self.depot(vehicle_index)
+            nodes = {}
+            for index in self.subtree(depot_index):
+                if index == depot_index:
+                    node = TreeNode(0)
+                    tree.root.add_child(node)
+                    tree.tree_nodes[f"depot_{vehicle_index}"] = node
+                    tree.vehicle_depots.append(node)
+                else:
+                    node = TreeNode(index)
+                    nodes[self.parent[index]].add_child(node)
+                    tree.tree_nodes[index] = node
+                nodes[index] = node
+        return tree
@@ -1,14 +1,25 @@
 import time
+from contextlib import contextmanager
 from abc import ABC, abstractmethod
 
 class CostCalculationEvent:
-    """Event class chứa thông tin về lần tính cost"""
+    """
+    Event class chứa thông tin về lần tính cost.
+    vehicle_list có thể được truyền vào dưới dạng hàm không tham số; danh sách xe chỉ được dựng
+    khi listener truy cập lần đầu (trong lúc được thông báo) và được giữ lại cho các lần sau.
+    """
     def __init__(self, graph, vehicle_list, cost, timestamp):
         self.graph = graph
-        self.vehicle_list = vehicle_list
+        self._vehicle_list = vehicle_list
         self.cost = cost
         self.timestamp = timestamp
 
+    @property
+    def vehicle_list(self):
+        if callable(self._vehicle_list):
+            self._vehicle_list = self._vehicle_list()
+        return self._vehicle_list
+
 class CostListener(ABC):
     """Interface cho các class muốn lắng nghe sự kiện tính cost"""
     @abstractmethod
@@ -42,6 +53,21 @@ class CostCalculator:
         """Xóa tất cả listeners"""
         cls._listeners.clear()
     
+    @classmethod
+    @contextmanager
+    def isolated(cls):
+        """
+        Tạm thời gỡ mọi listener hiện có: các lần đánh giá trong khối with (ví dụ trên bài toán con
+        của một xe, chi phí không phải của toàn bộ lời giải) chỉ đến các listener được thêm trong khối.
+        Khi thoát, danh sách listener ban đầu được khôi phục.
+        """
+        listeners = cls._listeners[:]
+        cls._listeners.clear()
+        try:
+            yield
+        finally:
+            cls._listeners[:] = listeners
+
     @classmethod
     def calculate(cls, graph, vehicle_list):
         """
@@ -50,7 +76,16 @@ class CostCalculator:
         # Gọi phương thức gốc để tính cost
         from Simulator.Solution import Solution
         cost = Solution._original_cal_cost_of_all_vehicle(graph, vehicle_list)
-        
+        return cls.report(graph, vehicle_list, cost)
+    
+    @classmethod
+    def report(cls, graph, vehicle_list, cost, count=1):
+        """
+        Ghi nhận một lần đánh giá mà chi phí đã được tính sẵn (ví dụ bằng đánh giá delta
+        trên từng xe) và thông báo cho tất cả listeners như calculate.
+        count > 1 ghi nhận nhiều lần đánh giá đã thực hiện ở nơi khác (ví dụ trong tiến trình con)
+        với cùng lời giải kết quả
+        """
         # Tạo event
         event = CostCalculationEvent(
             graph=graph,
@@ -60,7 +95,8 @@ class CostCalculator:
         )
         
         # Thông báo cho tất cả listeners
-        cls._notify_listeners(event)
+        for _ in range(count):
+            cls._notify_listeners(event)
         
         return cost
     
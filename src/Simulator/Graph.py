@@ -1,12 +1,35 @@
+import sys
 import numpy as np
+from typing import Optional
 from Simulator.Node import Node
 from Simulator.Request import Request
 
 class Graph:
-    def __init__(self, file_path, cd: float, xi: float, kappa: float, p: float, A: float, mk: float, g: float, cr: float, b1: float, b2: float, p1: float, p2: float, psi: float, pi: float, R: float, eta: float, rho, Q, v):
+    NODE_FIELDS = ('nid', 'x', 'y', 'demand', 'ready_time', 'due_time', 'service_time', 'pid', 'did')
+    INT_NODE_FIELDS = ('nid', 'pid', 'did')
+    FLOAT32_EPS = 2.0 ** -22
+    COST_PARAMS = ('cd', 'xi', 'kappa', 'p', 'A', 'mk', 'g', 'cr', 'b1', 'b2', 'p1', 'p2', 'psi', 'pi', 'R', 'eta', 'rho', 'Q', 'v')
+
+    def __init__(self, file_path, cd: float, xi: float, kappa: float, p: float, A: float, mk: float, g: float, cr: float, b1: float, b2: float, p1: float, p2: float, psi: float, pi: float, R: float, eta: float, rho, Q, v, cache: bool = False, cache_dir: Optional[str] = None, lean: bool = False):
+        """
+        Args:
+            file_path: Đường dẫn file dữ liệu
+            cache: Bật bộ nhớ đệm nhị phân trên đĩa (xem GraphCache)
+            cache_dir: Thư mục lưu bộ nhớ đệm, mặc định là thư mục chứa file dữ liệu
+            lean: Chế độ tiết kiệm bộ nhớ:
+                - count, pheromone_mat, heuristic_info_mat chỉ được cấp phát khi truy cập lần đầu
+                - dist và travel_time được lưu dạng float32
+                - dist_rows/travel_time_rows là memoryview theo dòng (không sao chép) thay vì list-of-lists
+
+                Sai số do float32: mỗi phần tử dist/travel_time có sai số tương đối không quá
+                FLOAT32_EPS = 2^-22 so với bản float64. Vì G > 0 và thời điểm đến là hàm max-plus
+                1-Lipschitz theo thời gian di chuyển, với một lộ trình:
+                    |Δ năng lượng| <= FLOAT32_EPS * năng lượng
+                    |Δ phạt|       <= p2 * FLOAT32_EPS * Σ_k C_k
+                trong đó C_k là tổng thời gian di chuyển từ đầu lộ trình tới nút thứ k
+                (xem float32_cost_bound).
+        """
         super()
-        self.num_node, self.nodes, self.dist, self.vehicle_num, self.vehicle_capacity, self.num_request, self.requests, self.node_request_id\
-            = self.creat_from_file(file_path)
         self.cd = cd
         self.p = p
         self.A = A 
@@ -25,49 +48,296 @@ class Graph:
         self.eta = eta
         self.rho = rho
         self.Q = Q
-        self.count = np.zeros((self.num_node, self.num_node))
-        self.pheromone_mat = np.ones((self.num_node, self.num_node))
-        self.heuristic_info_mat = 1 / self.dist
         self.v = v
+        self.lean = lean
+        self._count = None
+        self._pheromone_mat = None
+        self._heuristic_info_mat = None
+        if cache:
+            from Simulator.GraphCache import GraphCache
+            self.num_node, self.nodes, self.dist, self.vehicle_num, self.vehicle_capacity, self.num_request, self.requests, self.node_request_id, \
+                heuristic_info_mat = GraphCache.load(self, file_path, cache_dir)
+        else:
+            self.num_node, self.nodes, self.dist, self.vehicle_num, self.vehicle_capacity, self.num_request, self.requests, self.node_request_id\
+                = self.creat_from_file(file_path)
+            heuristic_info_mat = None
+        if lean:
+            self.dist = self.dist.astype(np.float32)
+        else:
+            self.heuristic_info_mat = 1 / self.dist if heuristic_info_mat is None else heuristic_info_mat
+            self.count = np.zeros((self.num_node, self.num_node))
+            self.pheromone_mat = np.ones((self.num_node, self.num_node))
+        self.build_cost_tables(row_lists=not lean)
+
+    # Các ma trận của ACO (count, pheromone_mat, heuristic_info_mat) được cấp phát khi truy cập lần đầu
+    @property
+    def count(self):
+        if self._count is None:
+            self._count = np.zeros((self.num_node, self.num_node))
+        return self._count
+
+    @count.setter
+    def count(self, value):
+        self._count = value
+
+    @property
+    def pheromone_mat(self):
+        if self._pheromone_mat is None:
+            self._pheromone_mat = np.ones((self.num_node, self.num_node))
+        return self._pheromone_mat
+
+    @pheromone_mat.setter
+    def pheromone_mat(self, value):
+        self._pheromone_mat = value
+
+    @property
+    def heuristic_info_mat(self):
+        if self._heuristic_info_mat is None:
+            self._heuristic_info_mat = 1 / self.dist
+        return self._heuristic_info_mat
+
+    @heuristic_info_mat.setter
+    def heuristic_info_mat(self, value):
+        self._heuristic_info_mat = value
+
+    @property
+    def route_cost_cache(self):
+        """Bộ nhớ đệm LRU chi phí theo lộ trình của graph (xem RouteCostCache), tạo khi dùng lần đầu."""
+        cache = self.__dict__.get('_route_cost_cache')
+        if cache is None:
+            from Simulator.RouteCostCache import RouteCostCache
+            cache = self._route_cost_cache = RouteCostCache(self)
+        return cache
+
+    @property
+    def route_batch(self):
+        """Tính chi phí nhiều lộ trình cùng lúc bằng NumPy (xem RouteBatch), tạo khi dùng lần đầu."""
+        batch = self.__dict__.get('_route_batch')
+        if batch is None:
+            from Simulator.RouteBatch import RouteBatch
+            batch = self._route_batch = RouteBatch(self)
+        return batch
+
+    @property
+    def lateness_bounds(self):
+        """Cận dưới thời gian trễ theo cặp yêu cầu (xem LatenessBounds), tính khi dùng lần đầu."""
+        bounds = self.__dict__.get('_lateness_bounds')
+        if bounds is None:
+            from Simulator.LatenessBounds import LatenessBounds
+            bounds = self._lateness_bounds = LatenessBounds(self)
+        return bounds
+
+    def request_neighbors(self, k):
+        """
+        Danh sách ứng viên (granular neighborhood) của từng yêu cầu: k yêu cầu gần nhất theo
+        dist(pickup, pickup) + dist(delivery, delivery), sắp xếp từ gần đến xa. Tính một lần cho mỗi k.
+
+        Returns:
+            list: Phần tử thứ r là danh sách ID các yêu cầu gần r nhất (phần tử 0 của depot rỗng)
+        """
+        neighbors_by_k = self.__dict__.setdefault('_request_neighbors', {})
+        neighbors = neighbors_by_k.get(k)
+        if neighbors is None:
+            count = min(k, self.num_request - 1)
+            pick_up_id = self.pick_up_id[1:]
+            delivery_id = self.delivery_id[1:]
+            proximity = self.dist[np.ix_(pick_up_id, pick_up_id)] + self.dist[np.ix_(delivery_id, delivery_id)]
+            np.fill_diagonal(proximity, np.inf)
+            neighbors = [[]]
+            if count > 0:
+                nearest = np.argpartition(proximity, count - 1, axis=1)[:, :count]
+                order = np.argsort(np.take_along_axis(proximity, nearest, axis=1), axis=1, kind='stable')
+                neighbors += (np.take_along_axis(nearest, order, axis=1) + 1).tolist()
+            else:
+                neighbors += [[] for _ in range(self.num_request)]
+            neighbors_by_k[k] = neighbors
+        return neighbors
+
+    def memory_footprint(self):
+        """
+        Ước lượng bộ nhớ (byte) mà Graph đang dùng, theo từng thành phần.
+        Các ma trận ACO chưa được cấp phát được tính là 0.
+
+        Returns:
+            dict: tên thành phần -> số byte, kèm khóa 'total'
+        """
+        footprint = {}
+        for name in ('dist', 'travel_time', '_count', '_pheromone_mat', '_heuristic_info_mat'):
+            array = getattr(self, name, None)
+            footprint[name.lstrip('_')] = 0 if array is None else array.nbytes
+        for name in ('dist_rows', 'travel_time_rows'):
+            rows = getattr(self, name)
+            footprint[name] = sys.getsizeof(rows) + sum(Graph._list_size(row) for row in rows)
+        footprint['node_columns'] = sum(getattr(self, field).nbytes + Graph._list_size(getattr(self, f"{field}_list"))
+                                        for field in Graph.NODE_FIELDS)
+        footprint['total'] = sum(footprint.values())
+        return footprint
+
+    @staticmethod
+    def _list_size(values):
+        if isinstance(values, list):
+            return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+        return sys.getsizeof(values)
+
+    def float32_cost_bound(self, travel_path):
+        """
+        Cận trên của chênh lệch chi phí giữa một lộ trình tính với dist/travel_time float32
+        (chế độ lean) và float64: FLOAT32_EPS * (p1 * năng lượng + p2 * Σ_k C_k).
+        """
+        energy = 0
+        cumulative_travel_time = 0
+        sum_cumulative_travel_time = 0
+        vehicle_load = 0
+        for current_ind, next_ind in zip(travel_path, travel_path[1:]):
+            energy += self.load_energy_coef[vehicle_load] * self.dist_rows[current_ind][next_ind]
+            vehicle_load += self.demand_list[next_ind]
+            cumulative_travel_time += self.travel_time_rows[current_ind][next_ind]
+            sum_cumulative_travel_time += cumulative_travel_time
+        # Cộng thêm một lượng nhỏ để bao cả sai số của chính phép tính cận bằng dist float32
+        return Graph.FLOAT32_EPS * (1 + Graph.FLOAT32_EPS) * (self.p1 * energy + self.p2 * sum_cumulative_travel_time)
+
+    def build_cost_tables(self, travel_time=None, row_lists: bool = True):
+        """
+        Tính trước các bảng dùng trong các hàm tính chi phí của Vehicle:
+        - travel_time: ma trận thời gian di chuyển dist / v * 60
+        - dist_rows, travel_time_rows: bản list-of-lists của dist và travel_time (truy cập nhanh hơn từ Python)
+        - energy_coef0, energy_coef1: hệ số năng lượng G = energy_coef0 + energy_coef1 * load
+        - load_energy_coef: bảng G theo tải, tính đúng theo công thức gốc nên cho kết quả giống hệt
+
+        Args:
+            travel_time: Ma trận thời gian di chuyển có sẵn (ví dụ nằm trong bộ nhớ dùng chung)
+            row_lists: False để dist_rows/travel_time_rows là memoryview theo dòng của mảng NumPy,
+                       không tạo bản sao list-of-lists (tiết kiệm bộ nhớ, truy cập chậm hơn một chút)
+        """
+        self.travel_time = self.dist / self.v * 60 if travel_time is None else travel_time
+        if row_lists:
+            self.dist_rows = self.dist.tolist()
+            self.travel_time_rows = self.travel_time.tolist()
+        else:
+            # memoryview của từng dòng trả về float Python khi truy cập phần tử, không sao chép dữ liệu
+            self.dist_rows = [memoryview(row) for row in self.dist]
+            self.travel_time_rows = [memoryview(row) for row in self.travel_time]
+        self.energy_coef0 = self.energy_coef(0)
+        self.energy_coef1 = self.xi / (self.kappa * self.psi) * self.g * self.cr * self.v / self.eta
+        self.load_energy_coef = LoadEnergyTable(self)
+
+    def energy_coef(self, vehicle_load):
+        """Hệ số năng lượng G trên một đơn vị quãng đường khi xe chở vehicle_load."""
+        T = 1/2 * self.cd * self.p * self.A * self.v ** 3 + (self.mk + vehicle_load) * self.g * self.cr * self.v
+        return self.xi / (self.kappa * self.psi) * (self.pi * self.R + T / self.eta)
+
+    def cost_params(self):
+        """Các tham số chi phí của đồ thị, dùng làm khóa cho bộ nhớ đệm."""
+        return {name: getattr(self, name) for name in Graph.COST_PARAMS}
             
+    def node_table(self):
+        """Ghép các cột dữ liệu nút thành bảng num_node x 9 như trong file dữ liệu."""
+        return np.column_stack([getattr(self, field) for field in Graph.NODE_FIELDS]).astype(float)
+
+    def request_table(self):
+        """Bảng yêu cầu (num_request + 1) x 3 gồm id, pickup, delivery."""
+        return np.column_stack([np.arange(self.num_request + 1), self.pick_up_id, self.delivery_id])
+
     def creat_from_file(self, file_path):
-        node_list = []
+        vehicle_num, vehicle_capacity, node_table = Graph.read_instance(file_path)
+        dist = Graph.build_dist_matrix(node_table[:, 1], node_table[:, 2])
+        request_table, node_request_id = Graph.build_request_table(node_table)
+        return self.assemble(node_table, request_table, node_request_id, dist, vehicle_num, vehicle_capacity)
+
+    def assemble(self, node_table, request_table, node_request_id, dist, vehicle_num, vehicle_capacity):
+        """
+        Tạo các cột dữ liệu của nút và yêu cầu cùng các khung nhìn Node/Request.
+
+        Với mỗi trường f trong NODE_FIELDS, graph có cột NumPy liên tục self.<f> và cột list
+        self.<f>_list (truy cập từng phần tử nhanh hơn trong vòng lặp Python). Tương tự cho
+        self.pick_up_id / self.delivery_id của các yêu cầu (dòng 0 là depot).
+
+        Returns:
+            tuple: Giống kết quả của creat_from_file
+        """
+        for column, field in enumerate(Graph.NODE_FIELDS):
+            values = node_table[:, column]
+            values = values.astype(int) if field in Graph.INT_NODE_FIELDS else np.ascontiguousarray(values)
+            setattr(self, field, values)
+            setattr(self, f"{field}_list", values.tolist())
+        self.pick_up_id = np.ascontiguousarray(request_table[:, 1])
+        self.delivery_id = np.ascontiguousarray(request_table[:, 2])
+        self.pick_up_id_list = self.pick_up_id.tolist()
+        self.delivery_id_list = self.delivery_id.tolist()
+
+        num_nodes = len(node_table)
+        nodes = [Node(self, i) for i in range(num_nodes)]
+        request_list = [Request(self, rid) for rid in range(len(request_table))]
+        num_request = len(request_list) - 1
+
+        return num_nodes, nodes, dist, vehicle_num, vehicle_capacity, num_request, request_list, np.asarray(node_request_id).tolist()
+
+    @staticmethod
+    def build_request_table(node_table):
+        """
+        Đánh số các yêu cầu theo thứ tự xuất hiện của nút pickup.
+
+        Returns:
+            tuple: (bảng yêu cầu (num_request + 1) x 3 gồm id, pickup, delivery với dòng 0 là depot,
+                    mảng node_request_id)
+        """
+        pickup_ids = np.flatnonzero(node_table[:, 3] > 0)
+        delivery_ids = node_table[pickup_ids, 8].astype(int)
+        request_ids = np.arange(1, len(pickup_ids) + 1)
+        request_table = np.zeros((len(pickup_ids) + 1, 3), dtype=int)
+        request_table[1:, 0] = request_ids
+        request_table[1:, 1] = pickup_ids
+        request_table[1:, 2] = delivery_ids
+        node_request_id = np.zeros(len(node_table), dtype=int)
+        node_request_id[pickup_ids] = request_ids
+        node_request_id[delivery_ids] = request_ids
+        return request_table, node_request_id
+
+    @staticmethod
+    def read_instance(file_path):
+        """
+        Đọc file dữ liệu Li & Lim vào mảng NumPy.
+
+        Args:
+            file_path: Đường dẫn file dữ liệu
+
+        Returns:
+            tuple: (số xe, tải trọng xe, bảng nút (num_node x 9) theo thứ tự cột
+                    id, x, y, demand, ready_time, due_time, service_time, pid, did)
+        """
         with open(file_path, 'rt') as f:
-            count = 1
-            for line in f:
-                if count == 1:
-                    vehicle_num, vehicle_capacity, vehicle_speed = line.split()
-                    vehicle_num = int(vehicle_num)
-                    vehicle_capacity = int(vehicle_capacity)
-                else:
-                    node_list.append(line.split())
-                count += 1
-        num_nodes = len(node_list)
-        nodes = list(Node(int(item[0]), float(item[1]), float(item[2]), float(item[3]), float(item[4]), float(item[5]), float(item[6]), int(item[7]), int(item[8])) for item in node_list)
-
-        dist = np.zeros((num_nodes, num_nodes))
-        num_request = 0
-        request_list = [Request(0,0,0)]
-        node_request_id = [0] * num_nodes
-        for i in range(num_nodes):
-            if nodes[i].demand > 0:
-                num_request += 1
-                node_request_id[i] = num_request
-                node_request_id[nodes[i].did] = num_request
-                request_list.append(Request(num_request,nodes[i].id,nodes[i].did))
-            node_a = nodes[i]
-            dist[i][i] = 1e-8
-            for j in range(i+1, num_nodes):
-                node_b = nodes[j]
-                dist[i][j] = Graph.calculate_dist(node_a, node_b)
-                if (dist[i][j] < 1e-8):
-                    dist[i][j] = 1e-8
-                #    dist[i][j] = float('inf')
-                dist[j][i] = dist[i][j]
-                
-        return num_nodes, nodes, dist, vehicle_num, vehicle_capacity, num_request, request_list, node_request_id
-
-                
+            vehicle_num, vehicle_capacity, vehicle_speed = f.readline().split()
+            node_table = np.loadtxt(f, dtype=float, ndmin=2)
+        return int(vehicle_num), int(vehicle_capacity), node_table
+
+    @staticmethod
+    def build_dist_matrix(x, y):
+        """
+        Xây dựng ma trận khoảng cách Euclid đầy đủ bằng phép toán mảng.
+        Các khoảng cách nhỏ hơn 1e-8 (kể cả đường chéo) được chặn dưới ở 1e-8.
+        """
+        dx = x[:, None] - x[None, :]
+        dy = y[:, None] - y[None, :]
+        dist = np.sqrt(dx * dx + dy * dy)
+        np.maximum(dist, 1e-8, out=dist)
+        return dist
+
     @staticmethod
     def calculate_dist(node_a, node_b):
         return np.linalg.norm((node_a.x - node_b.x, node_a.y - node_b.y))
+
+
+class LoadEnergyTable(dict):
+    """
+    Bảng tra hệ số năng lượng G theo tải của xe. Các mức tải nguyên từ 0 đến vehicle_capacity
+    được tính sẵn, các mức tải khác được tính khi cần và lưu lại.
+    """
+    def __init__(self, graph: Graph):
+        super().__init__()
+        self.graph = graph
+        for vehicle_load in range(graph.vehicle_capacity + 1):
+            self[vehicle_load] = graph.energy_coef(vehicle_load)
+
+    def __missing__(self, vehicle_load):
+        coef = self[vehicle_load] = self.graph.energy_coef(vehicle_load)
+        return coef
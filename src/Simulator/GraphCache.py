@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Optional
+
+import numpy as np
+from Simulator.Graph import Graph
+
+
+class GraphCache(object):
+    """
+    Bộ nhớ đệm nhị phân trên đĩa cho dữ liệu đã phân tích của Graph.
+
+    Mỗi bản ghi là một thư mục ``<tên file>-<băm đường dẫn>-<băm nội dung>-<băm tham số>`` chứa các mảng ``.npy`` (bảng nút, ma trận
+    khoảng cách, ma trận thông tin heuristic, bảng yêu cầu, node_request_id) và ``meta.json``.
+    Khóa gồm mã băm nội dung file dữ liệu và mã băm các tham số chi phí, nên file bị sửa sẽ tự
+    động được phân tích và ghi lại (bản ghi của nội dung cũ của cùng đường dẫn bị xóa; các file
+    cùng tên ở thư mục khác có mã băm đường dẫn riêng nên không xóa lẫn nhau). Các mảng được nạp ở chế độ memory-mapped copy-on-write:
+    vẫn ghi được như khi không dùng bộ nhớ đệm (ví dụ cập nhật heuristic_info_mat của ACO), thay đổi chỉ
+    nằm trong bộ nhớ của tiến trình và không ghi lại vào bản ghi.
+    """
+    FORMAT_VERSION = 1
+    ARRAYS = ('node_table', 'dist', 'heuristic_info_mat', 'request_table', 'node_request_id')
+
+    @staticmethod
+    def cache_key(file_path, cost_params):
+        """Trả về khóa ``<băm nội dung>-<băm tham số>`` của file dữ liệu."""
+        content = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                content.update(chunk)
+        params = hashlib.sha256(json.dumps({'version': GraphCache.FORMAT_VERSION, 'params': cost_params},
+                                           sort_keys=True).encode())
+        return f"{content.hexdigest()[:24]}-{params.hexdigest()[:12]}"
+
+    @staticmethod
+    def entry_path(file_path, key, cache_dir: Optional[str] = None):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.abspath(file_path)), '.graph_cache')
+        stem = os.path.splitext(os.path.basename(file_path))[0]
+        source = hashlib.sha256(os.path.abspath(file_path).encode()).hexdigest()[:12]
+        return os.path.join(cache_dir, f"{stem}-{source}-{key}")
+
+    @staticmethod
+    def load(graph, file_path, cache_dir: Optional[str] = None):
+        """
+        Nạp dữ liệu đồ thị từ bộ nhớ đệm, tạo mới nếu chưa có hoặc file đã thay đổi.
+
+        Args:
+            graph: Graph đang được khởi tạo (đã có các tham số chi phí)
+            file_path: Đường dẫn file dữ liệu
+            cache_dir: Thư mục lưu bộ nhớ đệm (mặc định ``.graph_cache`` cạnh file dữ liệu)
+
+        Returns:
+            tuple: Giống Graph.creat_from_file, thêm heuristic_info_mat ở cuối
+        """
+        key = GraphCache.cache_key(file_path, graph.cost_params())
+        entry = GraphCache.entry_path(file_path, key, cache_dir)
+        if GraphCache._is_valid(entry, key):
+            arrays, meta = GraphCache._read(entry)
+        else:
+            arrays, meta = GraphCache.build(file_path, entry, key)
+            # Nạp lại từ bản ghi (memory-mapped) nếu ghi được, nếu không thì dùng các mảng vừa phân tích
+            if GraphCache._is_valid(entry, key):
+                arrays, meta = GraphCache._read(entry)
+
+        return graph.assemble(arrays['node_table'], arrays['request_table'], arrays['node_request_id'], arrays['dist'],
+                              meta['vehicle_num'], meta['vehicle_capacity']) + (arrays['heuristic_info_mat'],)
+
+    @staticmethod
+    def _read(entry):
+        with open(os.path.join(entry, 'meta.json'), 'rt') as f:
+            meta = json.load(f)
+        arrays = {name: np.asarray(np.load(os.path.join(entry, f"{name}.npy"), mmap_mode='c'))
+                  for name in GraphCache.ARRAYS}
+        return arrays, meta
+
+    @staticmethod
+    def build(file_path, entry, key):
+        """
+        Phân tích file dữ liệu và ghi bản ghi bộ nhớ đệm một cách nguyên tử.
+
+        Returns:
+            tuple: (các mảng đã phân tích, meta) để dùng trực tiếp nếu bản ghi không ghi được
+        """
+        vehicle_num, vehicle_capacity, node_table = Graph.read_instance(file_path)
+        dist = Graph.build_dist_matrix(node_table[:, 1], node_table[:, 2])
+        request_table, node_request_id = Graph.build_request_table(node_table)
+        arrays = {
+            'node_table': node_table,
+            'dist': dist,
+            'heuristic_info_mat': 1 / dist,
+            'request_table': request_table,
+            'node_request_id': node_request_id,
+        }
+
+        parent = os.path.dirname(entry)
+        os.makedirs(parent, exist_ok=True)
+        meta = {'key': key, 'version': GraphCache.FORMAT_VERSION,
+                'vehicle_num': vehicle_num, 'vehicle_capacity': vehicle_capacity}
+        tmp = tempfile.mkdtemp(dir=parent, prefix='.tmp-')
+        try:
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp, f"{name}.npy"), array)
+            with open(os.path.join(tmp, 'meta.json'), 'wt') as f:
+                json.dump(meta, f)
+            GraphCache._remove_stale(entry)
+            # Bản ghi hỏng (ví dụ ghi dở) đang chiếm chỗ thì xóa để thay bằng bản mới
+            if os.path.isdir(entry) and not GraphCache._is_valid(entry, key):
+                shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.replace(tmp, entry)
+            except OSError:
+                # Một tiến trình khác vừa ghi cùng bản ghi (hoặc không thay được bản ghi cũ)
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return arrays, meta
+
+    @staticmethod
+    def _is_valid(entry, key):
+        try:
+            with open(os.path.join(entry, 'meta.json'), 'rt') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            return False
+        return meta.get('key') == key and all(
+            os.path.exists(os.path.join(entry, f"{name}.npy")) for name in GraphCache.ARRAYS)
+
+    @staticmethod
+    def _remove_stale(entry):
+        """Xóa các bản ghi của nội dung cũ của cùng file dữ liệu (cùng tên và cùng đường dẫn)."""
+        parent = os.path.dirname(entry)
+        stem, source, content, _ = os.path.basename(entry).rsplit('-', 3)
+        for name in os.listdir(parent):
+            parts = name.rsplit('-', 3)
+            if len(parts) == 4 and parts[0] == stem and parts[1] == source and parts[2] != content \
+                    and os.path.isdir(os.path.join(parent, name)):
+                shutil.rmtree(os.path.join(parent, name), ignore_errors=True)
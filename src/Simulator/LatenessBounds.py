@@ -0,0 +1,73 @@
+import numpy as np
+from Simulator.Graph import Graph
+
+
+class LatenessBounds(object):
+    """
+    Cận dưới tổng thời gian trễ do time window của từng cặp yêu cầu, tính trước từ ready_time,
+    due_time, service_time và ma trận thời gian di chuyển.
+
+    Lộ trình bắt đầu tại depot 0 lúc 0. Thời điểm đến một nút không giảm khi chen thêm nút khác vào
+    giữa (thời gian di chuyển thỏa bất đẳng thức tam giác và thời gian chờ không âm), nên thời điểm
+    đến sớm nhất tính trên riêng các nút của cặp yêu cầu là cận dưới trong mọi lộ trình chứa chúng
+    theo đúng thứ tự đó. Với a, b là ID yêu cầu:
+    - nesting[a][b]: b nằm trong cây con của a (pickup a, pickup b, delivery b, delivery a).
+      Dòng 0 (depot) là cận dưới của riêng b
+    - sequence[a][b]: a đứng trước b và không lồng nhau (pickup a, delivery a, pickup b, delivery b)
+
+    Một phép biến đổi tạo ra cặp (a, b) như vậy không thể cải thiện khi p2 * cận dưới đã không nhỏ
+    hơn tổng chi phí hiện tại của các xe bị ảnh hưởng (các xe khác giữ nguyên chi phí).
+    """
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        travel_time = graph.travel_time
+        ready_time = graph.ready_time
+        due_time = graph.due_time
+        service_time = graph.service_time
+        pick_up_id = graph.pick_up_id[1:]
+        delivery_id = graph.delivery_id[1:]
+
+        def visit(arrival_time, node_id):
+            # Thời gian trễ và thời điểm rời nút node_id khi đến lúc arrival_time
+            lateness = np.maximum(arrival_time - due_time[node_id], 0)
+            depart_time = np.maximum(arrival_time, ready_time[node_id]) + service_time[node_id]
+            return lateness, depart_time
+
+        # Dòng: yêu cầu a, cột: yêu cầu b
+        outer_pick = pick_up_id[:, None]
+        outer_delivery = delivery_id[:, None]
+        inner_pick = pick_up_id[None, :]
+        inner_delivery = delivery_id[None, :]
+
+        lateness_a, depart_a = visit(travel_time[0, outer_pick], outer_pick)
+
+        # a chứa b: pickup a -> pickup b -> delivery b -> delivery a
+        lateness_pb, depart = visit(depart_a + travel_time[outer_pick, inner_pick], inner_pick)
+        lateness_db, depart = visit(depart + travel_time[inner_pick, inner_delivery], inner_delivery)
+        lateness_da, _ = visit(depart + travel_time[inner_delivery, outer_delivery], outer_delivery)
+        nesting = lateness_a + lateness_pb + lateness_db + lateness_da
+
+        # a trước b: pickup a -> delivery a -> pickup b -> delivery b
+        lateness_da, depart = visit(depart_a + travel_time[outer_pick, outer_delivery], outer_delivery)
+        lateness_pb, depart = visit(depart + travel_time[outer_delivery, inner_pick], inner_pick)
+        lateness_db, _ = visit(depart + travel_time[inner_pick, inner_delivery], inner_delivery)
+        sequence = lateness_a + lateness_da + lateness_pb + lateness_db
+
+        # Riêng từng yêu cầu b (nằm dưới depot)
+        lateness_pb, depart = visit(travel_time[0, pick_up_id], pick_up_id)
+        lateness_db, _ = visit(depart + travel_time[pick_up_id, delivery_id], delivery_id)
+
+        num_request = graph.num_request
+        self.nesting = np.zeros((num_request + 1, num_request + 1))
+        self.nesting[0, 1:] = lateness_pb + lateness_db
+        self.nesting[1:, 1:] = nesting
+        self.sequence = np.zeros((num_request + 1, num_request + 1))
+        self.sequence[1:, 1:] = sequence
+
+    def nested(self, outer, inner):
+        """Cận dưới thời gian trễ khi yêu cầu inner nằm trong cây con của outer (outer = 0: depot)."""
+        return self.nesting.item(outer, inner)
+
+    def ordered(self, first, second):
+        """Cận dưới thời gian trễ khi yêu cầu first đứng trước yêu cầu second (không lồng nhau)."""
+        return self.sequence.item(first, second)
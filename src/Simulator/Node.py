@@ -1,26 +1,62 @@
 class Node(object):
-    def __init__(self, nid: int, x: float, y: float, demand: float, ready_time: float, due_time: float, service_time: float, pid: int, did: int):
-        """
-        Khởi tạo một nút trong đồ thị bài toán PDPTW.
-        
-        Args:
-            nid: ID của nút
-            x: Tọa độ x
-            y: Tọa độ y
-            demand: Nhu cầu hàng hóa (dương: pickup, âm: delivery)
-            ready_time: Thời gian bắt đầu cửa sổ thời gian
-            due_time: Thời gian kết thúc cửa sổ thời gian
-            service_time: Thời gian phục vụ tại nút
-            pid: ID của nút pickup tương ứng (nếu là nút delivery)
-            did: ID của nút delivery tương ứng (nếu là nút pickup)
-        """
-        super()
-        self.id = nid
-        self.x = x
-        self.y = y
-        self.demand = demand
-        self.ready_time = ready_time
-        self.due_time = due_time
-        self.service_time = service_time
-        self.pid = pid  # ID của nút pickup tương ứng
-        self.did = did  # ID của nút delivery tương ứng
\ No newline at end of file
+    """
+    Khung nhìn (view) tới một nút trong đồ thị bài toán PDPTW.
+
+    Dữ liệu của các nút được lưu theo cột trong Graph (xem Graph.NODE_FIELDS); Node chỉ giữ
+    tham chiếu tới graph và chỉ số của nút nên các đoạn mã cũ dùng graph.nodes[i].demand vẫn
+    hoạt động. Các vòng lặp nóng nên đọc trực tiếp các cột graph.demand_list, graph.pid_list, ...
+
+    Các thuộc tính:
+        id: ID của nút
+        x, y: Tọa độ
+        demand: Nhu cầu hàng hóa (dương: pickup, âm: delivery)
+        ready_time: Thời gian bắt đầu cửa sổ thời gian
+        due_time: Thời gian kết thúc cửa sổ thời gian
+        service_time: Thời gian phục vụ tại nút
+        pid: ID của nút pickup tương ứng (nếu là nút delivery)
+        did: ID của nút delivery tương ứng (nếu là nút pickup)
+    """
+    __slots__ = ('graph', 'index')
+
+    def __init__(self, graph, index: int):
+        self.graph = graph
+        self.index = index
+
+    @property
+    def id(self) -> int:
+        return self.graph.nid_list[self.index]
+
+    @property
+    def x(self) -> float:
+        return self.graph.x_list[self.index]
+
+    @property
+    def y(self) -> float:
+        return self.graph.y_list[self.index]
+
+    @property
+    def demand(self) -> float:
+        return self.graph.demand_list[self.index]
+
+    @property
+    def ready_time(self) -> float:
+        return self.graph.ready_time_list[self.index]
+
+    @property
+    def due_time(self) -> float:
+        return self.graph.due_time_list[self.index]
+
+    @property
+    def service_time(self) -> float:
+        return self.graph.service_time_list[self.index]
+
+    @property
+    def pid(self) -> int:
+        return self.graph.pid_list[self.index]  # ID của nút pickup tương ứng
+
+    @property
+    def did(self) -> int:
+        return self.graph.did_list[self.index]  # ID của nút delivery tương ứng
+
+    def __repr__(self) -> str:
+        return f"Node({self.id})"
@@ -1,14 +1,25 @@
 class Request(object):
-    def __init__(self, rid: int, pick_up_id, delivery_id):
-        """
-        Khởi tạo một yêu cầu vận chuyển (pickup-delivery).
-        
-        Args:
-            rid: ID của yêu cầu
-            pick_up_id: ID của nút pickup
-            delivery_id: ID của nút delivery
-        """
-        super()
+    """
+    Khung nhìn (view) tới một yêu cầu vận chuyển (pickup-delivery) lưu theo cột trong Graph.
+
+    Các thuộc tính:
+        id: ID của yêu cầu
+        pick_up_id: ID của nút pickup
+        delivery_id: ID của nút delivery
+    """
+    __slots__ = ('graph', 'id')
+
+    def __init__(self, graph, rid: int):
+        self.graph = graph
         self.id = rid
-        self.pick_up_id = pick_up_id
-        self.delivery_id = delivery_id
\ No newline at end of file
+
+    @property
+    def pick_up_id(self) -> int:
+        return self.graph.pick_up_id_list[self.id]
+
+    @property
+    def delivery_id(self) -> int:
+        return self.graph.delivery_id_list[self.id]
+
+    def __repr__(self) -> str:
+        return f"Request({self.id})"
@@ -0,0 +1,91 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+from Simulator.Graph import Graph
+
+
+class RouteBatch(object):
+    """
+    Tính chi phí của nhiều lộ trình cùng lúc bằng NumPy trên các cột của Graph.
+
+    Các lộ trình được đệm thành mảng m x L (phần thừa là depot 0, bị loại bằng mặt nạ độ dài):
+    - Tải sau mỗi nút là tổng tích lũy (cumsum) của demand theo dòng, năng lượng mỗi cạnh là
+      G(tải) * dist và được cộng dồn theo đúng thứ tự như Vehicle.cal_total_engine_energy_consumption
+    - Thời gian được lan truyền theo từng cột cho cả m lộ trình (max-plus: đến = rời + thời gian di
+      chuyển, rời = max(đến, ready) + service), thời gian trễ được cộng theo cột như
+      Vehicle.cal_total_penalty
+    - Khả thi về tải khi tải tích lũy không vượt vehicle_capacity ở mọi vị trí (thứ tự LIFO không
+      được kiểm tra ở đây)
+
+    Các phép tính giữ đúng thứ tự làm tròn của các hàm tuần tự nên kết quả bằng đúng
+    Vehicle.cal_total_all_cost của từng lộ trình.
+    """
+    def __init__(self, graph: Graph):
+        self.graph = graph
+
+    @staticmethod
+    def pad(travel_paths: Sequence[Sequence[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Đệm các lộ trình có độ dài khác nhau thành mảng m x L bằng depot 0.
+
+        Returns:
+            tuple: (mảng nút int m x L, mảng độ dài m)
+        """
+        lengths = np.fromiter((len(travel_path) for travel_path in travel_paths), dtype=np.int64,
+                              count=len(travel_paths))
+        nodes = np.zeros((len(travel_paths), int(lengths.max()) if len(travel_paths) else 0), dtype=np.int64)
+        for row, travel_path in enumerate(travel_paths):
+            nodes[row, :len(travel_path)] = travel_path
+        return nodes, lengths
+
+    def evaluate(self, travel_paths, lengths: Optional[np.ndarray] = None):
+        """
+        Chi phí năng lượng, chi phí phạt và khả thi về tải của từng lộ trình.
+
+        Args:
+            travel_paths: Danh sách lộ trình (độ dài tùy ý), hoặc mảng m x L đã đệm khi có lengths
+            lengths: Độ dài thật của từng dòng của travel_paths đã đệm (None: travel_paths chưa đệm)
+
+        Returns:
+            tuple: (năng lượng m, phạt m, khả thi về tải m) dạng mảng NumPy
+        """
+        if lengths is None:
+            nodes, lengths = RouteBatch.pad(travel_paths)
+        else:
+            nodes = np.asarray(travel_paths, dtype=np.int64)
+            lengths = np.asarray(lengths, dtype=np.int64)
+        graph = self.graph
+        num_route, max_length = nodes.shape
+        if max_length < 2:
+            zeros = np.zeros(num_route)
+            return zeros, zeros.copy(), np.ones(num_route, dtype=bool)
+
+        # Cạnh k nối nút k với nút k + 1, chỉ các cạnh k < độ dài - 1 là thật
+        current_nodes = nodes[:, :-1]
+        next_nodes = nodes[:, 1:]
+        valid = np.arange(max_length - 1)[None, :] < (lengths - 1)[:, None]
+
+        # Tải sau mỗi nút; cạnh k được đi với tải sau nút k
+        load = np.cumsum(graph.demand[nodes], axis=1)
+        feasible = (load <= graph.vehicle_capacity).all(axis=1)
+        edge_energy = graph.energy_coef(load[:, :-1]) * graph.dist[current_nodes, next_nodes]
+        energy = graph.p1 * np.cumsum(np.where(valid, edge_energy, 0.0), axis=1)[:, -1]
+
+        # Lan truyền thời gian theo từng cột cho mọi lộ trình
+        travel_time = graph.travel_time[current_nodes, next_nodes]
+        ready_time = graph.ready_time[next_nodes]
+        due_time = graph.due_time[next_nodes]
+        service_time = graph.service_time[next_nodes]
+        current_time = np.zeros(num_route)
+        total_lateness = np.zeros(num_route)
+        for k in range(max_length - 1):
+            arrival_time = current_time + travel_time[:, k]
+            total_lateness += np.where(valid[:, k], np.maximum(arrival_time - due_time[:, k], 0.0), 0.0)
+            current_time = arrival_time + np.maximum(ready_time[:, k] - arrival_time, 0.0) + service_time[:, k]
+        penalty = graph.p2 * total_lateness
+        return energy, penalty, feasible
+
+    def costs(self, travel_paths, lengths: Optional[np.ndarray] = None) -> np.ndarray:
+        """Tổng chi phí (năng lượng + phạt) của từng lộ trình, như Vehicle.cal_total_all_cost."""
+        energy, penalty, _ = self.evaluate(travel_paths, lengths)
+        return energy + penalty
@@ -0,0 +1,128 @@
+from collections import OrderedDict
+from Simulator.Vehicle import Vehicle
+
+
+class RouteCostCache(object):
+    """
+    Bộ nhớ đệm LRU cho chi phí của từng lộ trình, khóa theo nội dung lộ trình.
+
+    Mỗi mục lưu (chi phí năng lượng, chi phí phạt) của một travel_path. Một bước di chuyển trong
+    LocalSearch chỉ thay đổi tối đa hai lộ trình nên phần lớn các xe được lấy lại từ bộ nhớ đệm.
+    Mỗi Graph có một bộ nhớ đệm riêng (graph.route_cost_cache), dùng chung cho
+    CostCalculator.calculate (qua Solution._original_cal_cost_of_all_vehicle), VehicleCostTable,
+    Pertubation và RouteParallel. Initialize không dùng nó: các phép chèn được đánh giá bằng RouteState.
+    """
+    DEFAULT_CAPACITY = 100000
+    # Số lộ trình chưa có trong bộ nhớ đệm tối thiểu để tính bằng RouteBatch thay cho từng lộ trình
+    BATCH_MIN = 4
+
+    def __init__(self, graph, capacity: int = DEFAULT_CAPACITY):
+        self.graph = graph
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, travel_path):
+        """
+        Lấy chi phí của một lộ trình, tính và lưu lại nếu chưa có.
+
+        Returns:
+            tuple: (chi phí năng lượng, chi phí phạt)
+        """
+        key = tuple(travel_path)
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return entry
+
+        self.misses += 1
+        entry = (Vehicle.cal_total_engine_energy_consumption(self.graph, travel_path),
+                 Vehicle.cal_total_penalty(self.graph, travel_path))
+        self._store(key, entry)
+        return entry
+
+    def _store(self, key, entry):
+        if self.capacity > 0:
+            self.entries[key] = entry
+            if len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, travel_paths):
+        """
+        Như get cho nhiều lộ trình. Các lộ trình chưa có trong bộ nhớ đệm được tính cùng lúc bằng
+        graph.route_batch khi có từ BATCH_MIN lộ trình trở lên (kết quả giống hệt get).
+
+        Returns:
+            list: (chi phí năng lượng, chi phí phạt) của từng lộ trình
+        """
+        entries = self.entries
+        result = [None] * len(travel_paths)
+        missing = {}
+        for idx, travel_path in enumerate(travel_paths):
+            key = tuple(travel_path)
+            entry = entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entries.move_to_end(key)
+                result[idx] = entry
+            else:
+                missing.setdefault(key, []).append(idx)
+        if len(missing) < RouteCostCache.BATCH_MIN:
+            for indices in missing.values():
+                entry = self.get(travel_paths[indices[0]])
+                for idx in indices:
+                    result[idx] = entry
+            return result
+
+        self.misses += len(missing)
+        # Các lần lặp lại của một lộ trình trong cùng lô được tính là trúng như khi gọi get lần lượt
+        self.hits += sum(len(indices) - 1 for indices in missing.values())
+        keys = list(missing)
+        energy, penalty, _ = self.graph.route_batch.evaluate(keys)
+        for key, route_energy, route_penalty in zip(keys, energy.tolist(), penalty.tolist()):
+            entry = (route_energy, route_penalty)
+            self._store(key, entry)
+            for idx in missing[key]:
+                result[idx] = entry
+        return result
+
+    def costs(self, travel_paths):
+        """Tổng chi phí của từng lộ trình, xem get_many."""
+        return [engine_energy_consumption + penalty for engine_energy_consumption, penalty in self.get_many(travel_paths)]
+
+    def cost(self, travel_path):
+        """Tổng chi phí của lộ trình, giống Vehicle.cal_total_all_cost."""
+        engine_energy_consumption, penalty = self.get(travel_path)
+        return engine_energy_consumption + penalty
+
+    def resize(self, capacity: int) -> None:
+        """Đổi sức chứa, loại bỏ các mục ít được dùng gần đây nhất nếu cần."""
+        self.capacity = capacity
+        while len(self.entries) > max(capacity, 0):
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def stats(self):
+        """Thống kê sử dụng bộ nhớ đệm."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'size': len(self.entries),
+            'capacity': self.capacity,
+            'hit_rate': self.hit_rate(),
+        }
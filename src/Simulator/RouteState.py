@@ -0,0 +1,315 @@
+from typing import List
+from Simulator.Graph import Graph
+from Simulator.Solution import Solution
+
+
+class RouteState(object):
+    """
+    Trạng thái tiến (forward) của một lộ trình, dùng để đánh giá nhanh việc chèn một cặp
+    pickup-delivery mà không phải tính lại chi phí cả lộ trình.
+
+    Với mỗi vị trí k trong lộ trình, lưu:
+    - load[k]: tải của xe sau khi phục vụ nút thứ k
+    - energy[k]: năng lượng tích lũy (chưa nhân p1) từ đầu lộ trình đến nút thứ k
+    - arrival[k], depart[k]: thời điểm đến và thời điểm rời nút thứ k
+    - lateness[k]: tổng thời gian trễ tích lũy (chưa nhân p2) đến nút thứ k
+
+    Chi phí sau khi chèn được ghép từ trạng thái tiền tố, phần giữa (được lan truyền lại với tải
+    tăng thêm demand của pickup) và phần hậu tố. Ở phần hậu tố tải không đổi nên năng lượng được
+    lấy lại từ mảng tích lũy; thời gian chỉ được lan truyền lại cho đến khi trùng với thời gian cũ
+    (thời gian chờ hấp thụ phần trễ thêm), sau đó phần phạt còn lại không đổi.
+    Kết quả bằng Vehicle.cal_total_all_cost của lộ trình mới, sai khác tối đa do làm tròn số thực.
+    """
+    def __init__(self, graph: Graph, travel_path: List[int]):
+        self.graph = graph
+        self.travel_path = travel_path
+
+        dist = graph.dist_rows
+        travel_time = graph.travel_time_rows
+        demand = graph.demand_list
+        ready_time = graph.ready_time_list
+        due_time = graph.due_time_list
+        service_time = graph.service_time_list
+        load_energy_coef = graph.load_energy_coef
+
+        vehicle_load = 0
+        engine_energy_consumption = 0
+        current_time = 0
+        total_lateness = 0
+        self.load = [0]
+        self.energy = [0]
+        self.arrival = [0]
+        self.depart = [0]
+        self.lateness = [0]
+        current_ind = travel_path[0]
+        for next_ind in travel_path[1:]:
+            engine_energy_consumption += load_energy_coef[vehicle_load] * dist[current_ind][next_ind]
+            vehicle_load += demand[next_ind]
+            arrival_time = current_time + travel_time[current_ind][next_ind]
+            if arrival_time > due_time[next_ind]:
+                total_lateness += arrival_time - due_time[next_ind]
+            current_time = max(arrival_time, ready_time[next_ind]) + service_time[next_ind]
+            self.load.append(vehicle_load)
+            self.energy.append(engine_energy_consumption)
+            self.arrival.append(arrival_time)
+            self.depart.append(current_time)
+            self.lateness.append(total_lateness)
+            current_ind = next_ind
+
+        self.cost = graph.p1 * engine_energy_consumption + graph.p2 * total_lateness
+        self._build_nesting()
+
+    def _build_nesting(self):
+        """
+        Dựng cấu trúc lồng nhau LIFO của lộ trình:
+        - match[k]: vị trí delivery tương ứng nếu nút thứ k là pickup, ngược lại -1
+        - peak[k]: tải lớn nhất trong đoạn k..match[k] nếu nút thứ k là pickup
+        lifo_feasible = False nếu lộ trình hiện tại vi phạm LIFO hoặc tải trọng, khi đó
+        việc liệt kê vị trí chèn quay về duyệt toàn bộ và kiểm tra tính khả thi.
+        """
+        graph = self.graph
+        demand = graph.demand_list
+        pid = graph.pid_list
+        travel_path = self.travel_path
+        load = self.load
+        num_pos = len(travel_path)
+
+        self.match = [-1] * num_pos
+        self.peak = [0] * num_pos
+        self.lifo_feasible = True
+        stack = []  # Vị trí các pickup chưa được giao
+        peak_stack = []  # Tải lớn nhất trong đoạn đang mở tương ứng
+        for k in range(1, num_pos - 1):
+            node = travel_path[k]
+            if load[k] > graph.vehicle_capacity:
+                self.lifo_feasible = False
+            if demand[node] > 0:
+                stack.append(k)
+                peak_stack.append(load[k])
+            else:
+                if not stack or pid[node] != travel_path[stack[-1]]:
+                    self.lifo_feasible = False
+                    return
+                start = stack.pop()
+                peak = peak_stack.pop()
+                self.match[start] = k
+                self.peak[start] = peak
+                if peak_stack and peak > peak_stack[-1]:
+                    peak_stack[-1] = peak
+        if stack:
+            self.lifo_feasible = False
+
+    def insertion_positions(self, pickup):
+        """
+        Liệt kê các cặp vị trí (pickup_pos, delivery_pos) giữ được ràng buộc LIFO và tải trọng.
+
+        Phần giữa pickup và delivery phải là một dãy các cây con hoàn chỉnh (dãy cân bằng) bắt đầu
+        ngay sau pickup, nên các vị trí delivery được sinh bằng cách nhảy qua từng cây con anh em
+        qua match. Tải của các nút trong phần giữa tăng thêm demand của pickup, nên dừng khi tải
+        lớn nhất của cây con tiếp theo vượt vehicle_capacity.
+
+        Returns:
+            list: Các cặp (pickup_pos, danh sách delivery_pos) theo quy ước list.insert liên tiếp
+        """
+        graph = self.graph
+        demand = graph.demand_list
+        capacity = graph.vehicle_capacity - demand[pickup]
+        travel_path = self.travel_path
+        load = self.load
+        match = self.match
+        peak = self.peak
+        num_pos = len(travel_path)
+
+        positions = []
+        for i in range(1, num_pos):
+            if load[i - 1] > capacity:
+                continue
+            delivery_positions = [i + 1]
+            k = i
+            while k < num_pos - 1 and demand[travel_path[k]] > 0 and peak[k] <= capacity:
+                k = match[k] + 1
+                delivery_positions.append(k + 1)
+            positions.append((i, delivery_positions))
+        return positions
+
+    def _suffix_lateness_delta(self, prev_ind, current_time, start):
+        """
+        Lan truyền lại thời gian cho phần hậu tố bắt đầu từ vị trí start của lộ trình cũ,
+        khi xe rời nút prev_ind tại thời điểm current_time. Dừng ngay khi thời gian trùng
+        với lộ trình cũ.
+
+        Returns:
+            float: Chênh lệch tổng thời gian trễ của phần hậu tố so với lộ trình cũ
+        """
+        graph = self.graph
+        travel_time = graph.travel_time_rows
+        ready_time = graph.ready_time_list
+        due_time = graph.due_time_list
+        service_time = graph.service_time_list
+        travel_path = self.travel_path
+        arrival = self.arrival
+        depart = self.depart
+
+        delta = 0
+        for k in range(start, len(travel_path)):
+            next_ind = travel_path[k]
+            arrival_time = current_time + travel_time[prev_ind][next_ind]
+            if arrival_time == arrival[k]:
+                break
+            due = due_time[next_ind]
+            if arrival_time > due:
+                delta += arrival_time - due
+            if arrival[k] > due:
+                delta -= arrival[k] - due
+            ready = ready_time[next_ind]
+            current_time = (arrival_time if arrival_time > ready else ready) + service_time[next_ind]
+            if current_time == depart[k]:
+                break
+            prev_ind = next_ind
+        return delta
+
+    def insertion_cost(self, pickup, delivery, pickup_pos, delivery_pos):
+        """
+        Chi phí của lộ trình sau khi chèn pickup tại pickup_pos rồi delivery tại delivery_pos
+        (cùng quy ước với list.insert liên tiếp như trong Initialize).
+        """
+        best = self._scan_insertions(pickup, delivery, [(pickup_pos, [delivery_pos])], float('inf'), None, prune=False)
+        return best[0] + self.cost
+
+    def best_insertion(self, pickup, delivery, bound=float('inf'), check_feasible=True):
+        """
+        Tìm vị trí chèn cặp (pickup, delivery) có chi phí tăng thêm nhỏ nhất và nhỏ hơn bound.
+
+        Args:
+            pickup, delivery: ID các nút cần chèn
+            bound: Chỉ chấp nhận vị trí có chi phí tăng thêm nhỏ hơn bound
+            check_feasible: Chỉ xét các vị trí giữ được ràng buộc tải trọng và LIFO. Nếu lộ trình hiện tại
+                đã vi phạm ràng buộc thì duyệt mọi vị trí và kiểm tra tính khả thi của ứng viên được chọn
+
+        Returns:
+            tuple: (chi phí tăng thêm, pickup_pos, delivery_pos), pickup_pos = -1 nếu không tìm thấy
+        """
+        feasible = None
+        if check_feasible and self.lifo_feasible:
+            positions = self.insertion_positions(pickup)
+        else:
+            num_pos = len(self.travel_path)
+            positions = [(i, range(i + 1, num_pos + 1)) for i in range(1, num_pos)]
+            if check_feasible:
+                feasible = self._is_feasible
+        return self._scan_insertions(pickup, delivery, positions, bound, feasible)
+
+    def _is_feasible(self, pickup, delivery, pickup_pos, delivery_pos):
+        new_route = self.travel_path.copy()
+        new_route.insert(pickup_pos, pickup)
+        new_route.insert(delivery_pos, delivery)
+        return Solution.is_travel_path_feasible(self.graph, new_route)
+
+    def _scan_insertions(self, pickup, delivery, positions, bound, feasible, prune=True):
+        graph = self.graph
+        dist = graph.dist_rows
+        travel_time = graph.travel_time_rows
+        ready_time = graph.ready_time_list
+        due_time = graph.due_time_list
+        service_time = graph.service_time_list
+        load_energy_coef = graph.load_energy_coef
+        p1 = graph.p1
+        p2 = graph.p2
+        travel_path = self.travel_path
+        load = self.load
+        energy = self.energy
+        arrival = self.arrival
+        depart = self.depart
+        lateness = self.lateness
+        end = len(travel_path) - 1
+        total_energy = energy[end]
+        total_lateness = lateness[end]
+        pickup_demand = graph.demand_list[pickup]
+        ready_d = ready_time[delivery]
+        due_d = due_time[delivery]
+        service_d = service_time[delivery]
+
+        best_increase, best_pickup_pos, best_delivery_pos = bound, -1, -1
+        for i, delivery_positions in positions:
+            # Tiền tố đến nút i - 1, sau đó là nút pickup
+            prev_ind = travel_path[i - 1]
+            base_load = load[i - 1]
+            inner_energy = energy[i - 1] + load_energy_coef[base_load] * dist[prev_ind][pickup]
+            arrival_time = depart[i - 1] + travel_time[prev_ind][pickup]
+            inner_lateness = lateness[i - 1]
+            if arrival_time > due_time[pickup]:
+                inner_lateness += arrival_time - due_time[pickup]
+            ready = ready_time[pickup]
+            current_time = (arrival_time if arrival_time > ready else ready) + service_time[pickup]
+            last_ind = pickup
+            # Phần giữa đã lan truyền lại gồm các nút cũ ở vị trí i..m - 1
+            m = i
+            for j in delivery_positions:
+                # Phần giữa của lộ trình mới là các nút cũ ở vị trí i..j - 2
+                while m <= j - 2:
+                    next_ind = travel_path[m]
+                    inner_energy += load_energy_coef[load[m - 1] + pickup_demand] * dist[last_ind][next_ind]
+                    arrival_time = current_time + travel_time[last_ind][next_ind]
+                    if arrival_time > due_time[next_ind]:
+                        inner_lateness += arrival_time - due_time[next_ind]
+                    ready = ready_time[next_ind]
+                    current_time = (arrival_time if arrival_time > ready else ready) + service_time[next_ind]
+                    last_ind = next_ind
+                    m += 1
+
+                if j > i + 1:
+                    # Với khoảng cách Euclid (bất đẳng thức tam giác), chèn thêm nút chỉ làm tăng năng lượng
+                    # và làm xe đến muộn hơn, nên phần tăng đến hết phần giữa là cận dưới của chi phí tăng thêm.
+                    # Cận này không giảm khi j tăng nên có thể dừng duyệt j.
+                    if prune and p1 * (inner_energy - energy[j - 2]) \
+                            + p2 * (inner_lateness - lateness[j - 2]) >= best_increase:
+                        break
+                    base_load = load[j - 2]
+                else:
+                    base_load = load[i - 1]
+
+                # Nút delivery
+                next_ind = travel_path[j - 1]
+                new_energy = inner_energy + load_energy_coef[base_load + pickup_demand] * dist[last_ind][delivery] \
+                    + load_energy_coef[base_load] * dist[delivery][next_ind] + (total_energy - energy[j - 1])
+                arrival_time = current_time + travel_time[last_ind][delivery]
+                new_lateness = inner_lateness
+                if arrival_time > due_d:
+                    new_lateness += arrival_time - due_d
+                delivery_time = (arrival_time if arrival_time > ready_d else ready_d) + service_d
+                new_lateness += total_lateness - lateness[j - 2]
+
+                cost_increase = p1 * new_energy + p2 * new_lateness - self.cost
+                if prune and cost_increase >= best_increase:
+                    continue
+                # Hậu tố từ nút cũ ở vị trí j - 1
+                cost_increase += p2 * self._suffix_lateness_delta(delivery, delivery_time, j - 1)
+                if cost_increase < best_increase and (feasible is None or feasible(pickup, delivery, i, j)):
+                    best_increase, best_pickup_pos, best_delivery_pos = cost_increase, i, j
+
+        return best_increase, best_pickup_pos, best_delivery_pos
+
+    @staticmethod
+    def cheapest_insertion(route_states, pickup, delivery):
+        """
+        Chèn rẻ nhất một yêu cầu vào một trong các lộ trình.
+
+        Args:
+            route_states: Danh sách RouteState của các xe
+            pickup, delivery: ID các nút của yêu cầu
+
+        Returns:
+            tuple: (chỉ số xe hoặc None, pickup_pos, delivery_pos, chi phí tăng thêm)
+        """
+        best_cost_increase = float('inf')
+        best_vehicle = None
+        best_pickup_pos = -1
+        best_delivery_pos = -1
+        for vehicle_idx, state in enumerate(route_states):
+            cost_increase, pickup_pos, delivery_pos = state.best_insertion(pickup, delivery, best_cost_increase)
+            if pickup_pos != -1:
+                best_cost_increase = cost_increase
+                best_vehicle = vehicle_idx
+                best_pickup_pos = pickup_pos
+                best_delivery_pos = delivery_pos
+        return best_vehicle, best_pickup_pos, best_delivery_pos, best_cost_increase
@@ -0,0 +1,99 @@
+from bisect import bisect_left
+from copy import copy
+from itertools import accumulate
+from typing import List
+from Simulator.Graph import Graph
+
+
+class SegmentSummary(object):
+    """
+    Tóm tắt một đoạn lộ trình liên tiếp (đoạn pickup...delivery của một cây con) để ghép đoạn
+    (segment concatenation) mà không phải duyệt lại từng nút.
+
+    Với t là thời điểm đến nút đầu tiên của đoạn và L là tải của xe khi đi vào đoạn:
+    - Thời điểm rời nút cuối: max(t + duration, earliest_depart)
+    - Năng lượng (chưa nhân p1): G(L) * dist + energy_coef1 * load_dist, vì G tuyến tính theo tải
+      (dist là tổng quãng đường, load_dist là tổng quãng đường nhân tải tương đối so với L)
+    - Tổng thời gian trễ (chưa nhân p2): lateness_base + sum(max(0, t - z) với z trong breakpoints).
+      Thời gian trễ tại nút k là max(e_k, t - c_k), viết lại thành e_k + max(0, t - (c_k + e_k))
+    - Tải lớn nhất trong đoạn là L + peak_load, tải khi ra khỏi đoạn là L + net_load
+    """
+    __slots__ = ('first', 'last', 'dist', 'load_dist', 'net_load', 'peak_load',
+                 'duration', 'earliest_depart', 'lateness_base', 'breakpoints', 'breakpoint_sums')
+
+    def __init__(self, graph: Graph, node_id):
+        # Đoạn chỉ gồm một nút
+        self.first = node_id
+        self.last = node_id
+        self.dist = 0
+        self.load_dist = 0
+        self.net_load = graph.demand_list[node_id]
+        self.peak_load = max(0, self.net_load)
+        self.duration = graph.service_time_list[node_id]
+        self.earliest_depart = graph.ready_time_list[node_id] + graph.service_time_list[node_id]
+        self.lateness_base = 0
+        self.breakpoints: List[float] = [graph.due_time_list[node_id]]
+        self.breakpoint_sums: List[float] = [0, graph.due_time_list[node_id]]
+
+    def lateness(self, arrival_time):
+        """Tổng thời gian trễ của đoạn khi đến nút đầu tiên tại arrival_time."""
+        k = bisect_left(self.breakpoints, arrival_time)
+        return self.lateness_base + k * arrival_time - self.breakpoint_sums[k]
+
+    def depart_time(self, arrival_time):
+        """Thời điểm rời nút cuối của đoạn khi đến nút đầu tiên tại arrival_time."""
+        depart = arrival_time + self.duration
+        return depart if depart > self.earliest_depart else self.earliest_depart
+
+    def _extend(self, graph: Graph, child: 'SegmentSummary') -> List[float]:
+        """
+        Nối đoạn child vào sau đoạn này (sửa tại chỗ mọi trường trừ breakpoints).
+
+        Returns:
+            list: Các breakpoint của child đã quy đổi theo thời điểm đến nút đầu của đoạn này
+        """
+        edge_dist = graph.dist_rows[self.last][child.first]
+        edge_time = graph.travel_time_rows[self.last][child.first]
+        self.dist += edge_dist + child.dist
+        self.load_dist += self.net_load * (edge_dist + child.dist) + child.load_dist
+        if self.net_load + child.peak_load > self.peak_load:
+            self.peak_load = self.net_load + child.peak_load
+        self.net_load += child.net_load
+
+        # Thời điểm đến nút đầu của đoạn con là max(t + shift, floor) theo t của đoạn hiện tại
+        shift = self.duration + edge_time
+        floor = self.earliest_depart + edge_time
+        # max(e, u - c) với u = max(t + shift, floor): e tăng thêm max(0, floor - z),
+        # breakpoint z thành max(z, floor) - shift (giữ nguyên thứ tự)
+        k = bisect_left(child.breakpoints, floor)
+        self.lateness_base += child.lateness_base + k * floor - child.breakpoint_sums[k]
+
+        depart = floor + child.duration
+        self.earliest_depart = depart if depart > child.earliest_depart else child.earliest_depart
+        self.duration = shift + child.duration
+        self.last = child.last
+        return [(z if z > floor else floor) - shift for z in child.breakpoints]
+
+    @staticmethod
+    def chain(graph: Graph, summaries: List['SegmentSummary']) -> 'SegmentSummary':
+        """Tóm tắt của các đoạn summaries đi nối tiếp nhau theo thứ tự (không sửa các đoạn đã cho)."""
+        summary = copy(summaries[0])
+        breakpoints = [summary.breakpoints]
+        for child in summaries[1:]:
+            breakpoints.append(summary._extend(graph, child))
+        summary.breakpoints = sorted(z for part in breakpoints for z in part)
+        summary.breakpoint_sums = [0] + list(accumulate(summary.breakpoints))
+        return summary
+
+    @staticmethod
+    def of_path(graph: Graph, travel_path: List[int]) -> 'SegmentSummary':
+        """Tóm tắt của một đoạn lộ trình bất kỳ (danh sách ID nút)."""
+        return SegmentSummary.chain(graph, [SegmentSummary(graph, node_id) for node_id in travel_path])
+
+    @staticmethod
+    def concatenate(graph: Graph, node_id, child_summaries: List['SegmentSummary']) -> 'SegmentSummary':
+        """
+        Tóm tắt của cây con có nút yêu cầu node_id: pickup, các cây con theo thứ tự, rồi delivery.
+        """
+        return SegmentSummary.chain(graph, [SegmentSummary(graph, graph.pick_up_id_list[node_id])] + child_summaries
+                                    + [SegmentSummary(graph, graph.delivery_id_list[node_id])])
@@ -0,0 +1,158 @@
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict
+
+import numpy as np
+from Simulator.Graph import Graph
+
+
+class SharedGraphHandle(object):
+    """
+    Mô tả nhỏ gọn (picklable) của một Graph đã được đưa vào bộ nhớ dùng chung.
+    Được truyền cho các tiến trình con để gọi SharedGraph.attach.
+    """
+    def __init__(self, blocks, cost_params, vehicle_num, vehicle_capacity, lazy=()):
+        self.blocks = blocks  # tên mảng -> (tên vùng nhớ dùng chung, shape, dtype)
+        self.lazy = tuple(lazy)  # các ma trận cấp phát khi dùng chưa được tạo ở tiến trình chủ (không publish)
+        self.cost_params = cost_params
+        self.vehicle_num = vehicle_num
+        self.vehicle_capacity = vehicle_capacity
+
+    @property
+    def key(self):
+        return self.blocks['dist'][0]
+
+
+class SharedGraph(object):
+    """
+    Đưa một Graph vào multiprocessing.shared_memory một lần để các tiến trình con gắn vào
+    ở chế độ chỉ đọc mà không phải pickle hay dựng lại các ma trận n x n.
+
+    Cách dùng:
+        with SharedGraph(graph) as handle:
+            with Pool(initializer=SharedGraph.attach, initargs=(handle,)) as pool:
+                ...  # trong worker: graph = SharedGraph.attach(handle)
+
+    Khi thoát khỏi khối with, các vùng nhớ dùng chung được đóng và giải phóng.
+    Graph trong tiến trình con không tạo bản sao list-of-lists của các ma trận (row_lists=False)
+    nên bộ nhớ dùng thêm cho mỗi worker chỉ là O(num_node).
+    """
+    MATRICES = ('dist', 'travel_time', 'pheromone_mat', 'count', 'heuristic_info_mat')
+    LAZY_MATRICES = ('pheromone_mat', 'count', 'heuristic_info_mat')
+
+    # Các Graph đã gắn trong tiến trình hiện tại, theo khóa của handle
+    _attached: Dict[str, Graph] = {}
+    _attached_blocks: Dict[str, list] = {}
+
+    def __init__(self, graph: Graph):
+        self.graph = graph
+        self.handle = None
+        self._blocks = []
+
+    def __enter__(self) -> SharedGraphHandle:
+        return self.publish()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    def publish(self) -> SharedGraphHandle:
+        """Sao chép các mảng của graph vào bộ nhớ dùng chung và trả về handle."""
+        if self.handle is not None:
+            return self.handle
+        # Các ma trận của ACO chưa được cấp phát thì không publish, để không buộc graph (lean) phải tạo chúng
+        lazy = [name for name in SharedGraph.LAZY_MATRICES if self.graph.__dict__.get('_' + name) is None]
+        arrays = {name: getattr(self.graph, name) for name in SharedGraph.MATRICES if name not in lazy}
+        arrays['node_table'] = self.graph.node_table()
+        arrays['request_table'] = self.graph.request_table()
+        arrays['node_request_id'] = np.asarray(self.graph.node_request_id)
+
+        blocks = {}
+        try:
+            for name, array in arrays.items():
+                array = np.ascontiguousarray(array)
+                shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+                self._blocks.append(shm)
+                np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+                blocks[name] = (shm.name, array.shape, array.dtype.str)
+        except BaseException:
+            self.close()
+            raise
+
+        self.handle = SharedGraphHandle(blocks, self.graph.cost_params(),
+                                        self.graph.vehicle_num, self.graph.vehicle_capacity, lazy)
+        return self.handle
+
+    def close(self):
+        """Đóng và giải phóng các vùng nhớ dùng chung đã tạo."""
+        for shm in self._blocks:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._blocks = []
+        self.handle = None
+
+    @staticmethod
+    def attach(handle: SharedGraphHandle) -> Graph:
+        """
+        Gắn vào Graph đã được publish. Mỗi tiến trình chỉ gắn một lần cho mỗi handle,
+        các lần gọi sau trả về cùng đối tượng Graph.
+
+        Returns:
+            Graph: Graph có các ma trận là khung nhìn chỉ đọc vào bộ nhớ dùng chung
+        """
+        graph = SharedGraph._attached.get(handle.key)
+        if graph is not None:
+            return graph
+
+        blocks = []
+        arrays = {}
+        for name, (shm_name, shape, dtype) in handle.blocks.items():
+            shm = SharedGraph._open_block(shm_name)
+            blocks.append(shm)
+            array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+            array.setflags(write=False)
+            arrays[name] = array
+
+        graph = Graph.__new__(Graph)
+        for name, value in handle.cost_params.items():
+            setattr(graph, name, value)
+        graph.lean = arrays['dist'].dtype == np.float32
+        graph.num_node, graph.nodes, graph.dist, graph.vehicle_num, graph.vehicle_capacity, graph.num_request, \
+            graph.requests, graph.node_request_id = graph.assemble(
+                arrays['node_table'], arrays['request_table'], arrays['node_request_id'], arrays['dist'],
+                handle.vehicle_num, handle.vehicle_capacity)
+        # Ma trận không được publish vẫn được cấp phát khi dùng lần đầu trong tiến trình con
+        for name in SharedGraph.LAZY_MATRICES:
+            setattr(graph, name, arrays.get(name))
+        graph.build_cost_tables(travel_time=arrays['travel_time'], row_lists=False)
+
+        SharedGraph._attached[handle.key] = graph
+        SharedGraph._attached_blocks[handle.key] = blocks
+        return graph
+
+    @staticmethod
+    def detach(handle: SharedGraphHandle) -> None:
+        """Bỏ Graph đã gắn trong tiến trình hiện tại (không giải phóng vùng nhớ của tiến trình chủ)."""
+        graph = SharedGraph._attached.pop(handle.key, None)
+        if graph is not None:
+            # Các khung nhìn phải được giải phóng trước khi đóng vùng nhớ
+            graph.__dict__.clear()
+        for shm in SharedGraph._attached_blocks.pop(handle.key, []):
+            shm.close()
+
+    @staticmethod
+    def _open_block(shm_name):
+        try:
+            return shared_memory.SharedMemory(name=shm_name, track=False)
+        except TypeError:
+            pass
+        # Python < 3.13 không có track=False: tạm tắt việc đăng ký với resource_tracker để vùng nhớ
+        # không bị giải phóng khi tiến trình gắn vào kết thúc (chỉ tiến trình chủ được unlink)
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=shm_name)
+        finally:
+            resource_tracker.register = register
@@ -14,8 +14,8 @@ class Solution(object):
     @staticmethod
     def _original_cal_cost_of_all_vehicle(graph, vehicle_list):
         cost = 0
-        for vehicle in vehicle_list:
-            cost += Vehicle.cal_total_all_cost(graph, vehicle.travel_path)
+        for vehicle_cost in graph.route_cost_cache.costs([vehicle.travel_path for vehicle in vehicle_list]):
+            cost += vehicle_cost
         return cost
     
     
@@ -60,21 +60,24 @@ class Solution(object):
         """
         capacity = 0  # Tải hiện tại
         current_delivery = []  # Stack cho thứ tự giao hàng (LIFO)
+        demand = graph.demand_list
+        pid = graph.pid_list
+        vehicle_capacity = graph.vehicle_capacity
         
         for index, current_index in enumerate(travel_path):
             # Kiểm tra thứ tự pickup-delivery
             if current_index != 0:  # Không phải depot
-                if graph.nodes[current_index].demand > 0:  # Pickup
+                if demand[current_index] > 0:  # Pickup
                     current_delivery.append(current_index)
                 else:  # Delivery
                     # Kiểm tra nếu delivery này tương ứng với pickup gần nhất (LIFO)
-                    if not current_delivery or graph.nodes[current_index].pid != current_delivery[-1]:
+                    if not current_delivery or pid[current_index] != current_delivery[-1]:
                         return False  # Vi phạm ràng buộc LIFO
                     current_delivery.pop()
                 
             # Kiểm tra ràng buộc dung lượng
-            capacity += graph.nodes[current_index].demand
-            if capacity > graph.vehicle_capacity:
+            capacity += demand[current_index]
+            if capacity > vehicle_capacity:
                 return False  # Vi phạm ràng buộc dung lượng
                 
         # Đảm bảo tất cả pickup đã được delivery
@@ -86,18 +89,20 @@ class Solution(object):
     @staticmethod
     def tours_to_tree(solution) -> Tree:
         tree = Tree(solution.graph)
+        pid = solution.graph.pid_list
+        node_request_id = solution.graph.node_request_id
         cur_node = tree.root
         for vehicle_index, vehicle in enumerate(solution.vehicle_list):
             for idx, current_index in enumerate(vehicle.travel_path):
-                if (solution.graph.nodes[current_index].pid == 0 and idx != len(vehicle.travel_path) - 1):
-                    next_node = TreeNode(solution.graph.node_request_id[current_index])
+                if (pid[current_index] == 0 and idx != len(vehicle.travel_path) - 1):
+                    next_node = TreeNode(node_request_id[current_index])
                     cur_node.add_child(next_node)
                     cur_node = next_node
                     if solution.graph.node_request_id[current_index] == 0:
                         tree.tree_nodes[f"depot_{vehicle_index}"] = cur_node
                         tree.vehicle_depots.append(cur_node)
                     else:
-                        tree.tree_nodes[solution.graph.node_request_id[current_index]] = cur_node
+                        tree.tree_nodes[node_request_id[current_index]] = cur_node
                 else:
                     cur_node = cur_node.parent
         return tree
@@ -105,34 +110,15 @@ class Solution(object):
     @staticmethod
     def tree_to_tours(tree: Tree):
         tours = Solution(tree.graph)
-        
-        def dfs(node: TreeNode, tour: List[int]) -> None:
-            tour.append(tree.graph.requests[node.label].pick_up_id) 
-            for child in node.children:
-                dfs(child, tour)
-            tour.append(tree.graph.requests[node.label].delivery_id)
-                
-        for vehicle_index, depot in enumerate(tree.vehicle_depots):
-            tour = []
-            dfs(depot, tour)
-            vehicle = Vehicle(tree.graph)
-            vehicle.travel_path = tour
-            tours.vehicle_list[vehicle_index].travel_path = tour
+        # Lộ trình đã lưu trên cây chỉ được dựng lại cho các xe bị thay đổi; trả về bản sao
+        # vì lời giải có thể bị sửa tại chỗ
+        for vehicle_index in range(len(tree.vehicle_depots)):
+            tours.vehicle_list[vehicle_index].travel_path = tree.travel_path(vehicle_index).copy()
         
         return tours
     
     @staticmethod
     def subtree_to_travel_path(graph: Graph, node: TreeNode):
-        travel_path = []
-        def dfs(node: TreeNode, travel_path: List[int]) -> None:
-            travel_path.append(graph.requests[node.label].pick_up_id)
-            for child in node.children:
-                dfs(child, travel_path)
-            travel_path.append(graph.requests[node.label].delivery_id)
-        
-        travel_path = []
-        dfs(node, travel_path)
-        
-        return travel_path
+        return Tree.subtree_travel_path(graph, node)
     
     
\ No newline at end of file
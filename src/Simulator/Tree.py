@@ -1,14 +1,28 @@
+from bisect import bisect_left
 from typing import List, Dict, Optional
 from Simulator.TreeNode import TreeNode
 from Simulator.Graph import Graph
+from Simulator.SegmentSummary import SegmentSummary
 
 class Tree(object):
+    # Khoảng cách giữa nhãn Euler của hai nút liên tiếp khi đánh số, để cây con của một nút có thể
+    # được đánh số lại trong đoạn cũ của nó sau khi nhận thêm nút
+    EULER_SPACING = 1 << 20
+
     def __init__(self, graph: Graph):
         super()
         self.graph = graph
         self.root = TreeNode(-1)
         self.tree_nodes: Dict[int, TreeNode] = {-1: self.root} 
         self.vehicle_depots: List[TreeNode] = []
+        # Chỉ mục Euler (nhãn thứ tự duyệt trước có khoảng trống), dựng khi cần lần đầu; sau đó chỉ
+        # cây con của các nút đã mark_changed được đánh số lại
+        self._euler_built = False
+        self._euler_dirty: List[TreeNode] = []
+        # Lộ trình đã dựng của từng xe; xe bị thay đổi (dirty) được xóa khỏi đây và dựng lại khi cần
+        self._tours: Dict[int, List[int]] = {}
+        # Nhật ký các thay đổi cấu trúc (phép hoàn tác của từng thay đổi) để quay lại savepoint
+        self._journal: List[tuple] = []
 
     def is_valid(self) -> bool:
         if self.root.label != -1 or len(self.root.children) != self.graph.vehicle_num:
@@ -20,27 +34,470 @@ class Tree(object):
 
         request_labels = []
         for depot in self.vehicle_depots:
-            def collect_requests(node: TreeNode) -> None:
+            stack = [depot]
+            while stack:
+                node = stack.pop()
                 if node.label > 0:  # Chỉ lấy các nút yêu cầu
                     request_labels.append(node.label)
-                for child in node.children:
-                    collect_requests(child)
-            
-            collect_requests(depot)
+                stack.extend(node.children)
         
         if sorted(request_labels) != list(range(1, self.graph.num_request + 1)):
             return False
 
+        # Duyệt không đệ quy: mỗi nút chỉ được thăm một lần và có đúng nút cha
         visited = set()
-        def dfs(node: TreeNode, parent: Optional[TreeNode]) -> bool:
+        stack = [(self.root, None)]
+        while stack:
+            node, parent = stack.pop()
             if node in visited:
                 return False
             visited.add(node)
             if node.parent != parent:
                 return False
             for child in node.children:
-                if not dfs(child, node):
-                    return False
-            return True
+                stack.append((child, node))
         
-        return dfs(self.root, None) and len(visited) == len(self.tree_nodes)
\ No newline at end of file
+        return len(visited) == len(self.tree_nodes)
+
+    @staticmethod
+    def subtree_travel_path(graph: Graph, node: TreeNode) -> List[int]:
+        """Đoạn lộ trình pickup...delivery của cây con gốc node, duyệt không đệ quy."""
+        pick_up_id = graph.pick_up_id_list
+        delivery_id = graph.delivery_id_list
+        travel_path = [pick_up_id[node.label]]
+        # Mỗi phần tử: (nút, vị trí con tiếp theo cần thăm)
+        stack = [(node, 0)]
+        while stack:
+            current, index = stack[-1]
+            if index == len(current.children):
+                stack.pop()
+                travel_path.append(delivery_id[current.label])
+                continue
+            stack[-1] = (current, index + 1)
+            child = current.children[index]
+            travel_path.append(pick_up_id[child.label])
+            stack.append((child, 0))
+        return travel_path
+
+    def vehicle_index(self, node: TreeNode) -> int:
+        """Chỉ số xe có depot chứa node (node là depot thì trả về chính xe đó)."""
+        root = self.root
+        while node.parent is not root:
+            node = node.parent
+        return self.vehicle_depots.index(node)
+
+    def travel_path(self, vehicle_index) -> List[int]:
+        """
+        Lộ trình của xe vehicle_index. Được lưu lại và chỉ dựng lại khi cây con của depot bị thay đổi
+        (qua các phép biến đổi, rollback hoặc mark_changed). Không được sửa trực tiếp danh sách trả về.
+        """
+        travel_path = self._tours.get(vehicle_index)
+        if travel_path is None:
+            travel_path = Tree.subtree_travel_path(self.graph, self.vehicle_depots[vehicle_index])
+            self._tours[vehicle_index] = travel_path
+        return travel_path
+
+    def subtree_summary(self, node: TreeNode) -> SegmentSummary:
+        """
+        Tóm tắt đoạn lộ trình của cây con gốc node (nút yêu cầu). Được lưu lại trên node và chỉ
+        tính lại cho các nút đã bị mark_changed, các cây con khác được dùng lại.
+        """
+        if node.summary is None:
+            # Các nút cần tính lại, con được tính trước cha (duyệt trước theo thứ tự ngược)
+            pending = []
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                pending.append(current)
+                stack.extend(child for child in current.children if child.summary is None)
+            for current in reversed(pending):
+                current.summary = SegmentSummary.concatenate(
+                    self.graph, current.label, [child.summary for child in current.children])
+        return node.summary
+
+    def mark_changed(self, *nodes: TreeNode) -> None:
+        """
+        Ghi nhận các nút có danh sách con đã thay đổi: tính lại tóm tắt và tải lớn nhất của chúng
+        (cùng tổ tiên), tải khi đi vào của mọi nút trong cây con của chúng, chỉ mục Euler và
+        lộ trình đã lưu của các xe chứa chúng; cây con của chúng được đánh số lại trong chỉ mục
+        Euler ở lần truy vấn tiếp theo.
+        """
+        if self._euler_built:
+            self._euler_dirty.extend(nodes)
+        for node in nodes:
+            if node is not self.root:
+                self._tours.pop(self.vehicle_index(node), None)
+            # Một nút có path_load thì tổ tiên của nó cũng có, nên chỉ cần đi xuống khi còn giá trị
+            stack = list(node.children)
+            while stack:
+                current = stack.pop()
+                if current.path_load is not None:
+                    current.path_load = None
+                    stack.extend(current.children)
+            while node is not None and (node.summary is not None or node.peak_load is not None):
+                node.summary = None
+                node.peak_load = None
+                node = node.parent
+
+    def _drop_tour(self, node: Optional[TreeNode]) -> None:
+        """Bỏ lộ trình đã lưu của xe chứa node (bỏ qua gốc và các nút đang bị tách khỏi cây)."""
+        if not self._tours:
+            return
+        root = self.root
+        while node is not None and node.parent is not root:
+            node = node.parent
+        if node is not None:
+            self._tours.pop(self.vehicle_depots.index(node), None)
+
+    def node_demand(self, node: TreeNode):
+        """Demand của pickup của nút (0 cho depot và gốc)."""
+        if node.demand is None:
+            node.demand = self.graph.demand_list[self.graph.pick_up_id_list[node.label]] if node.label > 0 else 0
+        return node.demand
+
+    def path_load(self, node: TreeNode):
+        """Tải của xe khi đi vào cây con của node, tính một lần từ các tổ tiên rồi lưu lại."""
+        if node.path_load is None:
+            # Đi lên đến tổ tiên gần nhất đã có giá trị rồi tính xuống
+            chain = []
+            current = node
+            while current.path_load is None:
+                parent = current.parent
+                if parent is None or parent is self.root:
+                    current.path_load = 0
+                    break
+                chain.append(current)
+                current = parent
+            for current in reversed(chain):
+                current.path_load = current.parent.path_load + self.node_demand(current.parent)
+        return node.path_load
+
+    def child_entry_load(self, parent: TreeNode):
+        """Tải của xe khi đi vào một cây con được gắn làm con của parent."""
+        return self.path_load(parent) + self.node_demand(parent)
+
+    def subtree_peak_load(self, node: TreeNode, expand=()):
+        """
+        Tải lớn nhất trong cây con của node, tính từ tải khi đi vào cây con.
+
+        Args:
+            expand: Các nút có cây con đã thay đổi so với giá trị đã lưu (cùng tổ tiên của chúng),
+                được tính lại mà không dùng và không ghi đè giá trị lưu đệm
+        """
+        if node.peak_load is not None and node not in expand:
+            return node.peak_load
+        pending = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            pending.append(current)
+            stack.extend(child for child in current.children if child.peak_load is None or child in expand)
+        # Giá trị của các nút trong expand chỉ được giữ tạm ở đây
+        expanded_peaks = {}
+        for current in reversed(pending):
+            peak = 0
+            for child in current.children:
+                child_peak = expanded_peaks[child] if child in expanded_peaks else child.peak_load
+                if child_peak > peak:
+                    peak = child_peak
+            peak += self.node_demand(current)
+            if current in expand:
+                expanded_peaks[current] = peak
+            else:
+                current.peak_load = peak
+        return expanded_peaks[node] if node in expanded_peaks else node.peak_load
+
+    def peak_load_with_children(self, node: TreeNode, children, expand=()):
+        """Tải lớn nhất của cây con nếu node có danh sách con là children."""
+        peak = 0
+        for child in children:
+            child_peak = self.subtree_peak_load(child, expand)
+            if child_peak > peak:
+                peak = child_peak
+        return self.node_demand(node) + peak
+
+    def fits_capacity(self, parent: TreeNode, peak_load) -> bool:
+        """Một cây con có tải lớn nhất peak_load gắn dưới parent có thỏa mãn tải trọng xe không."""
+        return self.child_entry_load(parent) + peak_load <= self.graph.vehicle_capacity
+
+    @staticmethod
+    def _preorder(node: TreeNode) -> List[TreeNode]:
+        """Các nút trong cây con gốc node theo thứ tự duyệt trước (không đệ quy)."""
+        order = []
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            order.append(current)
+            stack.extend(reversed(current.children))
+        return order
+
+    def _label_subtree(self, node: TreeNode) -> None:
+        """
+        Đánh số các nút trong cây con của node cách đều nhau trong đoạn [euler_in, euler_out) hiện có
+        của node, nên các nút ngoài cây con giữ nguyên nhãn. Nếu đoạn không đủ chỗ thì đánh số lại từ
+        tổ tiên gần nhất đủ chỗ; gốc luôn được đánh số lại trên đoạn mới với khoảng cách EULER_SPACING.
+        """
+        order = Tree._preorder(node)
+        while node is not self.root and node.euler_out - node.euler_in < len(order):
+            node = node.parent
+            order = Tree._preorder(node)
+        if node is self.root:
+            low, high = 0, len(order) * Tree.EULER_SPACING
+        else:
+            low, high = node.euler_in, node.euler_out
+        step = (high - low) // len(order)
+        for position, current in enumerate(order):
+            current.euler_in = low + position * step
+        for current in reversed(order):
+            current.euler_out = current.children[-1].euler_out if current.children else current.euler_in + step
+        node.euler_out = high
+
+    def _refresh_euler_index(self) -> None:
+        """Dựng chỉ mục Euler lần đầu, hoặc đánh số lại cây con của các nút đã mark_changed."""
+        if not self._euler_built:
+            self._label_subtree(self.root)
+            self._euler_built = True
+            self._euler_dirty.clear()
+            return
+        dirty = set(self._euler_dirty)
+        self._euler_dirty.clear()
+        for node in dirty:
+            # Bỏ qua nút có tổ tiên cũng bị thay đổi (được đánh số cùng) và nút không còn nằm trong cây
+            current = node
+            while current.parent is not None and current.parent not in dirty:
+                current = current.parent
+            if current is self.root:
+                self._label_subtree(node)
+
+    def is_ancestor(self, ancestor: TreeNode, node: TreeNode) -> bool:
+        """
+        ancestor là node hoặc tổ tiên của node, O(1) nhờ chỉ mục Euler. Chỉ mục phản ánh cây tại lần
+        mark_changed gần nhất: các thay đổi đang thử (chưa mark_changed) không được tính đến.
+        """
+        if self._euler_dirty or not self._euler_built:
+            self._refresh_euler_index()
+        return ancestor.euler_in <= node.euler_in < ancestor.euler_out
+
+    def descendants(self, node: TreeNode) -> List[TreeNode]:
+        """Các nút con cháu của node (không gồm node) theo thứ tự duyệt trước, theo cây hiện tại."""
+        return Tree._preorder(node)[1:]
+
+    def path_to_root(self, *nodes: TreeNode) -> set:
+        """Tập các nút nằm trên đường từ các nút đã cho lên gốc (gồm cả chính chúng)."""
+        path = set()
+        for node in nodes:
+            while node is not None and node not in path:
+                path.add(node)
+                node = node.parent
+        return path
+
+    def savepoint(self) -> int:
+        """Đánh dấu trạng thái hiện tại của cây để rollback về sau."""
+        return len(self._journal)
+
+    def rollback(self, savepoint: int) -> None:
+        """
+        Hoàn tác các thay đổi ghi qua nhật ký kể từ savepoint, theo thứ tự ngược lại. Thời gian tỉ lệ
+        với số thay đổi. Chỉ dùng cho các thay đổi chưa mark_changed (phép biến đổi đang thử).
+        """
+        journal = self._journal
+        while len(journal) > savepoint:
+            entry = journal.pop()
+            op = entry[0]
+            if op == 'attach':
+                _, parent, index, node, old_parent = entry
+                del parent.children[index]
+                node.parent = old_parent
+                self._drop_tour(parent)
+                self._drop_tour(old_parent)
+            elif op == 'detach':
+                _, parent, index, node = entry
+                parent.children.insert(index, node)
+                node.parent = parent
+                self._drop_tour(parent)
+            elif op == 'swap':
+                _, node1, node2, parent1, index1, parent2, index2 = entry
+                parent1.children[index1] = node1
+                parent2.children[index2] = node2
+                node1.parent, node2.parent = parent1, parent2
+                self._drop_tour(parent1)
+                self._drop_tour(parent2)
+            elif op == 'swap_children':
+                self._swap_children(entry[1], entry[2])
+                self._drop_tour(entry[1])
+                self._drop_tour(entry[2])
+            else:
+                _, source, start, target, index, count = entry
+                moved = target.children[index:index + count]
+                del target.children[index:index + count]
+                source.children[start:start] = moved
+                for child in moved:
+                    child.parent = source
+                self._drop_tour(source)
+                self._drop_tour(target)
+
+    def release(self) -> None:
+        """Giữ lại các thay đổi đã ghi (phép biến đổi được chấp nhận) và xóa nhật ký."""
+        self._journal.clear()
+
+    def detach(self, node: TreeNode) -> int:
+        """Tách cây con gốc node khỏi cha, trả về vị trí cũ của node."""
+        parent = node.parent
+        index = parent.children.index(node)
+        del parent.children[index]
+        node.parent = None
+        self._journal.append(('detach', parent, index, node))
+        self._drop_tour(parent)
+        return index
+
+    def attach(self, parent: TreeNode, node: TreeNode, index: Optional[int] = None) -> None:
+        """Gắn cây con gốc node vào danh sách con của parent tại index (mặc định cuối)."""
+        children = parent.children
+        if index is None or index > len(children):
+            index = len(children)
+        children.insert(index, node)
+        self._journal.append(('attach', parent, index, node, node.parent))
+        self._drop_tour(node.parent)
+        node.parent = parent
+        self._drop_tour(parent)
+
+    def swap_subtrees(self, node1: TreeNode, node2: TreeNode) -> None:
+        """Hoán đổi vị trí của hai cây con không có quan hệ tổ tiên."""
+        parent1, parent2 = node1.parent, node2.parent
+        index1 = parent1.children.index(node1)
+        index2 = parent2.children.index(node2)
+        parent1.children[index1] = node2
+        parent2.children[index2] = node1
+        node1.parent, node2.parent = parent2, parent1
+        self._journal.append(('swap', node1, node2, parent1, index1, parent2, index2))
+        self._drop_tour(parent1)
+        self._drop_tour(parent2)
+
+    @staticmethod
+    def _swap_children(node1: TreeNode, node2: TreeNode) -> None:
+        node1.children, node2.children = node2.children, node1.children
+        for child in node1.children:
+            child.parent = node1
+        for child in node2.children:
+            child.parent = node2
+
+    def swap_children(self, node1: TreeNode, node2: TreeNode) -> None:
+        """Hoán đổi danh sách con của node1 và node2."""
+        Tree._swap_children(node1, node2)
+        self._journal.append(('swap_children', node1, node2))
+        self._drop_tour(node1)
+        self._drop_tour(node2)
+
+    def move_children(self, source: TreeNode, target: TreeNode, index: Optional[int] = None,
+                      start: int = 0, count: Optional[int] = None) -> None:
+        """
+        Chuyển các con source.children[start:start + count] (mặc định tất cả từ start) thành con của
+        target tại index (mặc định cuối), giữ nguyên thứ tự.
+        """
+        moved = source.children[start:] if count is None else source.children[start:start + count]
+        del source.children[start:start + len(moved)]
+        if index is None or index > len(target.children):
+            index = len(target.children)
+        target.children[index:index] = moved
+        for child in moved:
+            child.parent = target
+        self._journal.append(('move_children', source, start, target, index, len(moved)))
+        self._drop_tour(source)
+        self._drop_tour(target)
+
+    def restructure(self, depot: TreeNode, travel_path: List[int]) -> None:
+        """
+        Sắp xếp lại cây con của depot theo lộ trình travel_path gồm đúng các yêu cầu đang nằm dưới
+        depot (ví dụ lộ trình đã được tối ưu ở tiến trình khác). Các TreeNode được dùng lại nên mọi
+        tham chiếu đến chúng vẫn đúng. Không ghi vào nhật ký, chỉ gọi khi không có savepoint đang mở.
+        """
+        graph = self.graph
+        pid = graph.pid_list
+        node_request_id = graph.node_request_id
+        tree_nodes = self.tree_nodes
+        stack = [depot]
+        while stack:
+            current = stack.pop()
+            stack.extend(current.children)
+            current.children = []
+            current.summary = None
+            current.peak_load = None
+            current.path_load = None
+
+        current = depot
+        for node_id in travel_path[1:-1]:
+            if pid[node_id] == 0:
+                node = tree_nodes[node_request_id[node_id]]
+                current.add_child(node)
+                current = node
+            else:
+                current = current.parent
+        self.mark_changed(depot)
+
+    def route_cost(self, depot: TreeNode, expand=()) -> Optional[float]:
+        """
+        Chi phí lộ trình của depot, ghép từ tóm tắt của các cây con.
+
+        Args:
+            depot: Nút depot của xe
+            expand: Các nút có danh sách con đã thay đổi so với tóm tắt đã lưu (cùng tổ tiên của
+                chúng). Các nút này được duyệt qua từng con, các cây con khác dùng tóm tắt
+
+        Returns:
+            float: Chi phí lộ trình, None nếu vượt tải trọng
+        """
+        graph = self.graph
+        dist = graph.dist_rows
+        travel_time = graph.travel_time_rows
+        demand = graph.demand_list
+        ready_time = graph.ready_time_list
+        due_time = graph.due_time_list
+        service_time = graph.service_time_list
+        pick_up_id = graph.pick_up_id_list
+        delivery_id = graph.delivery_id_list
+        load_energy_coef = graph.load_energy_coef
+        energy_coef1 = graph.energy_coef1
+        vehicle_capacity = graph.vehicle_capacity
+
+        # Trạng thái khi đi dọc lộ trình: nút trước, thời điểm rời, tải, năng lượng, thời gian trễ
+        state = [depot.label, 0, 0, 0, 0]
+
+        def visit_node(next_ind):
+            prev_ind, current_time, vehicle_load, energy, lateness = state
+            energy += load_energy_coef[vehicle_load] * dist[prev_ind][next_ind]
+            arrival_time = current_time + travel_time[prev_ind][next_ind]
+            if arrival_time > due_time[next_ind]:
+                lateness += arrival_time - due_time[next_ind]
+            current_time = max(arrival_time, ready_time[next_ind]) + service_time[next_ind]
+            state[:] = next_ind, current_time, vehicle_load + demand[next_ind], energy, lateness
+            return state[2] <= vehicle_capacity
+
+        # Duyệt không đệ quy; mỗi phần tử: (nút được duyệt qua từng con, vị trí con tiếp theo)
+        stack = [(depot, 0)]
+        while stack:
+            node, index = stack[-1]
+            if index == len(node.children):
+                stack.pop()
+                if not visit_node(delivery_id[node.label]):
+                    return None
+                continue
+            stack[-1] = (node, index + 1)
+            child = node.children[index]
+            if child in expand:
+                if not visit_node(pick_up_id[child.label]):
+                    return None
+                stack.append((child, 0))
+                continue
+
+            summary = self.subtree_summary(child)
+            prev_ind, current_time, vehicle_load, energy, lateness = state
+            if vehicle_load + summary.peak_load > vehicle_capacity:
+                return None
+            coef = load_energy_coef[vehicle_load]
+            energy += coef * (dist[prev_ind][summary.first] + summary.dist) + energy_coef1 * summary.load_dist
+            arrival_time = current_time + travel_time[prev_ind][summary.first]
+            k = bisect_left(summary.breakpoints, arrival_time)
+            lateness += summary.lateness_base + k * arrival_time - summary.breakpoint_sums[k]
+            state[:] = summary.last, summary.depart_time(arrival_time), vehicle_load, energy, lateness
+
+        return graph.p1 * state[3] + graph.p2 * state[4]
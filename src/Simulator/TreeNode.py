@@ -6,6 +6,14 @@ class TreeNode:
         self.label = label  # -1 cho nút gốc rỗng, 0 cho depot, 1, 2, ... cho yêu cầu
         self.children: List[TreeNode] = []  # Danh sách các nút con (có thứ tự)
         self.parent: Optional[TreeNode] = None  # Nút cha
+        self.summary = None  # Tóm tắt đoạn lộ trình của cây con, do Tree.subtree_summary quản lý
+        # Các giá trị tải được lưu đệm, do Tree quản lý (None khi chưa tính hoặc đã lỗi thời)
+        self.demand = None  # Demand của pickup của nút
+        self.peak_load = None  # Tải lớn nhất trong cây con, tính từ tải khi đi vào cây con
+        self.path_load = None  # Tải của xe khi đi vào cây con (tổng demand các tổ tiên)
+        # Cây con là đoạn [euler_in, euler_out) của các nhãn thứ tự duyệt trước, do Tree quản lý
+        self.euler_in = -1
+        self.euler_out = -1
 
     def add_child(self, child: 'TreeNode') -> None:
         child.parent = self
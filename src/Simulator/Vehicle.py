@@ -14,12 +14,14 @@ class Vehicle(object):
     def cal_total_engine_energy_consumption(graph: Graph, travel_path):
         engine_energy_consumption = 0
         vehicle_load = 0
+        dist = graph.dist_rows
+        demand = graph.demand_list
+        # Hệ số năng lượng G theo tải được tra từ bảng tính sẵn của graph
+        load_energy_coef = graph.load_energy_coef
         current_ind = travel_path[0]
         for next_ind in travel_path[1:]:
-            T = 1/2 * graph.cd * graph.p * graph.A * graph.v ** 3 + (graph.mk + vehicle_load) * graph.g * graph.cr * graph.v
-            G = graph.xi / (graph.kappa * graph.psi) * (graph.pi * graph.R + T / graph.eta)
-            engine_energy_consumption += G * graph.dist[current_ind][next_ind]
-            vehicle_load += graph.nodes[next_ind].demand
+            engine_energy_consumption += load_energy_coef[vehicle_load] * dist[current_ind][next_ind]
+            vehicle_load += demand[next_ind]
             current_ind = next_ind
         return graph.p1 * engine_energy_consumption
     
@@ -44,26 +46,30 @@ class Vehicle(object):
             return 0
         
         current_ind = travel_path[0]
+        travel_time_rows = graph.travel_time_rows
+        ready_time = graph.ready_time_list
+        due_time = graph.due_time_list
+        service_time = graph.service_time_list
         
         for next_ind in travel_path[1:]:
             # Thời gian di chuyển đến nút tiếp theo
-            travel_time = graph.dist[current_ind][next_ind] / graph.v * 60
+            travel_time = travel_time_rows[current_ind][next_ind]
             
             # Thời điểm đến nút tiếp theo
             arrival_time = current_time + travel_time
             
             # Kiểm tra quá hạn dựa trên thời điểm đến, TRƯỚC khi tính service time
             # So sánh thời điểm đến với due_time để xác định mức độ quá hạn
-            if arrival_time > graph.nodes[next_ind].due_time:
-                lateness = arrival_time - graph.nodes[next_ind].due_time
+            if arrival_time > due_time[next_ind]:
+                lateness = arrival_time - due_time[next_ind]
                 penalty += lateness
             
             # Thời gian chờ (nếu đến sớm hơn ready_time)
-            wait_time = max(0, graph.nodes[next_ind].ready_time - arrival_time)
+            wait_time = max(0, ready_time[next_ind] - arrival_time)
             
             # Cập nhật thời gian hiện tại: arrival_time + wait_time + service_time
             # Service time chỉ được thêm vào sau khi đã kiểm tra quá hạn và tính thời gian chờ
-            current_time = arrival_time + wait_time + graph.nodes[next_ind].service_time
+            current_time = arrival_time + wait_time + service_time[next_ind]
             
             current_ind = next_ind
         
@@ -0,0 +1,156 @@
+from Simulator.Tree import Tree
+from Simulator.TreeNode import TreeNode
+from Simulator.Solution import Solution
+from Simulator.Vehicle import Vehicle
+from Simulator.CostCalculationEvent import CostCalculator
+
+
+class VehicleCostTable(object):
+    """
+    Bảng lộ trình và chi phí của từng xe cho một cây, dùng để đánh giá delta các phép biến đổi cây.
+
+    Một phép biến đổi chỉ làm thay đổi lộ trình của các xe có depot chứa các nút bị di chuyển.
+    evaluate chỉ dựng lại và tính chi phí cho các xe đó, các xe khác dùng lại chi phí đã lưu.
+    Tổng chi phí được cộng theo đúng thứ tự xe như Solution._original_cal_cost_of_all_vehicle
+    nên bằng đúng giá trị của CostCalculator.calculate trên toàn bộ lời giải. Mỗi lần evaluate
+    khả thi được ghi nhận qua CostCalculator.report để các listener vẫn đếm số lần đánh giá.
+    """
+    # Sai số tương đối tối đa coi là có thể của Tree.route_cost (lớn hơn nhiều lần sai số làm tròn thực tế)
+    EXACT_MARGIN = 1e-9
+
+    def __init__(self, tree: Tree, vehicle_list=None):
+        self.tree = tree
+        self.graph = tree.graph
+        if vehicle_list is None:
+            # Cây có thể chỉ gồm một phần các xe (bài toán con của một depot)
+            vehicle_list = Solution.tree_to_tours(tree).vehicle_list[:len(tree.vehicle_depots)]
+        route_cost_cache = self.graph.route_cost_cache
+        self.travel_paths = [vehicle.travel_path for vehicle in vehicle_list]
+        self.costs = route_cost_cache.costs(self.travel_paths)
+        self._pending = None
+
+    def vehicle_of(self, node: TreeNode) -> int:
+        """Chỉ số xe có depot chứa node (node là depot thì trả về chính xe đó)."""
+        return self.tree.vehicle_index(node)
+
+    def total_cost(self, new_costs=None):
+        cost = 0
+        for idx, vehicle_cost in enumerate(self.costs):
+            if new_costs is not None and idx in new_costs:
+                vehicle_cost = new_costs[idx]
+            cost += vehicle_cost
+        return cost
+
+    def evaluate(self, vehicle_indices, check_feasible=True):
+        """
+        Đánh giá cây hiện tại sau một phép biến đổi chỉ ảnh hưởng đến các xe vehicle_indices.
+        check_feasible = False khi tải trọng đã được kiểm tra trước bằng các giá trị tải lưu
+        trên cây (thứ tự LIFO luôn được cây đảm bảo).
+
+        Returns:
+            float hoặc None: Tổng chi phí của lời giải, None nếu một lộ trình bị ảnh hưởng không
+            khả thi (khi đó không tính là một lần đánh giá)
+        """
+        graph = self.graph
+        route_cost_cache = graph.route_cost_cache
+        vehicle_depots = self.tree.vehicle_depots
+        new_paths = {}
+        new_costs = {}
+        for idx in vehicle_indices:
+            if idx in new_paths:
+                continue
+            travel_path = Solution.subtree_to_travel_path(graph, vehicle_depots[idx])
+            if check_feasible and not Solution.is_travel_path_feasible(graph, travel_path):
+                self._pending = None
+                return None
+            new_paths[idx] = travel_path
+            new_costs[idx] = route_cost_cache.cost(travel_path)
+
+        cost = self.total_cost(new_costs)
+        self._pending = (new_paths, new_costs)
+        return CostCalculator.report(graph, lambda: self.vehicle_list(new_paths), cost)
+
+    def evaluate_tree(self, vehicle_indices, expand):
+        """
+        Như evaluate nhưng tính chi phí các xe bị ảnh hưởng bằng cách ghép tóm tắt cây con
+        (Tree.route_cost), không dựng lại lộ trình. Danh sách xe của event chỉ được dựng khi
+        listener cần đến. Route_cost có thể lệch vài ulp so với chi phí chính xác, nên khi tổng
+        không lớn hơn chi phí hiện tại quá EXACT_MARGIN (tương đối) thì các xe bị ảnh hưởng được
+        dựng lại lộ trình và tính chính xác; chỉ các kết quả chắc chắn không cải thiện giữ giá trị xấp xỉ.
+
+        Args:
+            vehicle_indices: Các xe bị ảnh hưởng
+            expand: Các nút có danh sách con đã thay đổi cùng tổ tiên của chúng (Tree.path_to_root)
+        """
+        tree = self.tree
+        vehicle_depots = tree.vehicle_depots
+        new_costs = {}
+        for idx in vehicle_indices:
+            if idx in new_costs:
+                continue
+            route_cost = tree.route_cost(vehicle_depots[idx], expand)
+            if route_cost is None:
+                self._pending = None
+                return None
+            new_costs[idx] = route_cost
+
+        cost = self.total_cost(new_costs)
+        current_cost = self.total_cost()
+        if cost < current_cost + VehicleCostTable.EXACT_MARGIN * abs(current_cost):
+            # Có thể là một cải thiện: tính lại chính xác như Vehicle.cal_total_all_cost để phép so sánh
+            # chặt với chi phí hiện tại, chi phí được lưu khi commit và chi phí báo cho listener không
+            # phụ thuộc sai số làm tròn của cách ghép tóm tắt
+            new_paths = self._current_paths(new_costs)
+            route_cost_cache = self.graph.route_cost_cache
+            new_costs = {idx: route_cost_cache.cost(travel_path) for idx, travel_path in new_paths.items()}
+            cost = self.total_cost(new_costs)
+            self._pending = (new_paths, new_costs)
+            return CostCalculator.report(self.graph, self.vehicle_list(new_paths), cost)
+
+        self._pending = (None, new_costs)
+        return CostCalculator.report(self.graph, lambda: self.vehicle_list(self._current_paths(new_costs)), cost)
+
+    def evaluate_current(self):
+        """Ghi nhận một lần đánh giá lời giải hiện tại (không tính lại lộ trình nào)."""
+        return CostCalculator.report(self.graph, self.vehicle_list(), self.total_cost())
+
+    def _current_paths(self, vehicle_indices, cached=False):
+        # cached = True chỉ sau khi tree.mark_changed đã được gọi cho các thay đổi hiện tại
+        tree = self.tree
+        if cached:
+            return {idx: tree.travel_path(idx) for idx in vehicle_indices}
+        return {idx: Tree.subtree_travel_path(self.graph, tree.vehicle_depots[idx]) for idx in vehicle_indices}
+
+    def commit(self, *changed_nodes: TreeNode):
+        """
+        Lưu lại các lộ trình và chi phí của lần evaluate gần nhất (phép biến đổi được chấp nhận).
+        changed_nodes là các nút có danh sách con đã thay đổi, tóm tắt cây con của chúng được tính lại.
+        """
+        self.tree.mark_changed(*changed_nodes)
+        if self._pending is None:
+            return
+        new_paths, new_costs = self._pending
+        if new_paths is None:
+            new_paths = self._current_paths(new_costs, cached=True)
+        for idx, travel_path in new_paths.items():
+            self.travel_paths[idx] = travel_path
+            self.costs[idx] = new_costs[idx]
+        self._pending = None
+
+    def refresh(self, vehicle_indices, *changed_nodes: TreeNode):
+        """Dựng lại lộ trình và chi phí của các xe sau khi cây bị thay đổi trực tiếp."""
+        self.tree.mark_changed(*changed_nodes)
+        route_cost_cache = self.graph.route_cost_cache
+        for idx, travel_path in self._current_paths(vehicle_indices, cached=True).items():
+            self.travel_paths[idx] = travel_path
+            self.costs[idx] = route_cost_cache.cost(travel_path)
+        self._pending = None
+
+    def vehicle_list(self, new_paths=None):
+        """Danh sách Vehicle của lời giải (các lộ trình không bị sao chép, không được sửa tại chỗ)."""
+        vehicle_list = []
+        for idx, travel_path in enumerate(self.travel_paths):
+            vehicle = Vehicle(self.graph)
+            vehicle.travel_path = new_paths.get(idx, travel_path) if new_paths else travel_path
+            vehicle_list.append(vehicle)
+        return vehicle_list